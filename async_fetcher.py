@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+async_fetcher.py
+طبقة جلب بيانات غير متزامنة مبنية على asyncio بحلقة أحداث خاصة في خيط مستقل
+تشغل عمليات الجلب (الدول، المدن، الإحداثيات، المواقيت) بالتوازي مع حد أقصى للطلبات
+المتزامنة لكل مضيف، وتدعم الإلغاء، وتعيد النتائج إلى Tk عبر طابور توزيع واحد
+"""
+
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import tkinter as tk
+
+logger = logging.getLogger(__name__)
+
+class _Job:
+    """عملية جلب واحدة؛ تُستخدم لتجاهل نتائجها إذا أُلغيت أثناء التنفيذ"""
+    __slots__ = ('name', 'key', 'cancelled')
+
+    def __init__(self, name: str, key=None):
+        self.name = name
+        self.key = key
+        self.cancelled = False
+
+# العملية الحالية في خيط التنفيذ (تنتقل تلقائيًا عبر asyncio.to_thread)
+_current_job: contextvars.ContextVar[Optional[_Job]] = contextvars.ContextVar('_current_job', default=None)
+
+class AsyncFetcher:
+    """مدير عمليات الجلب غير المتزامنة للواجهة"""
+
+    # الحد الأقصى للطلبات المتزامنة لكل مضيف (Nominatim يسمح بطلب واحد فقط في الثانية)
+    HOST_LIMITS = {
+        'nominatim.openstreetmap.org': 1,
+        'api.aladhan.com': 2,
+    }
+    DEFAULT_HOST_LIMIT = 4
+
+    # عدد خيوط التنفيذ للعمليات المعتمدة على مكتبات متزامنة (requests و sqlite3)
+    MAX_WORKERS = 8
+
+    DISPATCH_EVENT = '<<FetchDispatch>>'
+
+    def __init__(self, root: tk.Misc):
+        self.root = root
+        self._dispatch_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._tagged: Dict[str, tuple[Future, _Job]] = {}
+        self._tagged_lock = threading.Lock()
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='fetch')
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(target=self._run_loop, name='async-fetcher', daemon=True)
+        self._thread.start()
+        self.root.bind(self.DISPATCH_EVENT, self._drain_dispatch_queue)
+        # النتائج التي تصل قبل بدء الحلقة الرئيسية لـ Tk تُنفذ عند بدئها
+        self.root.after_idle(self._drain_dispatch_queue)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        # يُستدعى من خيط حلقة الأحداث فقط
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.HOST_LIMITS.get(host, self.DEFAULT_HOST_LIMIT))
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _run_job(self, job: _Job, host: str, func: Callable, args: tuple, kwargs: dict,
+                       on_success: Optional[Callable], on_error: Optional[Callable]):
+        try:
+            async with self._host_semaphore(host):
+                _current_job.set(job)
+                result = await asyncio.to_thread(func, *args, **kwargs)
+        except asyncio.CancelledError:
+            job.cancelled = True
+            logger.debug(f"تم إلغاء عملية الجلب {job.name}")
+            raise
+        except Exception as e:
+            logger.error(f"خطأ في عملية الجلب {job.name}: {e}")
+            if on_error:
+                self._enqueue(job, on_error, (e,))
+            return None
+        if on_success:
+            self._enqueue(job, on_success, (result,))
+        return result
+
+    def submit(self, host: str, func: Callable, *args, on_success: Optional[Callable] = None,
+               on_error: Optional[Callable] = None, tag: Optional[str] = None, key=None, **kwargs) -> Future:
+        """
+        جدولة دالة جلب متزامنة على خيط تنفيذ مع احترام حد المضيف
+        :param host: اسم المضيف الذي تتصل به الدالة (لتحديد عدد الطلبات المتزامنة)
+        :param on_success: دالة تُستدعى في خيط Tk بالنتيجة
+        :param on_error: دالة تُستدعى في خيط Tk بالاستثناء
+        :param tag: وسم اختياري؛ إرسال عملية جديدة بنفس الوسم يلغي السابقة
+        :param key: هوية الطلب مع الوسم؛ إذا كانت العملية الجارية بنفس الوسم لها المفتاح نفسه
+                    تُلغى العملية الجديدة المكررة ويعاد Future العملية الجارية بدلاً منها
+        :return: Future يمكن انتظاره أو إلغاؤه
+        """
+        job = _Job(tag or getattr(func, '__name__', 'fetch'), key)
+        if not tag:
+            return asyncio.run_coroutine_threadsafe(
+                self._run_job(job, host, func, args, kwargs, on_success, on_error), self._loop
+            )
+        with self._tagged_lock:
+            previous = self._tagged.get(tag)
+            if previous and key is not None and previous[1].key == key and not previous[0].done():
+                logger.debug(f"تم تجاهل طلب مكرر لعملية جارية {tag}: {key}")
+                return previous[0]
+            future = asyncio.run_coroutine_threadsafe(
+                self._run_job(job, host, func, args, kwargs, on_success, on_error), self._loop
+            )
+            self._tagged[tag] = (future, job)
+        if previous:
+            self._cancel(*previous)
+        return future
+
+    @staticmethod
+    def _cancel(future: Future, job: _Job):
+        # الدالة التي بدأت في خيط التنفيذ تكمل عملها لكن نتائجها وما ترسله للواجهة يتم تجاهله
+        job.cancelled = True
+        future.cancel()
+
+    def cancel(self, tag: str):
+        """إلغاء العملية الجارية بالوسم المحدد"""
+        with self._tagged_lock:
+            entry = self._tagged.pop(tag, None)
+        if entry:
+            self._cancel(*entry)
+
+    def dispatch(self, func: Callable, *args):
+        """
+        تنفيذ دالة في خيط Tk؛ يمكن استدعاؤها من أي خيط
+        إذا استُدعيت من داخل عملية جلب أُلغيت لاحقًا يتم تجاهلها
+        """
+        self._enqueue(_current_job.get(), func, args)
+
+    def _enqueue(self, job: Optional[_Job], func: Callable, args: tuple):
+        self._dispatch_queue.put((job, func, args))
+        try:
+            self.root.event_generate(self.DISPATCH_EVENT, when='tail')
+        except (tk.TclError, RuntimeError) as e:
+            # النافذة أُغلقت أو الحلقة الرئيسية لم تعد تعمل
+            logger.debug(f"تعذر إرسال حدث التوزيع إلى الواجهة: {e}")
+
+    def _drain_dispatch_queue(self, event=None):
+        """تنفيذ جميع الاستدعاءات المنتظرة في خيط Tk"""
+        while True:
+            try:
+                job, func, args = self._dispatch_queue.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None and job.cancelled:
+                continue
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"خطأ في معالجة نتيجة الجلب: {e}")
+
+    def shutdown(self):
+        """إلغاء جميع العمليات وإيقاف حلقة الأحداث"""
+        with self._tagged_lock:
+            entries = list(self._tagged.values())
+            self._tagged.clear()
+        for entry in entries:
+            self._cancel(*entry)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=1.0)
+        self._executor.shutdown(wait=False, cancel_futures=True)
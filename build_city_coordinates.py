@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+build_city_coordinates.py
+أداة لتجهيز البيانات: إضافة الإحداثيات والمنطقة الزمنية لكل مدينة في ملفات Countries&Cities
+اعتمادًا على ملفات GeoNames المفتوحة، ثم إنشاء فهرس مضغوط للبحث المحلي السريع
+
+أمثلة:
+    python build_city_coordinates.py                      # تنزيل ملفات GeoNames ثم التحديث وبناء الفهرس
+    python build_city_coordinates.py --geonames-dir dumps # استخدام ملفات منزلة مسبقًا
+    python build_city_coordinates.py --index-only         # إعادة بناء الفهرس من الملفات الحالية فقط
+    python build_city_coordinates.py --source geonamescache  # نسخة GeoNames المضمنة في حزمة geonamescache (بدون تنزيل)
+"""
+
+import argparse
+import io
+import json
+import logging
+import re
+import sys
+import unicodedata
+import zipfile
+from pathlib import Path
+
+import requests
+
+import http_client
+from config import WORLD_CITIES_DIR, CITY_COORDINATES_INDEX_FILE
+
+logger = logging.getLogger(__name__)
+
+# حزمة geonamescache (اختيارية) تتضمن تصدير GeoNames للمدن نفسه بصيغة JSON،
+# وتُستخدم عندما يتعذر الوصول إلى خادم تنزيل GeoNames
+try:
+    import geonamescache
+    GEONAMESCACHE_AVAILABLE = True
+except ImportError:
+    GEONAMESCACHE_AVAILABLE = False
+
+GEONAMES_URL = "https://download.geonames.org/export/dump/"
+GEONAMES_CITIES_FILE = "cities1000.txt"
+GEONAMES_COUNTRY_INFO_FILE = "countryInfo.txt"
+
+# أسماء الدول في قاعدة البيانات التي تختلف عن أسمائها في GeoNames
+COUNTRY_ALIASES = {
+    'dr congo': 'democratic republic of the congo',
+    'caribbean netherlands': 'bonaire, saint eustatius and saba',
+    'cape verde': 'cabo verde',
+    'cocos (keeling) islands': 'cocos islands',
+    'french southern and antarctic lands': 'french southern territories',
+    'macau': 'macao',
+    'palestine': 'palestinian territory',
+    'pitcairn islands': 'pitcairn',
+    'saint helena, ascension and tristan da cunha': 'saint helena',
+    'south georgia': 'south georgia and the south sandwich islands',
+    'timor-leste': 'timor leste',
+    'united states virgin islands': 'u.s. virgin islands',
+    'vatican city': 'vatican',
+    'turkey': 'turkiye',
+}
+
+# أقل عدد سكان للمدن المحملة من geonamescache (500 هي أشمل مجموعة في الحزمة)
+GEONAMESCACHE_MIN_POPULATION = 500
+
+# عدد الخانات العشرية المخزنة للإحداثيات (حوالي 11 مترًا، أكثر من كافٍ لمواقيت الصلاة والقبلة)
+COORDINATE_DECIMALS = 4
+
+def normalize_name(name: str) -> str:
+    """توحيد الاسم للمقارنة: إزالة علامات التشكيل اللاتينية والمسافات الزائدة وتحويله لأحرف صغيرة"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+def ensure_geonames_files(geonames_dir: Path):
+    """تنزيل ملفات GeoNames المطلوبة إذا لم تكن موجودة"""
+    geonames_dir.mkdir(parents=True, exist_ok=True)
+    country_info = geonames_dir / GEONAMES_COUNTRY_INFO_FILE
+    if not country_info.exists():
+        logger.info(f"تنزيل {GEONAMES_COUNTRY_INFO_FILE}")
+        response = http_client.get(GEONAMES_URL + GEONAMES_COUNTRY_INFO_FILE, timeout=60)
+        response.raise_for_status()
+        country_info.write_bytes(response.content)
+    cities = geonames_dir / GEONAMES_CITIES_FILE
+    if not cities.exists():
+        archive_name = GEONAMES_CITIES_FILE.replace('.txt', '.zip')
+        logger.info(f"تنزيل {archive_name}")
+        response = http_client.get(GEONAMES_URL + archive_name, timeout=300)
+        response.raise_for_status()
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            archive.extract(GEONAMES_CITIES_FILE, geonames_dir)
+
+def load_country_codes(geonames_dir: Path) -> dict[str, str]:
+    """ربط اسم الدولة الموحد برمز ISO من ملف countryInfo.txt"""
+    codes = {}
+    with open(geonames_dir / GEONAMES_COUNTRY_INFO_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) > 4:
+                codes[normalize_name(fields[4])] = fields[0]
+    return codes
+
+def load_geonames_places(geonames_dir: Path) -> dict[str, dict[str, tuple]]:
+    """
+    تحميل أماكن GeoNames مجمعة حسب رمز الدولة ثم الاسم الموحد
+    عند تكرار الاسم داخل الدولة يتم الاحتفاظ بالمكان الأكبر من حيث عدد السكان
+    :return: {رمز الدولة: {الاسم: (عدد السكان، خط العرض، خط الطول، المنطقة الزمنية)}}
+    """
+    places: dict[str, dict[str, tuple]] = {}
+    with open(geonames_dir / GEONAMES_CITIES_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 18:
+                continue
+            population = int(fields[14] or 0)
+            _add_place(places, fields[8], [fields[1], fields[2], *fields[3].split(',')],
+                       (population, float(fields[4]), float(fields[5]), fields[17]))
+    return places
+
+def _add_place(places: dict, country_code: str, names: list, record: tuple):
+    by_name = places.setdefault(country_code, {})
+    population = record[0]
+    for key in {normalize_name(name) for name in names if name}:
+        # الاسم نفسه قد يطلق على عدة أماكن، والأكبر هو المقصود غالبًا
+        if key not in by_name or by_name[key][0] < population:
+            by_name[key] = record
+
+def load_geonamescache_data() -> tuple[dict[str, str], dict[str, dict[str, tuple]]]:
+    """رموز الدول والأماكن من حزمة geonamescache بنفس بنية load_country_codes و load_geonames_places"""
+    cache = geonamescache.GeonamesCache(min_city_population=GEONAMESCACHE_MIN_POPULATION)
+    codes = {}
+    for iso, country in cache.get_countries().items():
+        name = normalize_name(country['name'])
+        # بعض الأسماء في الحزمة مسبوقة بأداة التعريف ("The Netherlands") بخلاف countryInfo.txt
+        codes[name[4:] if name.startswith('the ') else name] = iso
+    places: dict[str, dict[str, tuple]] = {}
+    for city in cache.get_cities().values():
+        _add_place(places, city['countrycode'], [city['name'], *city.get('alternatenames', [])],
+                   (int(city.get('population') or 0), float(city['latitude']), float(city['longitude']),
+                    city.get('timezone', '')))
+    return codes, places
+
+def enrich_country_file(country_file: Path, country_places: dict[str, tuple], overwrite: bool) -> tuple[int, int]:
+    """
+    إضافة latitude و longitude و timezone لمدن ملف دولة واحدة
+    :return: (عدد المدن التي تمت مطابقتها، عدد المدن الكلي)
+    """
+    with open(country_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+    cities = json.loads(text)
+    matched = changed = 0
+    for city in cities:
+        if not overwrite and city.get('latitude') is not None:
+            matched += 1
+            continue
+        place = country_places.get(normalize_name(city.get('english_name', '')))
+        if not place:
+            continue
+        _, lat, lon, timezone_name = place
+        city['latitude'] = round(lat, COORDINATE_DECIMALS)
+        city['longitude'] = round(lon, COORDINATE_DECIMALS)
+        city['timezone'] = timezone_name
+        matched += 1
+        changed += 1
+    if changed:
+        # الحفاظ على مسافة الإزاحة ونهاية الملف الأصلية حتى يقتصر الفرق على الحقول المضافة
+        indent_match = re.search(r'\n( +)\S', text)
+        with open(country_file, 'w', encoding='utf-8', newline='\n') as f:
+            json.dump(cities, f, ensure_ascii=False, indent=len(indent_match.group(1)) if indent_match else 4)
+            if text.endswith('\n'):
+                f.write('\n')
+    return matched, len(cities)
+
+def enrich_dataset(country_codes: dict[str, str], places: dict[str, dict[str, tuple]], overwrite: bool = False):
+    """تحديث جميع ملفات الدول في قاعدة البيانات بالإحداثيات"""
+    total_matched = total_cities = 0
+    for country_file in sorted(WORLD_CITIES_DIR.glob("*.json")):
+        country = normalize_name(country_file.stem)
+        code = country_codes.get(COUNTRY_ALIASES.get(country, country)) or country_codes.get(country)
+        if not code:
+            logger.warning(f"لم يتم العثور على رمز الدولة {country_file.stem} في GeoNames")
+            continue
+        matched, count = enrich_country_file(country_file, places.get(code, {}), overwrite)
+        total_matched += matched
+        total_cities += count
+        if matched < count:
+            logger.info(f"{country_file.stem}: {matched}/{count} مدينة بإحداثيات")
+    logger.info(f"تمت مطابقة {total_matched} من {total_cities} مدينة")
+
+def build_index(output_file: Path = CITY_COORDINATES_INDEX_FILE) -> int:
+    """
+    بناء الفهرس المضغوط: سطر لكل مدينة بالشكل
+    country<TAB>city<TAB>latitude<TAB>longitude<TAB>timezone (الأسماء بأحرف صغيرة)
+    :return: عدد المدن في الفهرس
+    """
+    rows = []
+    for country_file in sorted(WORLD_CITIES_DIR.glob("*.json")):
+        with open(country_file, 'r', encoding='utf-8') as f:
+            cities = json.load(f)
+        for city in cities:
+            if city.get('latitude') is None or city.get('longitude') is None:
+                continue
+            rows.append('\t'.join((
+                country_file.stem.lower(),
+                city['english_name'].lower(),
+                f"{city['latitude']:.{COORDINATE_DECIMALS}f}",
+                f"{city['longitude']:.{COORDINATE_DECIMALS}f}",
+                city.get('timezone', ''),
+            )))
+    tmp_file = output_file.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(rows) + '\n' if rows else '')
+    tmp_file.replace(output_file)
+    logger.info(f"تم بناء فهرس الإحداثيات ({len(rows)} مدينة) في {output_file}")
+    return len(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="إضافة الإحداثيات لقاعدة بيانات المدن وبناء فهرس البحث المحلي")
+    parser.add_argument('--geonames-dir', type=Path, default=Path('geonames'), help="مجلد ملفات GeoNames")
+    parser.add_argument('--source', choices=('geonames', 'geonamescache'), default='geonames',
+                        help="مصدر بيانات GeoNames: التنزيل من الخادم أو حزمة geonamescache المثبتة")
+    parser.add_argument('--overwrite', action='store_true', help="استبدال الإحداثيات الموجودة مسبقًا")
+    parser.add_argument('--index-only', action='store_true', help="بناء الفهرس فقط بدون تحديث ملفات الدول")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    if not args.index_only:
+        if args.source == 'geonamescache':
+            if not GEONAMESCACHE_AVAILABLE:
+                logger.error("حزمة geonamescache غير مثبتة (pip install geonamescache)")
+                return 1
+            country_codes, places = load_geonamescache_data()
+        else:
+            try:
+                ensure_geonames_files(args.geonames_dir)
+            except (requests.exceptions.RequestException, zipfile.BadZipFile) as e:
+                logger.error(f"تعذر تنزيل ملفات GeoNames: {e}")
+                return 1
+            country_codes = load_country_codes(args.geonames_dir)
+            places = load_geonames_places(args.geonames_dir)
+        enrich_dataset(country_codes, places, args.overwrite)
+    build_index()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+bulk_timetables.py
+أداة سطر أوامر لحساب مواقيت الصلاة لجميع مدن قاعدة البيانات (أو جزء منها) محليًا
+بدون أي طلبات شبكة، لإنتاج ملف يومي لجميع المدن أو جداول لفترات طويلة
+
+أمثلة:
+    python bulk_timetables.py --date 2025-03-01 --output feed.json
+    python bulk_timetables.py --country Egypt --country Jordan --start 2025-01-01 --end 2026-12-31 --output range.csv
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from data_manager import load_world_cities, geocode_missing_cities
+from prayer_logic import PrayerTimesCalculator, NUMPY_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# عدد الأيام في كل دفعة ترسل إلى عملية منفصلة في وضع الفترات الطويلة
+DAYS_PER_CHUNK = 31
+
+def city_tz_offsets(cities: list[dict], day: date) -> list[float]:
+    """فرق التوقيت لكل مدينة في يوم محدد (توقيت اسمي من خط الطول إذا لم تعرف المنطقة الزمنية)"""
+    offsets = []
+    for city in cities:
+        if city['timezone']:
+            offsets.append(PrayerTimesCalculator.local_utc_offset(day, city['timezone']))
+        else:
+            offsets.append(float(round(city['longitude'] / 15)))
+    return offsets
+
+def compute_day(cities: list[dict], day: date, method: int) -> list[list[int]]:
+    """حساب يوم واحد لجميع المدن كعملية مصفوفية واحدة"""
+    lats = [city['latitude'] for city in cities]
+    lons = [city['longitude'] for city in cities]
+    table = PrayerTimesCalculator.calculate_locations(lats, lons, day, city_tz_offsets(cities, day), method)
+    if NUMPY_AVAILABLE:
+        return table.tolist()
+    columns = len(PrayerTimesCalculator.PRAYER_NAMES)
+    return [list(table[i:i + columns]) for i in range(0, len(table), columns)]
+
+def _compute_chunk(args: tuple) -> list[tuple[str, list[list[int]]]]:
+    """حساب مجموعة أيام متتالية (تُنفذ في عملية منفصلة)"""
+    cities, first_day, day_count, method = args
+    results = []
+    for offset in range(day_count):
+        day = first_day + timedelta(days=offset)
+        results.append((day.isoformat(), compute_day(cities, day, method)))
+    return results
+
+def compute_range(cities: list[dict], start: date, end: date, method: int, workers: int = None):
+    """
+    حساب فترة طويلة بتقسيمها إلى دفعات وتوزيعها على مجموعة عمليات
+    :return: مولد يعيد (التاريخ، جدول المدن) بالترتيب الزمني
+    """
+    total_days = (end - start).days + 1
+    chunks = []
+    for chunk_start in range(0, total_days, DAYS_PER_CHUNK):
+        day_count = min(DAYS_PER_CHUNK, total_days - chunk_start)
+        chunks.append((cities, start + timedelta(days=chunk_start), day_count, method))
+
+    if len(chunks) == 1:
+        yield from _compute_chunk(chunks[0])
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_results in pool.map(_compute_chunk, chunks):
+            yield from chunk_results
+
+def format_minutes(minutes: int) -> str:
+    """تنسيق الدقائق منذ منتصف الليل بصيغة HH:MM"""
+    if minutes < 0:
+        return '--:--'
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def write_day_feed(cities: list[dict], day: date, method: int, rows: list[list[int]], output):
+    """كتابة ملف JSON لمواقيت يوم واحد لجميع المدن"""
+    feed = {'date': day.isoformat(), 'method': method, 'cities': []}
+    for city, row in zip(cities, rows):
+        entry = {
+            'country': city['country'],
+            'city': city['english_name'],
+            'arabic_name': city['arabic_name'],
+            'latitude': city['latitude'],
+            'longitude': city['longitude'],
+        }
+        for name, minutes in zip(PrayerTimesCalculator.PRAYER_NAMES, row):
+            entry[name] = format_minutes(minutes)
+        feed['cities'].append(entry)
+    json.dump(feed, output, ensure_ascii=False, indent=2)
+
+def write_range_csv(cities: list[dict], results, output):
+    """كتابة جدول CSV لفترة طويلة (صف لكل مدينة في كل يوم)"""
+    writer = csv.writer(output)
+    writer.writerow(['date', 'country', 'city'] + list(PrayerTimesCalculator.PRAYER_NAMES))
+    for day_str, rows in results:
+        for city, row in zip(cities, rows):
+            writer.writerow([day_str, city['country'], city['english_name']] + [format_minutes(m) for m in row])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="حساب مواقيت الصلاة لجميع المدن محليًا")
+    parser.add_argument('--date', type=date.fromisoformat, help="تاريخ يوم واحد (YYYY-MM-DD)")
+    parser.add_argument('--start', type=date.fromisoformat, help="بداية الفترة (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, help="نهاية الفترة (YYYY-MM-DD)")
+    parser.add_argument('--country', action='append', help="تصفية حسب الدولة (يمكن تكرارها)")
+    parser.add_argument('--method', type=int, default=PrayerTimesCalculator.DEFAULT_METHOD, help="معرف طريقة الحساب")
+    parser.add_argument('--workers', type=int, default=None, help="عدد العمليات في وضع الفترات الطويلة")
+    parser.add_argument('--output', default='-', help="ملف الإخراج (- للإخراج القياسي)")
+    parser.add_argument('--geocode-missing', action='store_true',
+                        help="جلب إحداثيات المدن الناقصة من Nominatim أولاً (طلب واحد في الثانية)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    if args.geocode_missing:
+        found = geocode_missing_cities(args.country)
+        logger.info(f"تم العثور على إحداثيات {found} مدينة إضافية")
+
+    cities = load_world_cities(args.country)
+    if not cities:
+        logger.error("لا توجد مدن بإحداثيات معروفة للحساب")
+        return 1
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline='')
+    try:
+        if args.start and args.end:
+            write_range_csv(cities, compute_range(cities, args.start, args.end, args.method, args.workers), output)
+        else:
+            day = args.date or date.today()
+            write_day_feed(cities, day, args.method, compute_day(cities, day, args.method), output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+circuit_breaker.py
+قواطع دائرة لكل مضيف خارجي (خوادم API و NTP) مع إحصائيات صحة الاتصال
+بعد عدد من الإخفاقات المتتالية يُفتح القاطع فتفشل الطلبات لهذا المضيف فورًا ويلجأ المستدعي
+إلى التخزين المؤقت، ثم يُسمح بطلب تجريبي واحد (نصف مفتوح) لمعرفة ما إذا عاد المضيف
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """القاطع مفتوح لهذا المضيف؛ يُرفع فورًا بدون إرسال الطلب"""
+
+class CircuitBreaker:
+    """قاطع دائرة لمضيف واحد (مغلق / مفتوح / نصف مفتوح)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    # عدد الإخفاقات المتتالية التي يُفتح بعدها القاطع
+    FAILURE_THRESHOLD = 3
+    # مدة بقاء القاطع مفتوحًا، تتضاعف مع كل فتح متتالٍ حتى الحد الأقصى (بالثواني)
+    BASE_OPEN_TIME = 5.0
+    MAX_OPEN_TIME = 300.0
+    # معامل التنعيم لمتوسط زمن الاستجابة
+    LATENCY_SMOOTHING = 0.2
+
+    _breakers: Dict[str, 'CircuitBreaker'] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.consecutive_opens = 0
+        self.open_until = 0.0
+        self.total_successes = 0
+        self.total_failures = 0
+        self.rejected = 0
+        self.avg_latency: Optional[float] = None
+        self.last_error = ''
+        self.last_success: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_host(cls, host: str) -> 'CircuitBreaker':
+        """القاطع المشترك لمضيف معين (يُنشأ عند أول استخدام)"""
+        breaker = cls._breakers.get(host)
+        if breaker is None:
+            with cls._registry_lock:
+                breaker = cls._breakers.setdefault(host, cls(host))
+        return breaker
+
+    @classmethod
+    def for_url(cls, url: str) -> 'CircuitBreaker':
+        return cls.for_host(urlsplit(url).hostname or '')
+
+    def before_call(self):
+        """يُستدعى قبل كل طلب؛ يرفع CircuitOpenError إذا كان يجب الفشل فورًا"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN and now >= self.open_until:
+                self.state = self.HALF_OPEN
+                logger.info(f"قاطع {self.host} نصف مفتوح - إرسال طلب تجريبي")
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected += 1
+            remaining = max(0.0, self.open_until - now)
+        raise CircuitOpenError(f"{self.host} غير متاح مؤقتًا (إعادة المحاولة بعد {remaining:.0f} ثانية)")
+
+    def available(self) -> bool:
+        """هل سيُسمح بطلب الآن (بدون تغيير الحالة)"""
+        with self._lock:
+            return self.state == self.CLOSED or (self.state == self.OPEN and time.monotonic() >= self.open_until)
+
+    def record_success(self, latency: Optional[float] = None):
+        with self._lock:
+            self.total_successes += 1
+            self.consecutive_failures = 0
+            self.last_success = time.time()
+            if latency is not None:
+                self.avg_latency = latency if self.avg_latency is None else (
+                    self.avg_latency + self.LATENCY_SMOOTHING * (latency - self.avg_latency))
+            if self.state != self.CLOSED:
+                logger.info(f"عاد الاتصال بـ {self.host} - إغلاق القاطع")
+            self.state = self.CLOSED
+            self.consecutive_opens = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error else ''
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.FAILURE_THRESHOLD:
+                self.consecutive_opens += 1
+                open_time = min(self.BASE_OPEN_TIME * 2 ** (self.consecutive_opens - 1), self.MAX_OPEN_TIME)
+                self.state = self.OPEN
+                self.open_until = time.monotonic() + open_time
+                logger.warning(f"فتح قاطع {self.host} بعد {self.consecutive_failures} إخفاقات متتالية لمدة {open_time:.0f} ثانية")
+
+    def release_probe(self):
+        """
+        إنهاء الطلب التجريبي بدون نتيجة (استثناء غير متوقع قبل تسجيل النجاح أو الفشل)
+        حتى يُسمح بطلب تجريبي جديد بدلاً من رفض جميع الطلبات
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.consecutive_opens = 0
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        """إحصائيات صحة الاتصال بالمضيف"""
+        with self._lock:
+            total = self.total_successes + self.total_failures
+            return {
+                'host': self.host,
+                'state': self.state,
+                'successes': self.total_successes,
+                'failures': self.total_failures,
+                'rejected': self.rejected,
+                'success_rate': self.total_successes / total if total else None,
+                'avg_latency': self.avg_latency,
+                'consecutive_failures': self.consecutive_failures,
+                'last_error': self.last_error,
+            }
+
+    @classmethod
+    def health_report(cls) -> list[dict]:
+        """إحصائيات جميع المضيفين المعروفين"""
+        with cls._registry_lock:
+            breakers = list(cls._breakers.values())
+        return [breaker.stats() for breaker in breakers]
+
+    @classmethod
+    def reset_all(cls):
+        """إغلاق جميع القواطع (عند اكتشاف عودة الاتصال بالإنترنت)"""
+        with cls._registry_lock:
+            breakers = list(cls._breakers.values())
+        for breaker in breakers:
+            breaker.reset()
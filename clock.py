@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+clock.py
+مصدر الوقت الموحد لجميع المسارات المعتمدة على الوقت (العد التنازلي، الإشعارات، حالة الصلوات)
+SystemClock يعتمد على الوقت المتزامن من TimeSync، و VirtualClock ساعة افتراضية يمكن تقديمها يدويًا
+لمحاكاة يوم كامل من الجدولة في أجزاء من الثانية (للقياس والاختبار)
+
+الاستخدام:
+    from clock import get_clock
+    now = get_clock().now()
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, date, timedelta
+from typing import Optional, Union
+
+from prayer_logic import TimeSync
+
+logger = logging.getLogger(__name__)
+
+class Clock:
+    """واجهة مصدر الوقت"""
+
+    def now(self) -> datetime:
+        raise NotImplementedError
+
+    def today(self) -> date:
+        return self.now().date()
+
+    def monotonic(self) -> float:
+        """ثوانٍ متزايدة دائمًا لقياس المدد (لا تتأثر بتغيير ساعة النظام)"""
+        raise NotImplementedError
+
+class SystemClock(Clock):
+    """الوقت الحقيقي مصححًا بنموذج TimeSync؛ تُجدول المزامنة في الخلفية عند حلول موعدها"""
+
+    def __init__(self):
+        self._sync_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        if TimeSync.sync_due():
+            self._start_background_sync()
+        return TimeSync.now()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def _start_background_sync(self):
+        # لا يُنتظر خادم NTP أبدًا في خيط الواجهة
+        with self._lock:
+            if self._sync_thread is not None and self._sync_thread.is_alive():
+                return
+            self._sync_thread = threading.Thread(target=self._sync, name='time-sync', daemon=True)
+            self._sync_thread.start()
+
+    @staticmethod
+    def _sync():
+        try:
+            TimeSync.sync_time()
+        except Exception as e:
+            logger.error(f"خطأ في مزامنة الوقت {e}")
+
+class VirtualClock(Clock):
+    """ساعة افتراضية لا تتقدم إلا باستدعاء advance أو set"""
+
+    def __init__(self, start: Optional[datetime] = None):
+        self._now = start or datetime.now()
+        self._monotonic = 0.0
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        with self._lock:
+            return self._now
+
+    def monotonic(self) -> float:
+        with self._lock:
+            return self._monotonic
+
+    def advance(self, delta: Union[float, timedelta]) -> datetime:
+        """تقديم الساعة بعدد من الثواني أو بمدة timedelta"""
+        if not isinstance(delta, timedelta):
+            delta = timedelta(seconds=delta)
+        if delta < timedelta(0):
+            raise ValueError("لا يمكن إرجاع الساعة الافتراضية إلى الوراء")
+        with self._lock:
+            self._now += delta
+            self._monotonic += delta.total_seconds()
+            return self._now
+
+    def set(self, moment: datetime) -> datetime:
+        """تقديم الساعة إلى لحظة معينة"""
+        return self.advance(moment - self.now())
+
+    def step(self, delta: Union[float, timedelta]) -> datetime:
+        """
+        قفزة في الوقت بدون تقدم الساعة الرتيبة (سكون الجهاز في لينكس أو تغيير ساعة النظام يدويًا)
+        يمكن أن تكون القفزة إلى الوراء
+        """
+        if not isinstance(delta, timedelta):
+            delta = timedelta(seconds=delta)
+        with self._lock:
+            self._now += delta
+            return self._now
+
+_clock: Clock = SystemClock()
+
+def get_clock() -> Clock:
+    """مصدر الوقت الحالي للتطبيق"""
+    return _clock
+
+def set_clock(clock: Clock) -> Clock:
+    """استبدال مصدر الوقت (مثلاً VirtualClock للمحاكاة)؛ يعيد المصدر السابق"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
@@ -88,6 +88,10 @@ TRANSLATIONS = {
         "play": "تشغيل",
         "please_select_city_country": "الرجاء تحديد المدينة والدولة أولاً في الإعدادات",
         "prayer_calculation_method": "طريقة حساب مواقيت الصلاة",
+        "asr_calculation_school": "مذهب حساب العصر",
+        "asr_school_standard": "الجمهور (الشافعي، المالكي، الحنبلي)",
+        "asr_school_hanafi": "الحنفي",
+        "prayer_time_adjustments": "تعديل المواقيت يدويًا (دقائق)",
         "prayer_notification_alert": "تنبيه موقيت الصلاة",
         "prayer_status_finished": "انتهت ✓",
         "prayer_status_now": "الآن ⏰",
@@ -219,6 +223,10 @@ TRANSLATIONS = {
         "play": "Play",
         "please_select_city_country": "Please select the city and country first in the settings.",
         "prayer_calculation_method": "Prayer Times Calculation Method",
+        "asr_calculation_school": "Asr Calculation School",
+        "asr_school_standard": "Standard (Shafi'i, Maliki, Hanbali)",
+        "asr_school_hanafi": "Hanafi",
+        "prayer_time_adjustments": "Manual Time Adjustments (minutes)",
         "prayer_notification_alert": "Prayer Time Alert",
         "prayer_status_finished": "Finished ✓",
         "prayer_status_now": "Now ⏰",
@@ -343,11 +351,12 @@ COUNTRIES_FILE = APP_DATA_DIR / 'countries.json'
 COUNTRIES_CACHE_FILE = CACHE_DIR / 'countries.json'
 CITIES_CACHE_DIR = CACHE_DIR / 'cities_cache'
 WORLD_CITIES_DIR = Path(__file__).parent / 'Countries&Cities'
+CITY_COORDINATES_INDEX_FILE = WORLD_CITIES_DIR / 'coordinates_index.tsv'
 SOUNDS_DIR = APP_DATA_DIR / 'sounds'
 
 def initialize_app_directories():
     """إنشاء المجلدات اللازمة للتطبيق"""
-    global APP_DATA_DIR, SETTINGS_FILE, CACHE_DIR, LOG_DIR, LOG_FILE, COUNTRIES_FILE, COUNTRIES_CACHE_FILE, CITIES_CACHE_DIR, WORLD_CITIES_DIR, SOUNDS_DIR
+    global APP_DATA_DIR, SETTINGS_FILE, CACHE_DIR, LOG_DIR, LOG_FILE, COUNTRIES_FILE, COUNTRIES_CACHE_FILE, CITIES_CACHE_DIR, WORLD_CITIES_DIR, CITY_COORDINATES_INDEX_FILE, SOUNDS_DIR
 
     try:
         # إنشاء المجلد الرئيسي للتطبيق
@@ -373,6 +382,7 @@ def initialize_app_directories():
         COUNTRIES_CACHE_FILE = CACHE_DIR / 'countries.json'
         CITIES_CACHE_DIR = CACHE_DIR / 'cities_cache'
         WORLD_CITIES_DIR = APP_DATA_DIR / 'Countries&Cities'
+        CITY_COORDINATES_INDEX_FILE = WORLD_CITIES_DIR / 'coordinates_index.tsv'
         SOUNDS_DIR = APP_DATA_DIR / 'sounds'
 
     # تأكد من وجود مجلدات التخزين المؤقت والسجلات
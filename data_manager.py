@@ -7,31 +7,31 @@ data_manager.py
 
 import json
 import logging
-import pickle
+import os
+import queue
 import requests
+import sqlite3
+import threading
 import time
+from concurrent.futures import Future
 from datetime import datetime, date, timedelta
-from pathlib import Path
-from typing import Optional, Tuple, Dict, Any
+from typing import Callable, Optional, Tuple, Dict, Any
 
+import http_client
+from circuit_breaker import CircuitOpenError
+from clock import Clock, get_clock
 from config import (
     COUNTRIES_CACHE_FILE, CITIES_CACHE_DIR, CACHE_DIR, 
-    WORLD_CITIES_DIR, COUNTRIES_FILE
+    WORLD_CITIES_DIR, COUNTRIES_FILE, CITY_COORDINATES_INDEX_FILE
 )
 
 logger = logging.getLogger(__name__)
 
-def get_countries() -> list[tuple[str, str]]:
-    """جلب قائمة الدول مع الأسماء العربية والإنجليزية، مع استخدام التخزين المؤقت"""
-    if COUNTRIES_CACHE_FILE.exists():
-        try:
-            with open(COUNTRIES_CACHE_FILE, 'r', encoding='utf-8') as f:
-                countries = json.load(f)
-            logger.info("تم تحميل قائمة الدول من الملف المؤقت")
-            return countries
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"خطأ في تحميل قائمة الدول من الملف المؤقت {e}")
+# مدة صلاحية قائمة الدول إذا لم يحددها الخادم؛ بعدها يعاد التحقق بطلب شرطي
+COUNTRIES_CACHE_TTL = 7 * 24 * 3600
 
+def get_countries() -> list[tuple[str, str]]:
+    """جلب قائمة الدول مع الأسماء العربية والإنجليزية، مع استخدام التخزين المؤقت لـ HTTP"""
     local_countries_map = {}
     if COUNTRIES_FILE.exists():
         try:
@@ -41,11 +41,20 @@ def get_countries() -> list[tuple[str, str]]:
         except (json.JSONDecodeError, IOError) as e:
             logger.error(f"خطأ في تحميل ملف countries.json {e}")
 
-    try:
-        response = requests.get("https://restcountries.com/v3.1/all?fields=name,translations", timeout=10)
-        response.raise_for_status()
-        countries_data = response.json()
+    url = "https://restcountries.com/v3.1/all"
+    params = {'fields': 'name,translations'}
+    countries_data = None
+    if not http_client.NegativeCache.check('countries'):
+        try:
+            countries_data = http_client.get_json(url, params=params, default_ttl=COUNTRIES_CACHE_TTL)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"خطأ في جلب الدول {e}")
+            http_client.NegativeCache.remember_failure('countries', e)
+    if countries_data is None:
+        # آخر نسخة مخزنة حتى لو انتهت صلاحيتها أفضل من القائمة المحلية المختصرة
+        countries_data = http_client.get_cached_json(url, params)
 
+    if countries_data:
         countries = []
         for country in countries_data:
             english_name = country.get('name', {}).get('common')
@@ -57,26 +66,15 @@ def get_countries() -> list[tuple[str, str]]:
             if english_name:
                 countries.append((english_name, arabic_name if arabic_name else english_name))
 
-        countries = sorted(countries, key=lambda x: x[1])
-
-        try:
-            with open(COUNTRIES_CACHE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(countries, f, ensure_ascii=False, indent=2)
-            logger.info("تم حفظ قائمة الدول في الملف المؤقت")
-        except IOError as e:
-            logger.error(f"خطأ في حفظ قائمة الدول في الملف المؤقت {e}")
+        logger.info("تم جلب قائمة الدول بنجاح")
+        return sorted(countries, key=lambda x: x[1])
 
-        logger.info("تم جلب قائمة الدول بنجاح من المصدر")
-        return countries
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"خطأ في جلب الدول {e}")
-        countries = []
-        if local_countries_map:
-            for eng, ara in local_countries_map.items():
-                countries.append((eng, ara))
-            countries = sorted(countries, key=lambda x: x[1])
-        return countries
+    countries = []
+    if local_countries_map:
+        for eng, ara in local_countries_map.items():
+            countries.append((eng, ara))
+        countries = sorted(countries, key=lambda x: x[1])
+    return countries
 
 def get_cities(country_name: str) -> list[tuple[str, str]]:
     """جلب قائمة المدن من الملفات المحلية أولاً، ثم من API إذا لم تكن متوفرة"""
@@ -118,16 +116,24 @@ def get_cities(country_name: str) -> list[tuple[str, str]]:
         except (json.JSONDecodeError, IOError) as e:
             logger.error(f"خطأ في تحميل ملف الترجمة المحلي لـ {country_name} {e}")
 
-    # إذا لم يكن الملف المحلي متوفراً، استخدم API
+    # إذا لم يكن الملف المحلي متوفراً، استخدم API (ما لم يفشل نفس الطلب مؤخرًا)
+    negative_key = ('cities', country_name.lower())
+    if http_client.NegativeCache.check(negative_key):
+        logger.info(f"تخطي جلب المدن لـ {country_name} بسبب فشل سابق قريب")
+        return []
     try:
-        response = requests.post("https://countriesnow.space/api/v0.1/countries/cities", json={'country': country_name}, timeout=10)
-        response.raise_for_status()
+        response = http_client.post("https://countriesnow.space/api/v0.1/countries/cities", json={'country': country_name})
+        # 404 هو رد الخدمة على دولة غير موجودة (نتيجة فارغة صالحة)، وغيره من الأخطاء عابر
+        if response.status_code != 404:
+            response.raise_for_status()
         cities_data = response.json()
         english_names = sorted(cities_data.get('data', []))
         if not english_names:
+            http_client.NegativeCache.remember_failure(negative_key)
             return []
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError, AttributeError, TypeError) as e:
         logger.error(f"خطأ في جلب المدن لـ {country_name} من API {e}")
+        http_client.NegativeCache.remember_failure(negative_key, e)
         return []
 
     # جلب الترجمة المحلية
@@ -169,158 +175,661 @@ def get_cities(country_name: str) -> list[tuple[str, str]]:
     logger.info(f"تم جلب وترجمة قائمة المدن لـ {country_name} بنجاح")
     return cities
 
-# مسار ملف تخزين الإحداثيات
+# مسار ملف تخزين الإحداثيات (لقطة كاملة) وسجل الإضافات الجديدة بعد آخر لقطة
 COORDINATES_CACHE_FILE = CACHE_DIR / "coordinates_cache.json"
+COORDINATES_JOURNAL_FILE = CACHE_DIR / "coordinates_cache.journal"
 
-def get_coordinates_for_city(city: str, country: str) -> Optional[Tuple[float, float]]:
+class CoordinatesIndex:
     """
-    الحصول على إحداثيات (خط العرض، خط الطول) لمدينة باستخدام Nominatim API
-    مع تخزين النتائج مؤقتًا لتحسين الأداء وتقليل عدد الطلبات
+    فهرس إحداثيات المدن في الذاكرة مشترك على مستوى العملية
+    يُحمّل مرة واحدة (اللقطة ثم إعادة تطبيق السجل)، وتُضاف الإدخالات الجديدة كسطر واحد
+    في نهاية السجل، ويُدمج السجل في لقطة جديدة في الخلفية عند تجاوزه حدًا معينًا
     """
-    # التحقق أولاً من التخزين المؤقت
-    coords_cache = {}
-    cache_key = f"{city.lower()}_{country.lower()}"
     
-    if COORDINATES_CACHE_FILE.exists():
+    # عدد أسطر السجل التي يبدأ بعدها الدمج في الخلفية
+    COMPACT_THRESHOLD = 100
+    
+    _entries: Optional[Dict[str, list]] = None
+    _journal_lines = 0
+    _lock = threading.RLock()
+    _compacting = False
+    
+    @staticmethod
+    def _key(city: str, country: str) -> str:
+        return f"{city.lower()}_{country.lower()}"
+    
+    @classmethod
+    def _rotated_journal(cls):
+        return COORDINATES_JOURNAL_FILE.with_suffix('.journal.old')
+    
+    @classmethod
+    def _replay_journal(cls, journal_file, entries: dict) -> int:
+        """تطبيق أسطر السجل على القاموس (السطر الأخير غير المكتمل بعد انقطاع مفاجئ يتم تجاهله)"""
+        if not journal_file.exists():
+            return 0
+        count = 0
         try:
-            with open(COORDINATES_CACHE_FILE, 'r', encoding='utf-8') as f:
-                coords_cache = json.load(f)
-                
-            # إذا كانت الإحداثيات موجودة في التخزين المؤقت، استخدمها
-            if cache_key in coords_cache:
-                cached_coords = coords_cache[cache_key]
-                logger.info(f"إحداثيات {city}, {country} تم جلبها من التخزين المؤقت: ({cached_coords[0]}, {cached_coords[1]})")
-                return cached_coords[0], cached_coords[1]
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"خطأ في قراءة ملف الإحداثيات المخزنة: {e}")
-            # استمر في محاولة الحصول على الإحداثيات من API
+            with open(journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        entries[record['key']] = record['value']
+                        count += 1
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        logger.warning(f"تم تجاهل سطر تالف في سجل الإحداثيات {journal_file.name}")
+        except IOError as e:
+            logger.error(f"خطأ في قراءة سجل الإحداثيات {journal_file.name}: {e}")
+        return count
     
-    # إذا لم تكن الإحداثيات في التخزين المؤقت، استعلم من API
-    try:
-        url = "https://nominatim.openstreetmap.org/search"
+    @classmethod
+    def _ensure_loaded(cls) -> dict:
+        """تحميل الفهرس عند أول استخدام فقط"""
+        if cls._entries is not None:
+            return cls._entries
+        with cls._lock:
+            if cls._entries is None:
+                entries = {}
+                if COORDINATES_CACHE_FILE.exists():
+                    try:
+                        with open(COORDINATES_CACHE_FILE, 'r', encoding='utf-8') as f:
+                            entries = json.load(f)
+                    except (json.JSONDecodeError, IOError) as e:
+                        logger.error(f"خطأ في قراءة ملف الإحداثيات المخزنة: {e}")
+                # سجل تم تدويره لدمج لم يكتمل ثم السجل الحالي بالترتيب
+                cls._journal_lines = cls._replay_journal(cls._rotated_journal(), entries)
+                cls._journal_lines += cls._replay_journal(COORDINATES_JOURNAL_FILE, entries)
+                cls._entries = entries
+                logger.info(f"تم تحميل فهرس الإحداثيات ({len(entries)} مدينة)")
+        return cls._entries
+    
+    @classmethod
+    def get(cls, city: str, country: str) -> Optional[list]:
+        """إدخال مدينة من الفهرس: [خط العرض، خط الطول] أو [خط العرض، خط الطول، المنطقة الزمنية]"""
+        return cls._ensure_loaded().get(cls._key(city, country))
+    
+    @classmethod
+    def put(cls, city: str, country: str, entry: list) -> bool:
+        """
+        إضافة أو تحديث إدخال مدينة وإلحاقه بالسجل
+        :return: False إذا كان الإدخال موجودًا بنفس القيمة
+        """
+        key = cls._key(city, country)
+        with cls._lock:
+            entries = cls._ensure_loaded()
+            if entries.get(key) == entry:
+                return False
+            entries[key] = entry
+            try:
+                with open(COORDINATES_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'value': entry}, ensure_ascii=False) + '\n')
+                cls._journal_lines += 1
+            except IOError as e:
+                logger.error(f"خطأ في الكتابة إلى سجل الإحداثيات: {e}")
+            if cls._journal_lines >= cls.COMPACT_THRESHOLD and not cls._compacting:
+                cls._compacting = True
+                threading.Thread(target=cls.compact, daemon=True).start()
+        return True
+    
+    @classmethod
+    def compact(cls):
+        """دمج السجل في لقطة جديدة تُكتب بشكل ذري (ملف مؤقت ثم استبدال)"""
+        try:
+            with cls._lock:
+                snapshot = dict(cls._ensure_loaded())
+                rotated = cls._rotated_journal()
+                # تدوير السجل: الإضافات التالية تذهب إلى سجل جديد، والقديم يبقى حتى تكتمل اللقطة
+                if COORDINATES_JOURNAL_FILE.exists() and not rotated.exists():
+                    os.replace(COORDINATES_JOURNAL_FILE, rotated)
+                cls._journal_lines = 0
+            
+            tmp_file = COORDINATES_CACHE_FILE.with_suffix('.json.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_file, COORDINATES_CACHE_FILE)
+            if rotated.exists():
+                rotated.unlink()
+            logger.info(f"تم دمج سجل الإحداثيات في لقطة جديدة ({len(snapshot)} مدينة)")
+        except (IOError, OSError) as e:
+            logger.error(f"خطأ في دمج سجل الإحداثيات: {e}")
+        finally:
+            cls._compacting = False
+    
+    @classmethod
+    def last_modified(cls) -> Optional[datetime]:
+        """آخر وقت تعديل لملفات الفهرس على القرص"""
+        mtimes = [f.stat().st_mtime for f in (COORDINATES_CACHE_FILE, COORDINATES_JOURNAL_FILE, cls._rotated_journal())
+                  if f.exists()]
+        return datetime.fromtimestamp(max(mtimes)) if mtimes else None
+    
+    @classmethod
+    def clear(cls) -> int:
+        """حذف الفهرس من الذاكرة والقرص"""
+        removed = 0
+        with cls._lock:
+            cls._entries = {}
+            cls._journal_lines = 0
+            for index_file in (COORDINATES_CACHE_FILE, COORDINATES_JOURNAL_FILE, cls._rotated_journal()):
+                try:
+                    if index_file.exists():
+                        index_file.unlink()
+                        removed += 1
+                except OSError as e:
+                    logger.error(f"خطأ في حذف ملف الإحداثيات المخزنة {index_file.name}: {e}")
+        return removed
+
+class BundledCoordinates:
+    """
+    إحداثيات مدن قاعدة البيانات المرفقة مع البرنامج (للقراءة فقط)
+    تُحمّل من الفهرس المضغوط الذي تنتجه أداة build_city_coordinates.py، وإذا لم يكن
+    الفهرس موجودًا تُقرأ من حقول latitude و longitude في ملف الدولة عند أول طلب لها
+    """
+    
+    _index: Optional[Dict[str, list]] = None
+    _loaded_countries: set = set()
+    _lock = threading.Lock()
+    
+    @classmethod
+    def _load_index(cls) -> dict:
+        if cls._index is not None:
+            return cls._index
+        with cls._lock:
+            if cls._index is None:
+                index = {}
+                if CITY_COORDINATES_INDEX_FILE.exists():
+                    try:
+                        with open(CITY_COORDINATES_INDEX_FILE, 'r', encoding='utf-8') as f:
+                            for line in f:
+                                fields = line.rstrip('\n').split('\t')
+                                if len(fields) == 5:
+                                    country, city, lat, lon, timezone_name = fields
+                                    index[f"{city}_{country}"] = [float(lat), float(lon), timezone_name]
+                        logger.info(f"تم تحميل فهرس إحداثيات المدن المرفق ({len(index)} مدينة)")
+                    except (IOError, ValueError) as e:
+                        logger.error(f"خطأ في قراءة فهرس إحداثيات المدن المرفق: {e}")
+                cls._index = index
+        return cls._index
+    
+    @classmethod
+    def _load_country(cls, country: str):
+        """قراءة إحداثيات مدن دولة واحدة من ملفها مباشرة (في حال عدم وجود الفهرس)"""
+        with cls._lock:
+            if country.lower() in cls._loaded_countries:
+                return
+            cls._loaded_countries.add(country.lower())
+            country_file = WORLD_CITIES_DIR / f"{country}.json"
+            if not country_file.exists():
+                return
+            try:
+                with open(country_file, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logger.error(f"خطأ في تحميل ملف المدن لـ {country} {e}")
+                return
+            for entry in entries:
+                if entry.get('latitude') is None or entry.get('longitude') is None:
+                    continue
+                key = f"{entry.get('english_name', '').lower()}_{country.lower()}"
+                cls._index.setdefault(key, [float(entry['latitude']), float(entry['longitude']), entry.get('timezone', '')])
+    
+    @classmethod
+    def get(cls, city: str, country: str) -> Optional[list]:
+        """[خط العرض، خط الطول، المنطقة الزمنية] لمدينة من قاعدة البيانات المرفقة أو None"""
+        index = cls._load_index()
+        key = f"{city.lower()}_{country.lower()}"
+        if key not in index and country.lower() not in cls._loaded_countries:
+            cls._load_country(country)
+        return index.get(key)
+
+def get_cached_coordinates(city: str, country: str) -> Optional[Tuple[float, float, str]]:
+    """
+    الحصول على إحداثيات مدينة من التخزين المؤقت فقط بدون أي طلب شبكة
+    :return: (خط العرض، خط الطول، المنطقة الزمنية) أو None
+    """
+    # قاعدة البيانات المرفقة أولاً ثم ما تم جلبه سابقًا من الشبكة
+    cached = BundledCoordinates.get(city, country) or CoordinatesIndex.get(city, country)
+    if not cached:
+        return None
+    timezone_name = cached[2] if len(cached) > 2 else ''
+    return cached[0], cached[1], timezone_name
+
+def save_coordinates(city: str, country: str, lat: float, lon: float, timezone_name: str = ''):
+    """تخزين إحداثيات مدينة (والمنطقة الزمنية إن وجدت) في فهرس الإحداثيات"""
+    entry = [lat, lon, timezone_name] if timezone_name else [lat, lon]
+    if CoordinatesIndex.put(city, country, entry):
+        logger.info(f"تم تخزين إحداثيات {city}, {country} في ملف التخزين المؤقت")
+
+class TokenBucket:
+    """محدد معدل بطريقة دلو الرموز: كل طلب يستهلك رمزًا، والرموز تتجدد بمعدل ثابت"""
+    
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """الانتظار حتى يتوفر رمز ثم استهلاكه"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+    
+    def pause(self, seconds: float):
+        """إيقاف إصدار الرموز لمدة محددة (مثل Retry-After من الخادم)"""
+        with self._lock:
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+class NominatimQueue:
+    """
+    طابور استعلامات Nominatim بخيط عامل واحد يلتزم بسياسة الاستخدام (طلب واحد في الثانية كحد أقصى)
+    الطلبات المكررة لنفس المدينة تشترك في نتيجة واحدة، والمدن غير الموجودة (أو التي فشل جلبها)
+    تُسجل في NegativeCache حتى لا يعاد الاستعلام عنها، ويمكن إرسال قائمة مدن كاملة دفعة واحدة
+    """
+    
+    URL = "https://nominatim.openstreetmap.org/search"
+    RATE = 1.0  # طلب في الثانية
+    MAX_RETRIES = 2
+    
+    _bucket = TokenBucket(RATE)
+    _queue: "queue.Queue" = queue.Queue()
+    _pending: Dict[str, Future] = {}
+    _lock = threading.Lock()
+    _worker: Optional[threading.Thread] = None
+    
+    @staticmethod
+    def _key(city: str, country: str) -> str:
+        return f"{city.lower()}_{country.lower()}"
+    
+    @classmethod
+    def submit(cls, city: str, country: str) -> Future:
+        """
+        إضافة مدينة إلى الطابور
+        :return: Future بنتيجة (خط العرض، خط الطول) أو None إذا لم يُعثر عليها
+        """
+        cached = get_cached_coordinates(city, country)
+        if cached:
+            return _completed_future((cached[0], cached[1]))
+        key = cls._key(city, country)
+        with cls._lock:
+            if http_client.NegativeCache.check(('geocode', key)):
+                return _completed_future(None)
+            future = cls._pending.get(key)
+            if future is None:
+                future = cls._pending[key] = Future()
+                cls._queue.put((key, city, country))
+                if cls._worker is None or not cls._worker.is_alive():
+                    cls._worker = threading.Thread(target=cls._run, name='nominatim', daemon=True)
+                    cls._worker.start()
+        return future
+    
+    @classmethod
+    def submit_batch(cls, places: list[tuple[str, str]]) -> Dict[tuple[str, str], Future]:
+        """إرسال مجموعة مدن (city, country) دفعة واحدة؛ تُعالج بالترتيب بأقصى معدل مسموح"""
+        return {(city, country): cls.submit(city, country) for city, country in places}
+    
+    @classmethod
+    def resolve(cls, city: str, country: str, timeout: Optional[float] = None) -> Optional[Tuple[float, float]]:
+        """الحصول على إحداثيات مدينة مع الانتظار حتى يصل دورها في الطابور"""
+        return cls.submit(city, country).result(timeout)
+    
+    @classmethod
+    def _run(cls):
+        while True:
+            key, city, country = cls._queue.get()
+            try:
+                result = cls._geocode(city, country)
+                if result is None:
+                    http_client.NegativeCache.remember_failure(('geocode', key))
+            except Exception as e:
+                logger.error(f"خطأ في جلب إحداثيات {city}, {country}: {e}")
+                http_client.NegativeCache.remember_failure(('geocode', key), e)
+                result = None
+            with cls._lock:
+                future = cls._pending.pop(key)
+            future.set_result(result)
+    
+    @classmethod
+    def _geocode(cls, city: str, country: str) -> Optional[Tuple[float, float]]:
+        """استعلام Nominatim عن إحداثيات مدينة وتخزينها (يُنفذ في الخيط العامل فقط)"""
         params = {'q': f'{city}, {country}', 'format': 'json', 'limit': 1}
-        headers = {'User-Agent': 'PrayerTimesApp/2.0'}  # Nominatim يتطلب User-Agent
-        
-        # محاولة الاستعلام مع إعادة المحاولة
-        max_retries = 2
-        retry_delay = 2  # ثواني
-        
-        for attempt in range(max_retries + 1):
+        for attempt in range(cls.MAX_RETRIES + 1):
+            if attempt:
+                http_client.RetryCounters.add('application')
+            cls._bucket.acquire()
             try:
-                response = requests.get(url, params=params, timeout=10, headers=headers)
+                # بدون إعادة محاولة تلقائية من الجلسة: كل محاولة يجب أن تستهلك رمزًا من الدلو
+                response = http_client.get(cls.URL, params=params, retries=False)
+                if response.status_code in (429, 503):
+                    # الخادم يطلب التمهل: إيقاف الطابور بالكامل وليس هذا الطلب فقط
+                    retry_after = http_client.parse_retry_after(response.headers.get('Retry-After'), 2 ** (attempt + 1))
+                    cls._bucket.pause(retry_after)
                 response.raise_for_status()
-                break  # خروج من الحلقة إذا نجح الطلب
+                break
             except requests.exceptions.RequestException as e:
-                if attempt < max_retries:
-                    logger.warning(f"فشل الاتصال (المحاولة {attempt+1}/{max_retries+1}). إعادة المحاولة بعد {retry_delay} ثوانٍ...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # مضاعفة وقت الانتظار مع كل محاولة
-                else:
-                    raise  # إعادة رفع الاستثناء بعد استنفاد جميع المحاولات
+                if attempt == cls.MAX_RETRIES or isinstance(e, CircuitOpenError):
+                    raise
+                logger.warning(f"فشل الاتصال بـ Nominatim (المحاولة {attempt+1}/{cls.MAX_RETRIES+1}): {e}")
         
         data = response.json()
-        if data:
-            lat = float(data[0]['lat'])
-            lon = float(data[0]['lon'])
-            logger.info(f"إحداثيات {city}, {country}: ({lat}, {lon})")
-            
-            # تخزين الإحداثيات في الذاكرة المؤقتة
-            coords_cache[cache_key] = (lat, lon)
-            try:
-                with open(COORDINATES_CACHE_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(coords_cache, f, ensure_ascii=False, indent=2)
-                logger.info(f"تم تخزين إحداثيات {city}, {country} في ملف التخزين المؤقت")
-            except IOError as e:
-                logger.error(f"خطأ في حفظ ملف الإحداثيات المخزنة: {e}")
-            
-            return lat, lon
-        else:
+        if not data:
             logger.warning(f"لم يتم العثور على إحداثيات لـ {city}, {country}")
             return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"خطأ في جلب إحداثيات {city}, {country}: {e}")
-        return None
-    except (KeyError, IndexError, ValueError) as e:
-        logger.error(f"خطأ في تحليل إحداثيات {city}, {country}: {e}")
-        return None
+        lat = float(data[0]['lat'])
+        lon = float(data[0]['lon'])
+        logger.info(f"إحداثيات {city}, {country}: ({lat}, {lon})")
+        save_coordinates(city, country, lat, lon)
+        return lat, lon
+
+def _completed_future(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+def get_coordinates_for_city(city: str, country: str) -> Optional[Tuple[float, float]]:
+    """
+    الحصول على إحداثيات (خط العرض، خط الطول) لمدينة من قاعدة البيانات المرفقة أو التخزين المؤقت،
+    واستخدام Nominatim API فقط للأماكن غير الموجودة فيهما مع تخزين النتائج مؤقتًا
+    """
+    # التحقق أولاً من التخزين المؤقت
+    cached_coords = get_cached_coordinates(city, country)
+    if cached_coords:
+        logger.info(f"إحداثيات {city}, {country} تم جلبها من التخزين المؤقت: ({cached_coords[0]}, {cached_coords[1]})")
+        return cached_coords[0], cached_coords[1]
+    
+    # إذا لم تكن الإحداثيات في التخزين المؤقت، استعلم من API عبر الطابور المحدود المعدل
+    # (الطلبات المتزامنة لنفس المدينة، مثل عدة نوافذ قبلة، تشترك في استعلام واحد)
+    return NominatimQueue.resolve(city, country)
+
+def geocode_missing_cities(countries: Optional[list] = None, progress: Optional[Callable] = None) -> int:
+    """
+    جلب إحداثيات جميع مدن قاعدة البيانات التي لا تتوفر إحداثياتها (للدول المحددة أو جميعها)
+    عبر طابور Nominatim بأقصى معدل مسموح
+    :param progress: دالة اختيارية تُستدعى بـ (عدد المنجز، العدد الكلي)
+    :return: عدد المدن التي تم العثور على إحداثياتها
+    """
+    wanted = {country.lower() for country in countries} if countries else None
+    missing = []
+    for country_file in sorted(WORLD_CITIES_DIR.glob("*.json")):
+        country = country_file.stem
+        if wanted is not None and country.lower() not in wanted:
+            continue
+        try:
+            with open(country_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"خطأ في تحميل ملف المدن لـ {country} {e}")
+            continue
+        for entry in entries:
+            english_name = entry.get('english_name', '')
+            if english_name and not get_cached_coordinates(english_name, country):
+                missing.append((english_name, country))
+    
+    if not missing:
+        return 0
+    logger.info(f"جلب إحداثيات {len(missing)} مدينة (حوالي {len(missing) / NominatimQueue.RATE:.0f} ثانية)")
+    futures = NominatimQueue.submit_batch(missing)
+    found = 0
+    for done, future in enumerate(futures.values(), 1):
+        if future.result():
+            found += 1
+        if progress:
+            progress(done, len(futures))
+    return found
+
+def load_world_cities(countries: Optional[list] = None) -> list[dict]:
+    """
+    تحميل مدن قاعدة البيانات المرفقة (Countries&Cities) مع إحداثياتها للحساب الجماعي
+    تؤخذ الإحداثيات من ملف الدولة إذا احتوى عليها، وإلا من الفهرس المرفق أو الإحداثيات المخزنة (get_cached_coordinates)
+    :param countries: قائمة أسماء الدول الإنجليزية للتصفية (None لجميع الدول)
+    :return: قائمة قواميس تحتوي country, english_name, arabic_name, latitude, longitude, timezone
+             (المدن التي لا تتوفر إحداثياتها يتم تجاهلها)
+    """
+    wanted = {country.lower() for country in countries} if countries else None
+    cities = []
+    skipped = 0
+
+    for country_file in sorted(WORLD_CITIES_DIR.glob("*.json")):
+        country = country_file.stem
+        if wanted is not None and country.lower() not in wanted:
+            continue
+        try:
+            with open(country_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"خطأ في تحميل ملف المدن لـ {country} {e}")
+            continue
+
+        for entry in entries:
+            english_name = entry.get('english_name', '')
+            lat, lon = entry.get('latitude'), entry.get('longitude')
+            timezone_name = entry.get('timezone', '')
+            if lat is None or lon is None:
+                cached = get_cached_coordinates(english_name, country)
+                if not cached:
+                    skipped += 1
+                    continue
+                lat, lon = cached[0], cached[1]
+                timezone_name = timezone_name or cached[2]
+            cities.append({
+                'country': country,
+                'english_name': english_name,
+                'arabic_name': entry.get('arabic_name', english_name),
+                'latitude': float(lat),
+                'longitude': float(lon),
+                'timezone': timezone_name,
+            })
+
+    if skipped:
+        logger.warning(f"تم تجاهل {skipped} مدينة بدون إحداثيات معروفة")
+    logger.info(f"تم تحميل {len(cities)} مدينة للحساب الجماعي")
+    return cities
 
 class CacheManager:
-    """مدير البيانات المؤقتة"""    
-    def __init__(self):
+    """مدير البيانات المؤقتة (قاعدة SQLite واحدة لجميع المدن والأيام)"""    
+    def __init__(self, clock: Optional[Clock] = None):
+        # "اليوم" لمفاتيح الأيام والتنظيف من نفس الساعة التي تستخدمها الواجهة
+        self.clock = clock or get_clock()
         self.cache_dir = CACHE_DIR
         self.cache_dir.mkdir(exist_ok=True)
+        self.db_file = self.cache_dir / "timetable_cache.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # المفتاح الأساسي يوفر الفهرس على معاملات الحساب الكاملة ثم التاريخ،
+            # فيمكن تخزين عدة طرق حساب للمدينة نفسها جنبًا إلى جنب
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS prayer_timetable (
+                    city TEXT NOT NULL,
+                    country TEXT NOT NULL,
+                    method INTEGER NOT NULL,
+                    school INTEGER NOT NULL,
+                    tune TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    PRIMARY KEY (city, country, method, school, tune, day)
+                )
+            """)
     
-    def get_cache_file(self, city: str, country: str) -> Path:
-        """الحصول على مسار ملف البيانات المؤقتة"""
-        today = date.today().isoformat()
-        return self.cache_dir / f"prayer_{city}_{country}_{today}.pkl"
-    
-    def save_data(self, city: str, country: str, data: dict):
-        """حفظ البيانات في ذاكرة التخزين المؤقت"""
+    def save_data(self, city: str, country: str, data: dict, calc_key: tuple, day: Optional[date] = None):
+        """
+        حفظ البيانات في ذاكرة التخزين المؤقت
+        :param calc_key: معاملات الحساب (الطريقة، المذهب، التعديلات) من Settings.calculation_key
+        """
+        day_str = (day or self.clock.today()).isoformat()
         try:
-            cache_file = self.get_cache_file(city, country)
-            with open(cache_file, 'wb') as f:
-                pickle.dump({'data': data, 'timestamp': datetime.now().isoformat(), 'city': city, 'country': country}, f)
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO prayer_timetable VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (city, country, *calc_key, day_str, json.dumps(data, ensure_ascii=False), self.clock.now().isoformat())
+                )
             logger.info(f"تم حفظ البيانات المؤقتة لـ {city}")
-        except Exception as e:
+        except (sqlite3.Error, TypeError, ValueError) as e:
             logger.error(f"خطأ في حفظ البيانات المؤقتة {e}")
     
-    def load_data(self, city: str, country: str) -> Optional[dict]:
+    def save_calendar(self, city: str, country: str, days_data: list, calc_key: tuple) -> int:
+        """
+        تقسيم استجابة التقويم (شهر أو سنة) إلى صفوف لكل يوم وإدراجها دفعة واحدة
+        :return: عدد الأيام التي تم حفظها
+        """
+        today = self.clock.today()
+        timestamp = self.clock.now().isoformat()
+        rows = []
+        for day_data in days_data:
+            try:
+                day = datetime.strptime(day_data['date']['gregorian']['date'], "%d-%m-%Y").date()
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"تجاهل يوم بتاريخ غير صالح في التقويم: {e}")
+                continue
+            if day < today:
+                continue
+            rows.append((city, country, *calc_key, day.isoformat(), json.dumps(day_data, ensure_ascii=False), timestamp))
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO prayer_timetable VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في حفظ تقويم {city} في التخزين المؤقت: {e}")
+            return 0
+        logger.info(f"تم حفظ تقويم {len(rows)} يوم لـ {city}")
+        return len(rows)
+    
+    def load_data(self, city: str, country: str, calc_key: tuple, day: Optional[date] = None) -> Optional[dict]:
         """تحميل البيانات من ذاكرة التخزين المؤقت"""
+        day_str = (day or self.clock.today()).isoformat()
         try:
-            cache_file = self.get_cache_file(city, country)
-            if cache_file.exists():
-                with open(cache_file, 'rb') as f:
-                    cached_data = pickle.load(f)
-                    logger.info(f"تم تحميل البيانات المؤقتة لـ {city}")
-                    return cached_data['data']
-        except Exception as e:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT data FROM prayer_timetable WHERE city = ? AND country = ? AND method = ? "
+                    "AND school = ? AND tune = ? AND day = ?",
+                    (city, country, *calc_key, day_str)
+                ).fetchone()
+            if row:
+                logger.info(f"تم تحميل البيانات المؤقتة لـ {city}")
+                return json.loads(row[0])
+        except (sqlite3.Error, json.JSONDecodeError) as e:
             logger.error(f"خطأ في تحميل البيانات المؤقتة {e}")
         return None
     
+    def load_range(self, city: str, country: str, calc_key: tuple, start: date, end: date) -> Dict[date, dict]:
+        """تحميل جميع الأيام المخزنة بين تاريخين (شاملين) لعرض التقويم"""
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT day, data FROM prayer_timetable WHERE city = ? AND country = ? AND method = ? "
+                    "AND school = ? AND tune = ? AND day BETWEEN ? AND ? ORDER BY day",
+                    (city, country, *calc_key, start.isoformat(), end.isoformat())
+                ).fetchall()
+            return {date.fromisoformat(day_str): json.loads(data) for day_str, data in rows}
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            logger.error(f"خطأ في تحميل نطاق البيانات المؤقتة لـ {city}: {e}")
+            return {}
+    
+    def delete_data(self, city: str, country: str, calc_key: Optional[tuple] = None, day: Optional[date] = None):
+        """حذف بيانات مدينة من التخزين المؤقت (ليوم محدد أو لجميع الأيام، ولمعاملات محددة أو لجميعها)"""
+        query = "DELETE FROM prayer_timetable WHERE city = ? AND country = ?"
+        args = [city, country]
+        if calc_key is not None:
+            query += " AND method = ? AND school = ? AND tune = ?"
+            args.extend(calc_key)
+        if day is not None:
+            query += " AND day = ?"
+            args.append(day.isoformat())
+        try:
+            with self._lock, self._conn:
+                deleted = self._conn.execute(query, args).rowcount
+            logger.info(f"تم حذف {deleted} يوم من البيانات المؤقتة لـ {city}, {country}")
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في حذف البيانات المؤقتة لـ {city}: {e}")
+    
+    def cached_days_ahead(self, city: str, country: str, calc_key: tuple, max_days: int) -> int:
+        """عدد الأيام المتتالية المخزنة مؤقتًا بدءًا من اليوم (حتى max_days)"""
+        today = self.clock.today()
+        cached = self.load_days(city, country, calc_key, today, today + timedelta(days=max_days - 1))
+        for offset in range(max_days):
+            if (today + timedelta(days=offset)).isoformat() not in cached:
+                return offset
+        return max_days
+    
+    def load_days(self, city: str, country: str, calc_key: tuple, start: date, end: date) -> set:
+        """مجموعة التواريخ (بصيغة ISO) المخزنة بين تاريخين بدون تحميل البيانات نفسها"""
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT day FROM prayer_timetable WHERE city = ? AND country = ? AND method = ? "
+                    "AND school = ? AND tune = ? AND day BETWEEN ? AND ?",
+                    (city, country, *calc_key, start.isoformat(), end.isoformat())
+                ).fetchall()
+            return {row[0] for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في قراءة التخزين المؤقت لـ {city}: {e}")
+            return set()
+    
+    def cached_calculation_keys(self, city: str, country: str, day: Optional[date] = None) -> list[tuple]:
+        """معاملات الحساب التي تتوفر لها بيانات مخزنة لمدينة في يوم محدد (للتبديل الفوري بين الطرق)"""
+        day_str = (day or self.clock.today()).isoformat()
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT method, school, tune FROM prayer_timetable WHERE city = ? AND country = ? AND day = ?",
+                    (city, country, day_str)
+                ).fetchall()
+            return [tuple(row) for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في قراءة التخزين المؤقت لـ {city}: {e}")
+            return []
+    
     def cleanup_old_cache(self):
         """
         تنظيف البيانات المؤقتة القديمة
-        يشمل ملفات مواقيت الصلاة وبيانات الإحداثيات القديمة
+        يشمل الأيام الماضية في قاعدة المواقيت وبيانات الإحداثيات القديمة
         """
         try:
-            today = date.today()
+            today = self.clock.today()
+            # يُبقى الأمس لأن عشاءه قد يقع بعد منتصف الليل (انظر PrayerWindow)
+            yesterday = today - timedelta(days=1)
             cache_count = 0
             
-            # تنظيف ملفات مواقيت الصلاة القديمة
+            # حذف الأيام الماضية من قاعدة المواقيت باستعلام واحد
+            try:
+                with self._lock, self._conn:
+                    cache_count += self._conn.execute("DELETE FROM prayer_timetable WHERE day < ?", (yesterday.isoformat(),)).rowcount
+            except sqlite3.Error as e:
+                logger.error(f"خطأ في حذف الأيام القديمة من التخزين المؤقت: {e}")
+            
+            # حذف استجابات HTTP التي لم تُستخدم منذ مدة طويلة
+            cache_count += http_client.ResponseCache.prune()
+            
+            # قائمة الدول أصبحت ضمن التخزين المؤقت لـ HTTP
+            if COUNTRIES_CACHE_FILE.exists():
+                try:
+                    COUNTRIES_CACHE_FILE.unlink()
+                    cache_count += 1
+                except OSError as e:
+                    logger.error(f"خطأ في حذف الملف المؤقت القديم {COUNTRIES_CACHE_FILE}: {e}")
+            
+            # حذف ملفات pickle القديمة من الإصدارات السابقة
             for cache_file in self.cache_dir.glob("prayer_*.pkl"):
                 try:
-                    # استخراج التاريخ من اسم الملف
-                    parts = cache_file.stem.split('_')
-                    if len(parts) >= 4:
-                        file_date_str = parts[-1]
-                        try:
-                            file_date = date.fromisoformat(file_date_str)
-                            if file_date < today:
-                                cache_file.unlink()
-                                cache_count += 1
-                                logger.debug(f"تم حذف الملف المؤقت القديم {cache_file}")
-                        except ValueError:
-                            # إذا كان التاريخ غير صالح، تحقق من وقت التعديل
-                            file_mtime = datetime.fromtimestamp(cache_file.stat().st_mtime).date()
-                            if file_mtime < today - timedelta(days=3):  # أقدم من 3 أيام
-                                cache_file.unlink()
-                                cache_count += 1
-                                logger.debug(f"تم حذف الملف المؤقت القديم (بناءً على وقت التعديل) {cache_file}")
-                except Exception as e:
-                    logger.error(f"خطأ في معالجة الملف {cache_file}: {e}")
+                    cache_file.unlink()
+                    cache_count += 1
+                except OSError as e:
+                    logger.error(f"خطأ في حذف الملف المؤقت القديم {cache_file}: {e}")
             
-            # تنظيف ملف الإحداثيات المخزنة إذا كان قديمًا جدًا
-            if COORDINATES_CACHE_FILE.exists():
-                file_mtime = datetime.fromtimestamp(COORDINATES_CACHE_FILE.stat().st_mtime).date()
-                # تحقق من آخر تحديث - إذا كان أقدم من 30 يومًا، قم بحذفه
-                if file_mtime < today - timedelta(days=30):
-                    try:
-                        COORDINATES_CACHE_FILE.unlink()
-                        cache_count += 1
-                        logger.info(f"تم حذف ملف الإحداثيات المخزنة القديم")
-                    except Exception as e:
-                        logger.error(f"خطأ في حذف ملف الإحداثيات المخزنة: {e}")
+            # تنظيف فهرس الإحداثيات المخزنة إذا لم يُحدّث منذ مدة طويلة
+            last_modified = CoordinatesIndex.last_modified()
+            # تحقق من آخر تحديث - إذا كان أقدم من 30 يومًا، قم بحذفه
+            if last_modified and last_modified.date() < today - timedelta(days=30):
+                cache_count += CoordinatesIndex.clear()
+                logger.info(f"تم حذف ملف الإحداثيات المخزنة القديم")
             
             if cache_count > 0:
                 logger.info(f"تم تنظيف {cache_count} ملفات مؤقتة قديمة")
@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+
+"""
+http_client.py
+جلسة HTTP مشتركة لجميع طلبات الشبكة في البرنامج
+تعيد استخدام الاتصالات (keep-alive) مع تجميعها لكل مضيف، وتوحد المهلات وضغط الاستجابات
+وسياسة إعادة المحاولة للأخطاء العابرة بدلاً من فتح اتصال TCP+TLS جديد لكل طلب
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# مهلة الاتصال ومهلة القراءة الافتراضية بالثواني
+DEFAULT_TIMEOUT = (5, 10)
+
+# عدد المضيفين الذين يحتفظ بمجمعات اتصالاتهم، وعدد الاتصالات المحفوظة لكل مضيف
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 8
+
+USER_AGENT = 'PrayerTimesApp/2.0'  # Nominatim يتطلب User-Agent
+
+# توجيه جميع الطلبات إلى خادم بديل (مثل mock_api_server.py) مع الإبقاء على المسار والمعاملات
+API_BASE_OVERRIDE = os.environ.get('PRAYER_TIMES_API_BASE', '')
+
+class RetryCounters:
+    """عدادات إعادة المحاولة على مستوى العملية (للتشخيص وأداة القياس load_harness.py)"""
+    
+    # إعادة الإرسال التلقائية من urllib3 داخل الجلسة المشتركة
+    transport = 0
+    # المحاولات الإضافية التي يقررها المستدعي (robust_api_call وطابور Nominatim)
+    application = 0
+    _lock = threading.Lock()
+    
+    @classmethod
+    def add(cls, kind: str):
+        with cls._lock:
+            setattr(cls, kind, getattr(cls, kind) + 1)
+    
+    @classmethod
+    def snapshot(cls) -> dict:
+        with cls._lock:
+            return {'application': cls.application, 'transport': cls.transport}
+    
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.transport = cls.application = 0
+
+class _CountingRetry(Retry):
+    """Retry يسجل كل إعادة إرسال فعلية (increment يرفع MaxRetryError عند النفاد فلا تُحسب)"""
+    
+    def increment(self, *args, **kwargs):
+        retry = super().increment(*args, **kwargs)
+        RetryCounters.add('transport')
+        return retry
+
+# إعادة محاولة سريعة على مستوى الاتصال فقط؛ إعادة المحاولة على مستوى التطبيق
+# (مثل robust_api_call) تبقى مسؤولية المستدعي
+RETRY_POLICY = _CountingRetry(
+    total=2,
+    connect=1,
+    read=0,
+    status=2,
+    backoff_factor=0.5,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=frozenset({'GET', 'HEAD', 'POST'}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+class SingleFlight:
+    """
+    دمج الاستدعاءات المتزامنة المتطابقة: أول مستدعٍ لمفتاح معين ينفذ الدالة،
+    ومن يصل أثناء تنفيذها ينتظر ويحصل على النتيجة نفسها (أو الاستثناء نفسه)
+    """
+    
+    class _Call:
+        __slots__ = ('done', 'result', 'error', 'waiters')
+        
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error: Optional[BaseException] = None
+            self.waiters = 0
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+    
+    def do(self, key, func: Callable, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                call.waiters += 1
+        
+        if not leader:
+            logger.debug(f"انضمام إلى طلب جارٍ بنفس المفتاح: {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+    
+    def in_flight(self, key) -> bool:
+        with self._lock:
+            return key in self._calls
+
+# دمج طلبات GET المتطابقة الجارية في الوقت نفسه
+_flights = SingleFlight()
+
+class NegativeCache:
+    """
+    تذكر نتائج البحث الفاشلة ("غير موجود" أو "تعذر الوصول") لمدة محددة لكل مفتاح
+    مشترك بين جميع عمليات البحث (الدول، المدن، الإحداثيات) حتى لا يعاد المسار البطيء الفاشل
+    """
+    
+    # المدد الافتراضية بالثواني لكل نوع من الفشل
+    NOT_FOUND_TTL = 24 * 3600
+    UNREACHABLE_TTL = 5 * 60
+    
+    _entries: dict = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def remember(cls, key, ttl: float, reason: str = 'not_found'):
+        with cls._lock:
+            cls._entries[key] = (time.monotonic() + ttl, reason)
+    
+    @classmethod
+    def remember_failure(cls, key, error: Optional[BaseException] = None):
+        """
+        تسجيل فشل مع اختيار المدة حسب نوعه
+        :param error: None فقط عندما تكون الاستجابة صالحة لكن النتيجة فارغة (غير موجود لمدة طويلة)؛
+                      أي استثناء (خطأ شبكة، خطأ HTTP مثل 5xx و 429، استجابة غير صالحة) يُعتبر عابرًا
+                      فيُسجل لمدة قصيرة ويُحذف عند عودة الاتصال
+        """
+        if error is None:
+            cls.remember(key, cls.NOT_FOUND_TTL, 'not_found')
+        else:
+            cls.remember(key, cls.UNREACHABLE_TTL, 'unreachable')
+    
+    @classmethod
+    def check(cls, key) -> Optional[str]:
+        """سبب الفشل المسجل إذا كان ما زال ساريًا، أو None"""
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del cls._entries[key]
+                return None
+            return entry[1]
+    
+    @classmethod
+    def forget(cls, key):
+        with cls._lock:
+            cls._entries.pop(key, None)
+    
+    @classmethod
+    def forget_unreachable(cls):
+        """حذف نتائج تعذر الوصول عند عودة الاتصال، مع الإبقاء على نتائج عدم الوجود"""
+        with cls._lock:
+            for key in [key for key, entry in cls._entries.items() if entry[1] == 'unreachable']:
+                del cls._entries[key]
+
+_session: Optional[requests.Session] = None
+# جلسة بدون إعادة محاولة على مستوى الاتصال للمستدعين الذين يحسبون كل محاولة بأنفسهم (مثل محدد معدل Nominatim)
+_plain_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _create_session(retries=RETRY_POLICY) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': USER_AGENT,
+        'Accept-Encoding': 'gzip, deflate',
+        'Accept': 'application/json',
+    })
+    return session
+
+def get_session(retries: bool = True) -> requests.Session:
+    """
+    الجلسة المشتركة على مستوى العملية (تُنشأ عند أول استخدام)
+    :param retries: False للجلسة التي لا تعيد إرسال الطلب تلقائيًا
+    """
+    global _session, _plain_session
+    if retries:
+        if _session is None:
+            with _session_lock:
+                if _session is None:
+                    _session = _create_session()
+                    logger.debug("تم إنشاء جلسة HTTP المشتركة")
+        return _session
+    if _plain_session is None:
+        with _session_lock:
+            if _plain_session is None:
+                _plain_session = _create_session(Retry(total=0, raise_on_status=False))
+    return _plain_session
+
+def parse_retry_after(value: Optional[str], default: float) -> float:
+    """مدة Retry-After بالثواني سواء كانت عددًا أو تاريخ HTTP، أو default إذا غابت أو كانت غير صالحة"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return default
+
+def _override_url(url: str) -> str:
+    """استبدال المضيف بالخادم البديل إذا كان محددًا (قواطع الدائرة والتخزين المؤقت تبقى على العنوان الأصلي)"""
+    if not API_BASE_OVERRIDE:
+        return url
+    base = urlsplit(API_BASE_OVERRIDE)
+    parts = urlsplit(url)
+    return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, parts.fragment))
+
+def request(method: str, url: str, timeout=None, respect_breaker: bool = True, retries: bool = True,
+            **kwargs) -> requests.Response:
+    """
+    إرسال طلب عبر الجلسة المشتركة مع المهلة الافتراضية إذا لم تحدد
+    يمر كل طلب عبر قاطع الدائرة الخاص بالمضيف، فيفشل فورًا بـ CircuitOpenError إذا كان مفتوحًا
+    :param respect_breaker: False لتجاوز القاطع المفتوح (مثل فحص حالة الاتصال)
+    :param retries: False لإرسال الطلب مرة واحدة بدون سياسة RETRY_POLICY
+    """
+    breaker = CircuitBreaker.for_url(url)
+    if respect_breaker:
+        breaker.before_call()
+    started = time.monotonic()
+    recorded = False
+    try:
+        try:
+            response = get_session(retries).request(method, _override_url(url), timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+        except requests.exceptions.RequestException as e:
+            recorded = True
+            breaker.record_failure(e)
+            raise
+        recorded = True
+        if response.status_code >= 500:
+            breaker.record_failure(requests.exceptions.HTTPError(f"HTTP {response.status_code}"))
+        else:
+            breaker.record_success(time.monotonic() - started)
+        return response
+    finally:
+        if not recorded:
+            # استثناء آخر (مثل خطأ في المعاملات): لا يبقى القاطع نصف المفتوح منتظرًا طلبًا تجريبيًا لن ينتهي
+            breaker.release_probe()
+
+def get(url: str, params: Optional[dict] = None, timeout=None, **kwargs) -> requests.Response:
+    return request('GET', url, params=params, timeout=timeout, **kwargs)
+
+def post(url: str, json=None, timeout=None, **kwargs) -> requests.Response:
+    return request('POST', url, json=json, timeout=timeout, **kwargs)
+
+def head(url: str, timeout=None, **kwargs) -> requests.Response:
+    return request('HEAD', url, timeout=timeout, **kwargs)
+
+def close():
+    """إغلاق الجلسة المشتركة وجميع اتصالاتها المفتوحة (عند إنهاء البرنامج)"""
+    global _session, _plain_session
+    with _session_lock:
+        for session in (_session, _plain_session):
+            if session is not None:
+                session.close()
+        _session = _plain_session = None
+
+
+# ملف التخزين المؤقت الدائم لاستجابات HTTP
+HTTP_CACHE_FILE = CACHE_DIR / "http_cache.sqlite3"
+
+class ResponseCache:
+    """
+    تخزين مؤقت دائم لاستجابات GET على القرص (SQLite)
+    يحترم Cache-Control (max-age و no-cache و no-store و stale-while-revalidate) ويحفظ
+    ETag و Last-Modified لإعادة التحقق بطلبات شرطية يرد عليها الخادم بـ 304 بدون محتوى
+    """
+    
+    _conn: Optional[sqlite3.Connection] = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def _connection(cls) -> sqlite3.Connection:
+        if cls._conn is None:
+            cls._conn = sqlite3.connect(HTTP_CACHE_FILE, check_same_thread=False)
+            cls._conn.execute("PRAGMA journal_mode=WAL")
+            cls._conn.execute("PRAGMA synchronous=NORMAL")
+            cls._conn.execute("""
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    body BLOB NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    stale_until REAL NOT NULL
+                )
+            """)
+        return cls._conn
+    
+    @classmethod
+    def get(cls, url: str) -> Optional[dict]:
+        """إدخال التخزين المؤقت لعنوان كامل (مع معاملاته) أو None"""
+        try:
+            with cls._lock:
+                row = cls._connection().execute(
+                    "SELECT etag, last_modified, body, stored_at, expires_at, stale_until FROM http_cache WHERE url = ?",
+                    (url,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في قراءة التخزين المؤقت لـ HTTP: {e}")
+            return None
+        if not row:
+            return None
+        etag, last_modified, body, stored_at, expires_at, stale_until = row
+        return {'etag': etag, 'last_modified': last_modified, 'body': body,
+                'stored_at': stored_at, 'expires_at': expires_at, 'stale_until': stale_until}
+    
+    @classmethod
+    def store(cls, url: str, response: requests.Response, default_ttl: float, previous: Optional[dict] = None) -> bool:
+        """
+        حفظ استجابة 200 أو تجديد صلاحية إدخال موجود بعد 304
+        :param previous: الإدخال المخزن سابقًا عند التجديد بعد 304 (محتواه ومعرفات التحقق الخاصة به)
+        :return: False إذا منع الخادم التخزين (no-store)
+        """
+        directives = _parse_cache_control(response.headers.get('Cache-Control', ''))
+        if 'no-store' in directives:
+            return False
+        now = time.time()
+        if 'no-cache' in directives:
+            ttl = 0
+        elif 'max-age' in directives:
+            ttl = directives['max-age'] - _response_age(response)
+        else:
+            ttl = default_ttl
+        # أقصى مدة لاستخدام النسخة القديمة مع إعادة التحقق في الخلفية
+        stale_window = directives.get('stale-while-revalidate', 0)
+        etag = response.headers.get('ETag') or (previous['etag'] if previous else None)
+        last_modified = response.headers.get('Last-Modified') or (previous['last_modified'] if previous else None)
+        body = previous['body'] if previous else response.content
+        try:
+            with cls._lock, cls._connection():
+                cls._conn.execute(
+                    "INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, etag, last_modified, body, now, now + max(ttl, 0), now + max(ttl, 0) + stale_window)
+                )
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في حفظ التخزين المؤقت لـ HTTP: {e}")
+        return True
+    
+    @classmethod
+    def prune(cls, max_age_days: int = 30) -> int:
+        """حذف الإدخالات التي لم تُجدد منذ مدة طويلة"""
+        try:
+            with cls._lock, cls._connection():
+                return cls._conn.execute(
+                    "DELETE FROM http_cache WHERE stored_at < ?", (time.time() - max_age_days * 86400,)
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في تنظيف التخزين المؤقت لـ HTTP: {e}")
+            return 0
+
+def _parse_cache_control(header: str) -> dict:
+    directives = {}
+    for part in header.split(','):
+        name, _, value = part.strip().partition('=')
+        name = name.lower()
+        if not name:
+            continue
+        if name in ('max-age', 'stale-while-revalidate', 'stale-if-error'):
+            try:
+                directives[name] = int(value.strip('"'))
+            except ValueError:
+                continue
+        else:
+            directives[name] = True
+    return directives
+
+def _response_age(response: requests.Response) -> float:
+    """عمر الاستجابة عند وصولها (ترويسة Age من الوسطاء أو الفرق عن Date)"""
+    try:
+        if 'Age' in response.headers:
+            return float(response.headers['Age'])
+        if 'Date' in response.headers:
+            return max(0.0, time.time() - parsedate_to_datetime(response.headers['Date']).timestamp())
+    except (TypeError, ValueError):
+        pass
+    return 0.0
+
+def _cache_url(url: str, params: Optional[dict]) -> str:
+    return requests.Request('GET', url, params=params).prepare().url
+
+def _revalidate(url: str, cache_key: str, entry: Optional[dict], timeout, default_ttl: float) -> bytes:
+    """طلب شرطي للخادم وتحديث التخزين المؤقت؛ يعيد المحتوى الحالي"""
+    headers = {}
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    response = get(cache_key, timeout=timeout, headers=headers)
+    if response.status_code == 304 and entry:
+        logger.debug(f"لم يتغير المحتوى (304): {url}")
+        ResponseCache.store(cache_key, response, default_ttl, previous=entry)
+        return entry['body']
+    response.raise_for_status()
+    ResponseCache.store(cache_key, response, default_ttl)
+    return response.content
+
+def get_json(url: str, params: Optional[dict] = None, timeout=None, default_ttl: float = 0,
+             revalidate: bool = False) -> Any:
+    """
+    طلب GET لاستجابة JSON عبر التخزين المؤقت الدائم
+    - النسخة الصالحة تعاد بدون أي طلب شبكة
+    - النسخة المنتهية تُعاد التحقق منها بطلب شرطي (If-None-Match / If-Modified-Since)
+    - داخل نافذة stale-while-revalidate تعاد النسخة القديمة فورًا ويتم التحقق في الخلفية
+    :param default_ttl: مدة الصلاحية بالثواني إذا لم يحدد الخادم max-age
+    :param revalidate: التحقق من الخادم حتى لو كانت النسخة المخزنة صالحة (التحديث اليدوي)
+    """
+    cache_key = _cache_url(url, params)
+    entry = ResponseCache.get(cache_key)
+    now = time.time()
+    if revalidate:
+        return json.loads(_flights.do(cache_key, _revalidate, url, cache_key, entry, timeout, default_ttl))
+    if entry and now < entry['expires_at']:
+        return json.loads(entry['body'])
+    if entry and now < entry['stale_until']:
+        threading.Thread(target=_background_revalidate, args=(url, cache_key, entry, timeout, default_ttl), daemon=True).start()
+        return json.loads(entry['body'])
+    # المستدعون المتزامنون لنفس العنوان يشتركون في طلب شبكة واحد
+    return json.loads(_flights.do(cache_key, _revalidate, url, cache_key, entry, timeout, default_ttl))
+
+def _background_revalidate(url: str, cache_key: str, entry: dict, timeout, default_ttl: float):
+    try:
+        _flights.do(cache_key, _revalidate, url, cache_key, entry, timeout, default_ttl)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"تعذر إعادة التحقق في الخلفية من {url}: {e}")
+
+def get_cached_json(url: str, params: Optional[dict] = None) -> Any:
+    """آخر نسخة مخزنة لاستجابة بغض النظر عن صلاحيتها (لوضع عدم الاتصال) أو None"""
+    entry = ResponseCache.get(_cache_url(url, params))
+    return json.loads(entry['body']) if entry else None
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+load_harness.py
+أداة قياس لمسارات الشبكة في البرنامج عبر الخادم البديل (mock_api_server.py) بدون إنترنت
+تشغل robust_api_call و get_countries و get_cities و get_coordinates_for_city بالتوازي
+وتعرض توزيع زمن الاستجابة (النسب المئوية) وعدد إعادة المحاولات وحالة قواطع الدائرة
+
+أمثلة:
+    python load_harness.py --requests 200 --concurrency 8
+    python load_harness.py --scenario timings --latency 200 --jitter 100 --error-rate 0.2
+    python load_harness.py --scenario geocode --rate-limit 1 --json report.json
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import http_client
+import data_manager
+from circuit_breaker import CircuitBreaker
+from mock_api_server import MockApiServer, MockConfig, COUNTRIES_FILE
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ('timings', 'calendar', 'countries', 'cities', 'geocode')
+
+def isolate_caches(work_dir: Path):
+    """توجيه جميع ملفات التخزين المؤقت إلى مجلد مؤقت حتى لا تتأثر بيانات المستخدم ولا تؤثر على القياس"""
+    http_client.HTTP_CACHE_FILE = work_dir / 'http_cache.sqlite3'
+    http_client.ResponseCache._conn = None
+    data_manager.CITIES_CACHE_DIR = work_dir / 'cities_cache'
+    data_manager.CITIES_CACHE_DIR.mkdir(exist_ok=True)
+    # بدون ملفات المدن المرفقة حتى يمر get_cities بمسار الشبكة
+    data_manager.WORLD_CITIES_DIR = work_dir / 'no_world_cities'
+    data_manager.COORDINATES_CACHE_FILE = work_dir / 'coordinates_cache.json'
+    data_manager.COORDINATES_JOURNAL_FILE = work_dir / 'coordinates_cache.journal'
+    data_manager.CoordinatesIndex._entries = {}
+    data_manager.BundledCoordinates._index = {}
+
+def sample_places(count: int) -> list[tuple[str, str]]:
+    """أزواج (مدينة، دولة) من البيانات المرفقة بالتناوب بين الدول"""
+    with open(COUNTRIES_FILE, 'r', encoding='utf-8') as f:
+        countries = [english for english, _ in json.load(f)]
+    places = []
+    for country in countries:
+        country_file = Path(__file__).parent / 'Countries&Cities' / f"{country}.json"
+        if country_file.exists():
+            with open(country_file, 'r', encoding='utf-8') as f:
+                cities = json.load(f)
+            places.extend((city['english_name'], country) for city in cities[:3])
+        if len(places) >= count:
+            break
+    return places[:count]
+
+def build_calls(scenario: str, count: int, method: int) -> list:
+    """قائمة الاستدعاءات (دوال بدون معاملات) لسيناريو معين"""
+    places = sample_places(count)
+    today = date.today()
+    if scenario == 'timings':
+        from main_app_ui import EnhancedPrayerTimesApp
+        url = f"http://api.aladhan.com/v1/timingsByCity/{today:%d-%m-%Y}"
+        # cache_ttl=0 حتى يُعاد التحقق من كل استجابة بطلب شرطي بدلاً من إعادتها من التخزين المؤقت
+        return [lambda c=city, k=country: EnhancedPrayerTimesApp.robust_api_call(
+                    url, {'city': c, 'country': k, 'method': method}, cache_ttl=0)
+                for city, country in places]
+    if scenario == 'calendar':
+        from main_app_ui import EnhancedPrayerTimesApp
+        url = f"http://api.aladhan.com/v1/calendarByCity/{today.year}/{today.month}"
+        return [lambda c=city, k=country: EnhancedPrayerTimesApp.robust_api_call(
+                    url, {'city': c, 'country': k, 'method': method}, cache_ttl=0)
+                for city, country in places]
+    if scenario == 'countries':
+        return [data_manager.get_countries for _ in range(count)]
+    if scenario == 'cities':
+        return [lambda k=country: data_manager.get_cities(k) for _, country in places]
+    if scenario == 'geocode':
+        return [lambda c=city, k=country: data_manager.get_coordinates_for_city(c, k) for city, country in places]
+    raise ValueError(scenario)
+
+def run_scenario(server: MockApiServer, scenario: str, count: int, concurrency: int, method: int) -> dict:
+    """تشغيل سيناريو واحد وإرجاع إحصائياته"""
+    calls = build_calls(scenario, count, method)
+    server.reset_stats()
+    http_client.RetryCounters.reset()
+    latencies = []
+    failures = 0
+
+    def timed(call):
+        started = time.perf_counter()
+        try:
+            ok = call() is not None
+        except Exception as e:
+            logger.debug(f"فشل استدعاء {scenario}: {e}")
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, ok in pool.map(timed, calls):
+            latencies.append(latency * 1000)
+            failures += 0 if ok else 1
+    elapsed = time.perf_counter() - started
+
+    server_requests = sum(server.stats.values())
+    return {
+        'scenario': scenario,
+        'calls': len(calls),
+        'failures': failures,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(len(calls) / elapsed, 2) if elapsed else None,
+        'latency_ms': percentiles(latencies),
+        'server_requests': server_requests,
+        # المحاولات الإضافية للتطبيق (robust_api_call وطابور Nominatim) وإعادة الإرسال من urllib3
+        'retries': http_client.RetryCounters.snapshot(),
+        'status_counts': dict(server.status_counts),
+    }
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    if len(values) == 1:
+        return {'p50': round(values[0], 1), 'p90': round(values[0], 1), 'p99': round(values[0], 1), 'max': round(values[0], 1)}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50': round(cuts[49], 1), 'p90': round(cuts[89], 1), 'p99': round(cuts[98], 1), 'max': round(max(values), 1)}
+
+def print_report(results: list[dict]):
+    print(f"{'scenario':<10} {'calls':>6} {'fail':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'srv req':>8} "
+          f"{'app rtr':>8} {'net rtr':>8}")
+    for result in results:
+        lat = result['latency_ms']
+        print(f"{result['scenario']:<10} {result['calls']:>6} {result['failures']:>5} "
+              f"{lat.get('p50', 0):>8} {lat.get('p90', 0):>8} {lat.get('p99', 0):>8} {lat.get('max', 0):>8} "
+              f"{result['server_requests']:>8} {result['retries']['application']:>8} {result['retries']['transport']:>8}")
+    for stats in CircuitBreaker.health_report():
+        print(f"breaker {stats['host']}: state={stats['state']} successes={stats['successes']} "
+              f"failures={stats['failures']} rejected={stats['rejected']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="قياس مسارات الشبكة عبر الخادم البديل")
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="السيناريوهات (الافتراضي: جميعها)")
+    parser.add_argument('--requests', type=int, default=50, help="عدد الاستدعاءات لكل سيناريو")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--method', type=int, default=5, help="طريقة الحساب المرسلة إلى Aladhan")
+    parser.add_argument('--latency', type=float, default=50, help="زمن استجابة الخادم بالمللي ثانية")
+    parser.add_argument('--jitter', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0)
+    parser.add_argument('--geocode-rate', type=float, default=data_manager.NominatimQueue.RATE,
+                        help="معدل طابور Nominatim (طلب/ثانية)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', type=Path, help="حفظ التقرير بصيغة JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        isolate_caches(Path(work_dir))
+        data_manager.NominatimQueue._bucket = data_manager.TokenBucket(args.geocode_rate)
+        config = MockConfig(args.latency, args.jitter, args.error_rate, args.drop_rate, args.rate_limit, seed=args.seed)
+        server = MockApiServer(config).start()
+        http_client.API_BASE_OVERRIDE = server.base_url
+        try:
+            results = [run_scenario(server, scenario, args.requests, args.concurrency, args.method)
+                       for scenario in (args.scenario or SCENARIOS)]
+        finally:
+            server.stop()
+            http_client.close()
+
+    print_report(results)
+    if args.json:
+        report = {'results': results, 'breakers': CircuitBreaker.health_report()}
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
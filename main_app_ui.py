@@ -10,7 +10,6 @@ from tkinter import ttk, messagebox
 import requests
 from datetime import datetime, timedelta
 import time
-import re
 import logging
 from concurrent.futures import ThreadPoolExecutor
 import threading
@@ -42,8 +41,17 @@ def _import_pystray_and_pil():
 
 from config import Translator
 from settings_manager import Settings
-from data_manager import CacheManager, get_countries, get_cities
-from prayer_logic import TimeSync
+import http_client
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from async_fetcher import AsyncFetcher
+from data_manager import CacheManager, get_countries, get_cities, get_cached_coordinates, save_coordinates
+from prayer_logic import TimeSync, PrayerTimesCalculator
+from clock import Clock, get_clock
+from prayer_day import PrayerDay
+from prayer_scheduler import PrayerEvent, PrayerScheduler
+from prayer_window import PrayerWindow
+from prayer_timeline import PrayerTimeline
+from timer_service import TimerService
 from media_manager import AdhanPlayer, NotificationManager, NOTIFICATIONS_AVAILABLE
 from ui_components import SettingsDialog
 from qibla_ui import QiblaWidget
@@ -54,9 +62,16 @@ logger = logging.getLogger(__name__)
 
 class EnhancedPrayerTimesApp:
     """تطبيق مواقيت الصلاة"""
-    def __init__(self, version):
+
+    # فترة تحديث العد التنازلي وحالة الصلوات أثناء إخفاء النافذة (بالثواني)
+    HIDDEN_UPDATE_INTERVAL = 300
+    # عدد الأيام بعد اليوم التي تُحمّل مواقيتها مسبقًا في الذاكرة (من التخزين المؤقت أو الحساب المحلي)
+    WINDOW_DAYS_AHEAD = 2
+    def __init__(self, version, clock: Clock = None):
         self.root = tk.Tk()
-        self.version = version        
+        self.version = version
+        # مصدر الوقت لجميع المسارات المعتمدة على الوقت (VirtualClock للمحاكاة)
+        self.clock = clock or get_clock()
         
         # تهيئة المكونات
         self.settings = Settings()
@@ -70,7 +85,7 @@ class EnhancedPrayerTimesApp:
             logger.warning("لم يتم العثور على pray_times.ico، الاستمرار بدون أيقونة")
         self.root.geometry("850x1000")
 
-        self.cache_manager = CacheManager()
+        self.cache_manager = CacheManager(self.clock)
         self.adhan_player = AdhanPlayer()
         self.notification_manager = NotificationManager(self.settings, self.translator)
         
@@ -79,13 +94,18 @@ class EnhancedPrayerTimesApp:
         self.setup_modern_theme()
         
         self.prayer_data = {}
+        # مواقيت اليوم والأيام التالية للمدينة المعروضة (للانتقال عند منتصف الليل بدون شبكة)
+        self.prayer_window = None
         self.cities = []
         self.countries = []
         self.current_city = ""
         self.current_country = ""
         self.is_online = True
         self.executor = ThreadPoolExecutor(max_workers=3)
-        self.last_notification_time = {}
+        self.fetcher = AsyncFetcher(self.root)
+        # مؤقت Tk واحد لجميع الحلقات الدورية (العد التنازلي، التحديث، فحص الاتصال، أحداث الأذان)
+        self.timers = TimerService(self.root, self.clock)
+        self.prayer_scheduler = PrayerScheduler(self.timers, self.clock, self.handle_prayer_event, on_day_change=self._on_new_day)
         self.running = True
         
         # طباعة إعدادات التشخيص
@@ -212,7 +232,7 @@ class EnhancedPrayerTimesApp:
         time_container = tk.Frame(time_card, bg=self.colors['bg_card'], pady=10)
         time_container.pack(fill='x')
         
-        current_time = datetime.now()
+        current_time = self.clock.now()
         time_str = current_time.strftime("%H:%M:%S")
         date_str = current_time.strftime("%Y-%m-%d")
         
@@ -356,79 +376,217 @@ class EnhancedPrayerTimesApp:
         self.last_update_label.pack(fill='x', expand=True)
     
     def load_initial_data(self):
-        """تحميل البيانات الأولية"""
-        def task():
-            self.countries = get_countries()
-            if self.settings.selected_country and self.settings.selected_city:
-                self.cities = get_cities(self.settings.selected_country)
-                self.fetch_and_display_times(self.settings.selected_city, self.settings.selected_country)
-            else:
-                self.root.after(0, lambda: self.show_error(self._("please_select_city_country")))
+        """تحميل البيانات الأولية (الدول والمدن والمواقيت بالتوازي)"""
+        def set_countries(countries):
+            self.countries = countries
 
-        self.executor.submit(task)
+        def set_cities(cities):
+            self.cities = cities
+
+        self.fetcher.submit('restcountries.com', get_countries, on_success=set_countries)
+        if self.settings.selected_country and self.settings.selected_city:
+            self.fetcher.submit('countriesnow.space', get_cities, self.settings.selected_country, on_success=set_cities)
+            self.fetch_and_display_times(self.settings.selected_city, self.settings.selected_country)
+        else:
+            self.show_error(self._("please_select_city_country"))
     
-    def fetch_and_display_times(self, city: str, country: str):
-        """جلب وعرض مواقيت الصلاة"""
+    def fetch_and_display_times(self, city: str, country: str, revalidate: bool = False):
+        """
+        جلب وعرض مواقيت الصلاة
+        :param revalidate: تجاوز التخزين المؤقت لـ HTTP بطلب شرطي للخادم (التحديث اليدوي)
+        """
         self.show_loading()
         
+        calc_key = self.settings.calculation_key()
+        today = self.clock.today()
+
         def api_task():
+            local_data = None
             try:
-                cached_data = self.cache_manager.load_data(city, country)
+                cached_data = self.cache_manager.load_data(city, country, calc_key, today)
                 if cached_data:
                     city_data = self.parse_api_data(city, cached_data)
-                    self.root.after(0, lambda: self.display_prayer_times(city_data))
+                    self.fetcher.dispatch(lambda: self.display_prayer_times(city_data))
                     logger.info(f"تم استخدام البيانات المؤقتة لـ {city}")
+                    self.ensure_prefetch_window(city, country)
                     return
                 
-                url = f"http://api.aladhan.com/v1/timingsByCity"
-                params = {'city': city, 'country': country, 'method': self.settings.calculation_method}
+                # الحساب المحلي أولاً للعرض الفوري بدون انتظار الشبكة
+                local_data = self.calculate_local_times(city, country)
+                if local_data:
+                    local_city_data = self.parse_api_data(city, local_data)
+                    self.fetcher.dispatch(lambda: self.display_prayer_times(local_city_data))
+                    logger.info(f"تم عرض المواقيت المحسوبة محليًا لـ {city}")
                 
-                response = self.robust_api_call(url, params)
+                # جلب الشهر (أو السنة) كاملاً في طلب واحد وتقسيمه إلى أيام في التخزين المؤقت
+                try:
+                    month = None if self.settings.prefetch_mode == 'year' else today.month
+                    saved_days = self.prefetch_calendar(city, country, today.year, month, revalidate=revalidate)
+                except Exception as e:
+                    logger.warning(f"فشل جلب التقويم لـ {city}، سيتم جلب اليوم فقط: {e}")
+                    saved_days = 0
+                api_data = self.cache_manager.load_data(city, country, self.settings.calculation_key(), today) if saved_days else None
+                
+                if api_data is None:
+                    # التاريخ في المسار حتى لا تُعاد استجابة يوم سابق من التخزين المؤقت للاستجابات
+                    url = f"http://api.aladhan.com/v1/timingsByCity/{today:%d-%m-%Y}"
+                    params = {'city': city, 'country': country, **self.settings.calculation_api_params()}
+                    response = self.robust_api_call(url, params, revalidate=revalidate)
+                    response_day = None
+                    if response and response.get('code') == 200:
+                        response_day = response['data'].get('date', {}).get('gregorian', {}).get('date')
+                    if response_day == f"{today:%d-%m-%Y}":
+                        api_data = response['data']
+                        self.cache_manager.save_data(city, country, api_data, self.settings.calculation_key(), today)
+                    else:
+                        if response_day is not None:
+                            logger.warning(f"تجاهل مواقيت {city} ليوم {response_day} بدلاً من {today}")
+                        if not local_data:
+                            if response_day is not None:
+                                error_msg = self._("failed_to_fetch_data")
+                            else:
+                                error_msg = response.get('data', self._("failed_to_fetch_data")) if response else self._("no_server_response")
+                            self.fetcher.dispatch(lambda: self.show_error(error_msg))
                 
-                if response and response.get('code') == 200:
-                    api_data = response['data']
+                if api_data is not None:
+                    self._cross_check_local_times(city, local_data, api_data)
                     city_data = self.parse_api_data(city, api_data)
                     
-                    self.cache_manager.save_data(city, country, api_data)
+                    meta = api_data.get('meta', {})
+                    if meta.get('latitude') is not None and meta.get('longitude') is not None:
+                        save_coordinates(city, country, meta['latitude'], meta['longitude'], meta.get('timezone', ''))
                     
-                    self.root.after(0, lambda: self.display_prayer_times(city_data))
-                    self.root.after(0, lambda: self.update_last_update_time())
-                else:
-                    error_msg = response.get('data', self._("failed_to_fetch_data")) if response else self._("no_server_response")
-                    self.root.after(0, lambda: self.show_error(error_msg))
+                    self.fetcher.dispatch(lambda: self.display_prayer_times(city_data))
+                    self.fetcher.dispatch(lambda: self.update_last_update_time())
+                    self.ensure_prefetch_window(city, country)
                 
             except Exception as e:
                 logger.error(f"خطأ في جلب البيانات {e}")
-                self.root.after(0, lambda: self.show_error(self._("connection_error", e=str(e))))
+                if not local_data:
+                    self.fetcher.dispatch(lambda: self.show_error(self._("connection_error", e=str(e))))
             finally:
-                self.root.after(0, self.hide_loading)
-        
-        self.executor.submit(api_task)
+                self.fetcher.dispatch(self.hide_loading)
+                window = self._build_window(city, country, calc_key, today)
+                self.fetcher.dispatch(lambda: self._set_window(window))
+        
+        # عملية جلب جديدة للمواقيت تلغي السابقة (مثل تغيير المدينة قبل اكتمال الطلب)،
+        # أما تكرار الطلب نفسه أثناء تنفيذه (عودة الاتصال، حفظ الإعدادات) فيُدمج معه؛
+        # التحديث اليدوي لا يُدمج مع جلب قد يُخدم من التخزين المؤقت
+        request_key = (city, country, self.settings.calculation_key(), revalidate)
+        self.fetcher.submit('api.aladhan.com', api_task, tag='timings', key=request_key)
     
-    # تخزين مؤقت للاستجابات السابقة لتحسين الأداء
-    _api_response_cache = {}
-    _MAX_CACHE_SIZE = 20
+    # أقل عدد من الأيام القادمة المخزنة مؤقتًا قبل جلب الشهر التالي
+    PREFETCH_MIN_DAYS = 7
     
-    def robust_api_call(self, url: str, params: dict, retries: int = 3, cache_ttl: int = 3600):
+    def prefetch_calendar(self, city: str, country: str, year: int, month=None, revalidate: bool = False) -> int:
+        """
+        جلب مواقيت شهر كامل (أو سنة كاملة إذا لم يحدد الشهر) في طلب واحد عبر calendarByCity
+        وتقسيمها إلى ملفات مؤقتة لكل يوم
+        :return: عدد الأيام التي تم حفظها
         """
-        استدعاء API مع إعادة المحاولة وتحسين معالجة الأخطاء وتخزين مؤقت ذكي
+        url = f"http://api.aladhan.com/v1/calendarByCity/{year}" + (f"/{month}" if month else "")
+        params = {'city': city, 'country': country, **self.settings.calculation_api_params()}
+        response = self.robust_api_call(url, params, revalidate=revalidate)
+        if not response or response.get('code') != 200:
+            raise ValueError(response.get('data', self._("failed_to_fetch_data")) if response else self._("no_server_response"))
+        
+        days_data = response['data']
+        if isinstance(days_data, dict):
+            # الاستجابة السنوية مقسمة حسب رقم الشهر
+            days_data = [day for month_key in sorted(days_data, key=int) for day in days_data[month_key]]
+        return self.cache_manager.save_calendar(city, country, days_data, self.settings.calculation_key())
+    
+    def ensure_prefetch_window(self, city: str, country: str):
+        """جلب الشهر التالي مسبقًا فقط عندما يقل عدد الأيام القادمة المخزنة عن الحد الأدنى"""
+        days_ahead = self.cache_manager.cached_days_ahead(city, country, self.settings.calculation_key(), self.PREFETCH_MIN_DAYS)
+        if days_ahead >= self.PREFETCH_MIN_DAYS:
+            return
+        first_missing_day = self.clock.today() + timedelta(days=days_ahead)
+        try:
+            month = None if self.settings.prefetch_mode == 'year' else first_missing_day.month
+            self.prefetch_calendar(city, country, first_missing_day.year, month)
+        except Exception as e:
+            logger.warning(f"تعذر الجلب المسبق لمواقيت {city} بدءًا من {first_missing_day}: {e}")
+    
+    def _build_window(self, city: str, country: str, calc_key: tuple, today) -> PrayerWindow:
+        """
+        تحميل مواقيت اليوم والأيام التالية من التخزين المؤقت بقراءة واحدة، والأيام غير المخزنة تُحسب محليًا
+        مع سجل الأمس لعشائه الذي قد يقع بعد منتصف الليل (يُستدعى من خيط الجلب فقط)
+        """
+        window = PrayerWindow(city, country, calc_key)
+        first_day = today - timedelta(days=1)
+        last_day = today + timedelta(days=self.WINDOW_DAYS_AHEAD)
+        cached = self.cache_manager.load_range(city, country, calc_key, first_day, last_day)
+        day = first_day
+        while day <= last_day:
+            data = cached.get(day) or self.calculate_local_times(city, country, day)
+            if data:
+                window.put(PrayerDay.from_api(data, fallback_day=day))
+            day += timedelta(days=1)
+        logger.info(f"نافذة المواقيت لـ {city}: {window.days_ahead(today)} يوم بدءًا من {today}")
+        return window
+
+    def _set_window(self, window: PrayerWindow):
+        """اعتماد نافذة المواقيت إذا كانت ما تزال للمدينة والمعاملات الحالية، ثم جدولة أحداث اليوم والتالي"""
+        if not window.matches(self.settings.selected_city, self.settings.selected_country, self.settings.calculation_key()):
+            return
+        self.prayer_window = window
+        self.schedule_prayer_events()
+
+    def _extend_window(self, city: str, country: str, calc_key: tuple, today) -> PrayerWindow:
+        """بعد منتصف الليل في الخلفية: جلب الشهر التالي عند الحاجة ثم إعادة بناء النافذة حتى آخر يوم فيها"""
+        self.ensure_prefetch_window(city, country)
+        return self._build_window(city, country, calc_key, today)
+
+    def calculate_local_times(self, city: str, country: str, day=None):
+        """
+        حساب مواقيت يوم (اليوم افتراضيًا) محليًا إذا كانت إحداثيات المدينة معروفة مسبقًا
+        :return: بيانات بنفس بنية Aladhan API أو None إذا لم تتوفر الإحداثيات
+        """
+        coordinates = get_cached_coordinates(city, country)
+        if not coordinates:
+            return None
+        lat, lon, timezone_name = coordinates
+        try:
+            adjustments = {
+                name: self.settings.prayer_adjustments.get(name.lower(), 0)
+                for name in PrayerTimesCalculator.PRAYER_NAMES
+            }
+            return PrayerTimesCalculator.build_day_data(
+                lat, lon, day or self.clock.today(), self.settings.calculation_method, timezone_name,
+                asr_factor=self.settings.asr_school + 1, adjustments=adjustments
+            )
+        except Exception as e:
+            logger.error(f"خطأ في الحساب المحلي لمواقيت {city}: {e}")
+            return None
+    
+    def _cross_check_local_times(self, city: str, local_data, api_data: dict):
+        """مقارنة المواقيت المحسوبة محليًا مع استجابة API وتسجيل الفروق الكبيرة"""
+        if not local_data:
+            return
+        for name, local_time in local_data['timings'].items():
+            api_time = api_data['timings'].get(name, '').split(' ')[0]
+            try:
+                local_dt = datetime.strptime(local_time, "%H:%M")
+                api_dt = datetime.strptime(api_time, "%H:%M")
+            except ValueError:
+                continue
+            # الفرق على مدار اليوم: 23:59 و 00:01 بينهما دقيقتان لا 1438 دقيقة
+            diff_minutes = abs((local_dt.hour - api_dt.hour) * 60 + local_dt.minute - api_dt.minute) % 1440
+            if min(diff_minutes, 1440 - diff_minutes) > 2:
+                logger.warning(f"فرق بين الحساب المحلي و API لـ {city} في {name}: {local_time} / {api_time}")
+    
+    @staticmethod
+    def robust_api_call(url: str, params: dict, retries: int = 3, cache_ttl: int = 3600, revalidate: bool = False):
+        """
+        استدعاء API مع إعادة المحاولة وتحسين معالجة الأخطاء وتخزين مؤقت دائم على القرص
         :param url: عنوان URL للـ API
         :param params: معاملات الطلب
         :param retries: عدد محاولات إعادة المحاولة
-        :param cache_ttl: مدة صلاحية التخزين المؤقت بالثواني (الافتراضي: ساعة واحدة)
+        :param cache_ttl: مدة صلاحية التخزين المؤقت بالثواني إذا لم يحددها الخادم (الافتراضي: ساعة واحدة)
+        :param revalidate: طلب شرطي للخادم حتى لو كانت النسخة المخزنة صالحة (التحديث اليدوي)
         :return: استجابة API كـ JSON أو None في حالة الفشل
         """
-        # إنشاء مفتاح للتخزين المؤقت
-        cache_key = f"{url}:{str(sorted(params.items()))}"
-        current_time = time.time()
-        
-        # التحقق من التخزين المؤقت
-        if cache_key in self._api_response_cache:
-            cached_data, timestamp = self._api_response_cache[cache_key]
-            if current_time - timestamp < cache_ttl:
-                logger.debug(f"استخدام استجابة مخزنة مؤقتًا لـ {url}")
-                return cached_data
-        
         # استراتيجية التأخير التدريجي
         backoff_strategy = [1, 2, 5, 10, 20]  # بالثواني
         last_exception = None
@@ -436,30 +594,22 @@ class EnhancedPrayerTimesApp:
         
         # محاولات الاتصال مع إعادة المحاولة
         for attempt in range(retries):
+            if attempt:
+                http_client.RetryCounters.add('application')
             try:
                 # استخدام مهلة أقصر للمحاولات اللاحقة لتسريع فشل الاتصال
                 timeout = max(3, 10 - attempt * 2)
                 
                 logger.info(f"إرسال طلب {url} (المحاولة {attempt+1}/{retries}، مهلة={timeout}ث)")
                 
-                response = requests.get(url, params=params, timeout=timeout)
-                response.raise_for_status()  # إثارة استثناء للرموز 4xx/5xx
-                
-                json_response = response.json()
+                # النسخة الصالحة تعاد من التخزين المؤقت، والمنتهية يعاد التحقق منها بطلب شرطي
+                json_response = http_client.get_json(url, params=params, timeout=(min(timeout, 5), timeout),
+                                                     default_ttl=cache_ttl, revalidate=revalidate)
                 
                 # التحقق من صحة البيانات (يمكن أن تختلف حسب API المستخدم)
                 if not json_response or not isinstance(json_response, dict):
                     raise ValueError("استجابة API غير صالحة")
                 
-                # تخزين النتيجة الناجحة في التخزين المؤقت
-                self._api_response_cache[cache_key] = (json_response, current_time)
-                
-                # إزالة العناصر القديمة من التخزين المؤقت إذا تجاوز الحجم المسموح به
-                if len(self._api_response_cache) > self._MAX_CACHE_SIZE:
-                    oldest_key = min(self._api_response_cache.keys(), 
-                                     key=lambda k: self._api_response_cache[k][1])
-                    del self._api_response_cache[oldest_key]
-                
                 return json_response
                 
             except requests.exceptions.Timeout as e:
@@ -474,6 +624,10 @@ class EnhancedPrayerTimesApp:
                 error_details.append(error_msg)
                 logger.warning(f"خطأ في اتصال API (المحاولة {attempt+1}/{retries}): {error_msg}")
                 
+                # القاطع مفتوح لهذا المضيف، فلا فائدة من الانتظار وإعادة المحاولة
+                if isinstance(e, CircuitOpenError):
+                    break
+                
             except requests.exceptions.HTTPError as e:
                 error_msg = f"خطأ HTTP {e.response.status_code}: {str(e)}"
                 last_exception = e
@@ -490,6 +644,11 @@ class EnhancedPrayerTimesApp:
                 error_details.append(error_msg)
                 logger.warning(f"خطأ غير متوقع في API (المحاولة {attempt+1}/{retries}): {error_msg}")
             
+            # إذا فُتح القاطع بعد هذا الفشل يتم الرجوع إلى التخزين المؤقت فورًا بدون انتظار
+            if not CircuitBreaker.for_url(url).available():
+                logger.warning(f"المضيف غير متاح حاليًا، تخطي المحاولات المتبقية لـ {url}")
+                break
+            
             # الانتظار قبل إعادة المحاولة باستخدام استراتيجية التأخير التدريجي
             if attempt < retries - 1:
                 backoff_time = backoff_strategy[min(attempt, len(backoff_strategy)-1)]
@@ -497,9 +656,10 @@ class EnhancedPrayerTimesApp:
                 time.sleep(backoff_time)
         
         # إرجاع بيانات مخزنة مؤقتًا قديمة إذا كانت متوفرة (في حالة عدم الاتصال)
-        if cache_key in self._api_response_cache:
+        stale_response = http_client.get_cached_json(url, params)
+        if stale_response is not None:
             logger.warning("استخدام بيانات مخزنة سابقًا منتهية الصلاحية (وضع عدم الاتصال)")
-            return self._api_response_cache[cache_key][0]
+            return stale_response
         
         # تسجيل الخطأ النهائي
         error_summary = "; ".join(error_details)
@@ -513,49 +673,8 @@ class EnhancedPrayerTimesApp:
     
     
     def parse_api_data(self, city: str, data: dict):
-        """تحليل البيانات من API"""
-        timings = data['timings']
-        
-        def format_time(time_24: str) -> tuple:
-            """تنسيق الوقت مع معالجة أفضل للأخطاء"""
-            try:
-                time_clean = time_24.split(' ')[0]
-                dt_object = datetime.strptime(time_clean, "%H:%M")
-                time_12 = dt_object.strftime("%I:%M").lstrip('0')
-                if not time_12.startswith('1'):
-                    time_12 = time_12.lstrip('0')
-                
-                if self.settings.language == 'ar':
-                    period = "ص" if dt_object.hour < 12 else "م"
-                else:
-                    period = "AM" if dt_object.hour < 12 else "PM"
-                
-                return time_12, period, f"{time_12} {period}"
-            except Exception as e:
-                logger.error(f"خطأ في تنسيق الوقت {time_24} {e}")
-                return "00:00", "ص" if self.settings.language == 'ar' else 'AM', "00:00 ص" if self.settings.language == 'ar' else '00:00 AM'
-        
-        prayer_names = ['fajr', 'sunrise', 'dhuhr', 'asr', 'maghrib', 'isha']
-        api_names = ['Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Maghrib', 'Isha']
-        
-        prayers = {}
-        for prayer, api_name in zip(prayer_names, api_names):
-            prayers[prayer] = format_time(timings[api_name])
-        
-        hijri_month_key = 'ar' if self.settings.language == 'ar' else 'en'
-        self.prayer_data[city] = {
-            'gregorian_date': data['date']['gregorian']['date'],
-            'hijri_date': f"{data['date']['hijri']['day']} {data['date']['hijri']['month'][hijri_month_key]} {data['date']['hijri']['year']}",
-            'timezone': data.get('meta', {}).get('timezone', ''),
-            'method': data.get('meta', {}).get('method', {}).get('name', ''),
-            'latitude': data.get('meta', {}).get('latitude', 0),
-            'longitude': data.get('meta', {}).get('longitude', 0)
-        }
-        
-        for name, (time_val, period_val, orig_val) in prayers.items():
-            self.prayer_data[city][f'{name}_time'] = time_val
-            self.prayer_data[city][f'{name}_period'] = period_val
-            self.prayer_data[city][f'{name}_orig'] = orig_val
+        """تحليل البيانات من API إلى سجل PrayerDay (التنسيق للعرض يتم عند رسم الجدول)"""
+        self.prayer_data[city] = PrayerDay.from_api(data, fallback_day=self.clock.today())
         return self.prayer_data[city]
     
     def display_prayer_times(self, city_data):
@@ -598,13 +717,10 @@ class EnhancedPrayerTimesApp:
         for i, (col_name, width, anchor) in enumerate(columns):
             self.table_frame.grid_columnconfigure(i, weight=1, minsize=width)
         
+        icons = {'fajr': '🌅', 'sunrise': '🌄', 'dhuhr': '☀️', 'asr': '🌤️', 'maghrib': '🌅', 'isha': '🌙'}
         prayers_data = [
-            (city_data['fajr_orig'], city_data['fajr_period'], city_data['fajr_time'], self._('fajr'), '🌅'),
-            (city_data['sunrise_orig'], city_data['sunrise_period'], city_data['sunrise_time'], self._('sunrise'), '🌄'),
-            (city_data['dhuhr_orig'], city_data['dhuhr_period'], city_data['dhuhr_time'], self._('dhuhr'), '☀️'),
-            (city_data['asr_orig'], city_data['asr_period'], city_data['asr_time'], self._('asr'), '🌤️'),
-            (city_data['maghrib_orig'], city_data['maghrib_period'], city_data['maghrib_time'], self._('maghrib'), '🌅'),
-            (city_data['isha_orig'], city_data['isha_period'], city_data['isha_time'], self._('isha'), '🌙')
+            city_data.format_time(key, self.settings.language) + (self._(key), icons[key])
+            for key in PrayerDay.PRAYER_KEYS
         ]
         
         header_style = {'font': ('Segoe UI', 12, 'bold'), 'bg': self.colors['bg_accent'], 'fg': self.colors['text_accent'], 'pady': 10, 'relief': 'flat'}
@@ -619,34 +735,12 @@ class EnhancedPrayerTimesApp:
         tk.Label(self.table_frame, text=self._("table_header_prayer"), **header_style).grid(row=0, column=3, columnspan=4, sticky='nsew')
         
         self.prayer_rows = []
-        now = datetime.now()
-        current_minutes = now.hour * 60 + now.minute
+        row_statuses = city_data.timeline.statuses(self.clock.now())
         
         # تحديث حالة الصلاة
-        for i, (prayer_orig, prayer_period, prayer_time, prayer_name, icon) in enumerate(prayers_data):
+        for i, (prayer_time, prayer_period, prayer_name, icon) in enumerate(prayers_data):
             row_num = i + 1
-            
-            prayer_minutes = self.time_to_minutes(prayer_orig)
-            if prayer_minutes <= current_minutes:
-                if i < len(prayers_data) - 1:
-                    next_prayer_minutes = self.time_to_minutes(prayers_data[i + 1][0])
-                    if current_minutes < next_prayer_minutes:
-                        status = self._("prayer_status_now")
-                        status_color = self.colors['success']
-                    else:
-                        status = self._("prayer_status_finished")
-                        status_color = self.colors['text_secondary']
-                else:
-                    status = self._("prayer_status_finished")
-                    status_color = self.colors['text_secondary']
-            else:
-                time_diff = prayer_minutes - current_minutes
-                if time_diff <= 60:
-                    status = self._("prayer_status_within_hour", time_diff=time_diff)
-                    status_color = self.colors['warning']
-                else:
-                    status = self._("prayer_status_upcoming")
-                    status_color = self.colors['text_secondary']
+            status, status_color = self._status_display(*row_statuses[i])
             
             cell_style = {'bg': self.colors['bg_card'], 'fg': self.colors['text_primary'], 'pady': 8, 'font': ('Segoe UI', 12)}
             
@@ -665,11 +759,11 @@ class EnhancedPrayerTimesApp:
             icon_label = tk.Label(self.table_frame, text=icon, anchor="w", **cell_style)
             icon_label.grid(row=row_num, column=4, sticky='nsew', pady=1)
             
-            self.prayer_rows.append({'icon': icon_label, 'prayer': prayer_label, 'time': time_label, 'period': period_label, 'status': status_label, 'prayer_name': prayer_name, 'prayer_orig': prayer_orig})
+            self.prayer_rows.append({'icon': icon_label, 'prayer': prayer_label, 'time': time_label, 'period': period_label, 'status': status_label, 'prayer_name': prayer_name})
         
         self.update_next_prayer()
         self.start_countdown()
-        self.check_prayer_notifications()
+        self.schedule_prayer_events()
     
     def start_countdown(self):
         """بدء العد التنازلي"""
@@ -677,50 +771,62 @@ class EnhancedPrayerTimesApp:
             return
         
         self._countdown_running = True
-        self.update_countdown()
+        self._countdown_timer = self.timers.call_later(0, self.update_countdown)
+
+    def _next_prayer(self):
+        """
+        الصلاة القادمة للمدينة الحالية (يشترك فيها العد التنازلي وحساب فترة التحديث)
+        :return: (اسم الصلاة، الثواني المتبقية) أو None إذا لم تتوفر بيانات
+        """
+        timeline = self._current_timeline()
+        if timeline is None:
+            return None
+        now = self.clock.now()
+        window = self._current_window()
+        upcoming = window.next_prayer(now) if window is not None else None
+        if upcoming is None:
+            return self._(timeline.next(now)[0]), timeline.seconds_until_next(now)
+        prayer_key, when = upcoming
+        return self._(prayer_key), int((when - now.replace(microsecond=0)).total_seconds())
+
+    def _current_timeline(self):
+        """الجدول الزمني لمواقيت المدينة المعروضة"""
+        city_data = self.prayer_data.get(self.current_city) if self.current_city else None
+        return city_data.timeline if city_data else None
+
+    def _current_window(self):
+        """نافذة المواقيت إذا كانت للمدينة ومعاملات الحساب المعروضة"""
+        window = self.prayer_window
+        if window is None or not window.matches(self.current_city, self.current_country, self.settings.calculation_key()):
+            return None
+        return window
+
+    def _status_display(self, status: str, minutes_left: int) -> tuple:
+        """نص ولون حالة صف في جدول المواقيت"""
+        if status == PrayerTimeline.CURRENT:
+            return self._("prayer_status_now"), self.colors['success']
+        if status == PrayerTimeline.WITHIN_HOUR:
+            return self._("prayer_status_within_hour", time_diff=minutes_left), self.colors['warning']
+        if status == PrayerTimeline.UPCOMING:
+            return self._("prayer_status_upcoming"), self.colors['text_secondary']
+        return self._("prayer_status_finished"), self.colors['text_secondary']
     
     def update_countdown(self):
-        """تحديث العد التنازلي بكفاءة أفضل"""
+        """
+        تحديث العد التنازلي بكفاءة أفضل
+        :return: الثواني حتى التحديث التالي (مؤقت متكرر في TimerService) أو None للتوقف
+        """
         if not hasattr(self, '_countdown_running') or not self._countdown_running:
-            return
-        
-        if not self.current_city or self.current_city not in self.prayer_data:
-            if self.root.winfo_exists() and self._countdown_running:
-                # تأخير أطول إذا لم تكن هناك بيانات متاحة
-                self.root.after(10000, self.update_countdown)
-            return
-        
-        now = datetime.now()
-        current_seconds = now.hour * 3600 + now.minute * 60 + now.second
-        city_data = self.prayer_data[self.current_city]
-        
-        prayers_orig = [
-            (self._('fajr'), city_data['fajr_orig']),
-            (self._('sunrise'), city_data['sunrise_orig']),
-            (self._('dhuhr'), city_data['dhuhr_orig']),
-            (self._('asr'), city_data['asr_orig']),
-            (self._('maghrib'), city_data['maghrib_orig']),
-            (self._('isha'), city_data['isha_orig'])
-        ]
+            return None
+        if self._window_hidden():
+            return self.HIDDEN_UPDATE_INTERVAL
         
-        next_prayer = None
-        next_prayer_seconds = None
-        
-        # تحويل أوقات الصلوات إلى ثوانٍ
-        for name, time_str in prayers_orig:
-            prayer_minutes = self.time_to_minutes(time_str)
-            prayer_seconds = prayer_minutes * 60
-            if prayer_seconds > current_seconds:
-                next_prayer = name
-                next_prayer_seconds = prayer_seconds
-                break
-                
-        # إذا كانت الصلاة القادمة هي الفجر في اليوم التالي
-        if next_prayer is None:
-            next_prayer = self._('fajr')
-            next_prayer_seconds = self.time_to_minutes(prayers_orig[0][1]) * 60 + 24 * 3600
+        next_prayer_info = self._next_prayer()
+        if next_prayer_info is None:
+            # تأخير أطول إذا لم تكن هناك بيانات متاحة
+            return 10
         
-        remaining_seconds = next_prayer_seconds - current_seconds
+        next_prayer, remaining_seconds = next_prayer_info
         hours = remaining_seconds // 3600
         minutes = (remaining_seconds % 3600) // 60
         seconds = remaining_seconds % 60
@@ -751,44 +857,24 @@ class EnhancedPrayerTimesApp:
         
         # تحديد فترة التحديث القادم بناءً على الوقت المتبقي
         if remaining_seconds < 60:  # آخر دقيقة: تحديث كل ثانية
-            update_interval = 1000
+            return 1
         elif remaining_seconds < 300:  # آخر 5 دقائق: تحديث كل 5 ثوانٍ
-            update_interval = 5000
+            return 5
         elif remaining_seconds < 1800:  # آخر 30 دقيقة: تحديث كل 15 ثانية
-            update_interval = 15000
-        else:  # أكثر من 30 دقيقة: تحديث كل دقيقة
-            update_interval = 60000
-        
-        if self.root.winfo_exists() and self._countdown_running:
-            self.root.after(update_interval, self.update_countdown)
+            return 15
+        # أكثر من 30 دقيقة: تحديث كل دقيقة
+        return 60
     
     def show_adhan_dialog(self, prayer_name: str):
         """إظهار نافذة الأذان مع زر إغلاق"""
         try:
             # Find current prayer based on time
-            now = datetime.now()
-            current_minutes = now.hour * 60 + now.minute
             current_prayer_name = None
-            
-            if self.current_city and self.current_city in self.prayer_data:
-                city_data = self.prayer_data[self.current_city]
-                prayers = [
-                    (self._('fajr'), city_data['fajr_orig']),
-                    (self._('dhuhr'), city_data['dhuhr_orig']),
-                    (self._('asr'), city_data['asr_orig']),
-                    (self._('maghrib'), city_data['maghrib_orig']),
-                    (self._('isha'), city_data['isha_orig'])
-                ]
-                
-                # Find current prayer
-                for i, (p_name, p_time) in enumerate(prayers):
-                    prayer_minutes = self.time_to_minutes(p_time)
-                    if prayer_minutes <= current_minutes:
-                        if i < len(prayers) - 1:
-                            next_prayer_minutes = self.time_to_minutes(prayers[i + 1][1])
-                            if current_minutes < next_prayer_minutes:
-                                current_prayer_name = p_name
-                                break
+            timeline = self._current_timeline()
+            if timeline is not None:
+                current_key = timeline.current(self.clock.now())
+                if current_key and current_key != 'sunrise':
+                    current_prayer_name = self._(current_key)
             
             if hasattr(self, 'adhan_dialog') and self.adhan_dialog and self.adhan_dialog.winfo_exists():
                 self.adhan_dialog.destroy()
@@ -858,198 +944,119 @@ class EnhancedPrayerTimesApp:
         if hasattr(self, 'adhan_dialog') and self.adhan_dialog and self.adhan_dialog.winfo_exists():
             self.adhan_dialog.destroy()
 
-    def check_prayer_notifications(self):
-        """فحص وإرسال إشعارات الصلوات بكفاءة أفضل"""
-        logger.info(f"فحص الإشعارات - الإشعارات مفعلة: {self.settings.notifications_enabled}, متاحة: {NOTIFICATIONS_AVAILABLE}")
-
+    def schedule_prayer_events(self):
+        """بناء أحداث اليوم والتالي (إشعار مسبق وأذان لكل صلاة) من المواقيت المعروضة وضبط مؤقت الحدث التالي"""
         if not self.current_city or self.current_city not in self.prayer_data:
             logger.info(f"لا توجد بيانات للمدينة: {self.current_city}")
+            self.prayer_scheduler.cancel()
             return
 
-        logger.info(f"فحص أوقات الصلاة لمدينة: {self.current_city}")
-        
-        now = datetime.now()
-        current_time_str = now.strftime("%H:%M")
-        current_seconds = now.hour * 3600 + now.minute * 60 + now.second
-        
         city_data = self.prayer_data[self.current_city]
-        # تحديد الصلاة الحالية
-        current_prayer = None
-        current_prayer_name = None
-        prayers = [
-            ("fajr", self._('fajr'), city_data['fajr_orig']),
-            ("dhuhr", self._('dhuhr'), city_data['dhuhr_orig']),
-            ("asr", self._('asr'), city_data['asr_orig']),
-            ("maghrib", self._('maghrib'), city_data['maghrib_orig']),
-            ("isha", self._('isha'), city_data['isha_orig'])
-        ]
-        
-        # تتبع الوقت المتبقي حتى الإشعار أو الأذان التالي لتحديد وقت الفحص القادم
-        next_notification_seconds = 24 * 3600  # القيمة الافتراضية هي يوم كامل
-        
-        for prayer_key, prayer_display_name, prayer_time_str in prayers:
-            # تحويل وقت الصلاة إلى كائن datetime
-            prayer_datetime = datetime.strptime(prayer_time_str.split()[0], "%I:%M")
-            if (prayer_time_str.endswith('م') or prayer_time_str.endswith('PM')) and prayer_datetime.hour != 12:
-                prayer_datetime = prayer_datetime.replace(hour=prayer_datetime.hour + 12)
-            elif (prayer_time_str.endswith('ص') or prayer_time_str.endswith('AM')) and prayer_datetime.hour == 12:
-                prayer_datetime = prayer_datetime.replace(hour=0)
-            
-            # حساب وقت الإشعار المسبق
-            notification_time = prayer_datetime - timedelta(minutes=self.settings.notification_before_minutes)
-            notification_time_str = notification_time.strftime("%H:%M")
-            
-            # حساب الثواني المتبقية حتى الإشعار
-            notification_seconds = notification_time.hour * 3600 + notification_time.minute * 60
-            if notification_seconds < current_seconds:
-                notification_seconds += 24 * 3600  # إضافة يوم كامل إذا كان الوقت في اليوم التالي
-            seconds_until_notification = notification_seconds - current_seconds
-            
-            # حساب الثواني المتبقية حتى وقت الصلاة
-            prayer_seconds = prayer_datetime.hour * 3600 + prayer_datetime.minute * 60
-            if prayer_seconds < current_seconds:
-                prayer_seconds += 24 * 3600  # إضافة يوم كامل إذا كان الوقت في اليوم التالي
-            seconds_until_prayer = prayer_seconds - current_seconds
-            
-            # تحديث وقت الإشعار التالي
-            next_notification_seconds = min(next_notification_seconds, seconds_until_notification, seconds_until_prayer)
-            
-            # التحقق من وقت الإشعار المسبق
-            if current_time_str == notification_time_str:
-                # التحقق من إعدادات الإشعار للصلاة المحددة قبل أي إجراء
-                prayer_notification_enabled = getattr(self.settings, f'notification_{prayer_key}_enabled', True)
-
-                if not prayer_notification_enabled:
-                    logger.info(f"تخطي إشعار قبل صلاة {prayer_display_name} لأن المستخدم عطّلها")
-                    self.last_notification_time[f"pre_{prayer_key}"] = current_time_str
-                    continue
-
-                # منع تكرار الإشعارات في نفس الدقيقة
-                notification_key = f"pre_{prayer_key}"
-                if notification_key not in self.last_notification_time or self.last_notification_time[notification_key] != current_time_str:
-                    logger.info(f"إرسال إشعار قبل صلاة {prayer_display_name}")
-                    self.notification_manager.send_notification(
-                        self._("prayer_notification_alert"),
-                        self._("minutes_remaining_for_prayer", minutes=self.settings.notification_before_minutes, prayer_name=prayer_display_name),
-                        timeout=15
-                    )
-                    if self.settings.sound_enabled:
-                        sound_file = self.settings.notification_sound_file
-                        if sound_file:
-                            self.adhan_player.play_sound(sound_file, self.settings.sound_volume)
-                        else:
-                            self.adhan_player.play_sound('sounds/notification.wav', self.settings.sound_volume)
-                    self.last_notification_time[notification_key] = current_time_str
-            
-            # التحقق من وقت الصلاة الفعلي
-            prayer_time_formatted = prayer_datetime.strftime("%H:%M")
-            logger.debug(f"فحص أذان {prayer_display_name}: الوقت الحالي {current_time_str}, وقت الصلاة {prayer_time_formatted}")
-            if current_time_str == prayer_time_formatted:
-                # منع تكرار الأذان في نفس الدقيقة
-                adhan_key = f"adhan_{prayer_key}"
-                if adhan_key not in self.last_notification_time or self.last_notification_time[adhan_key] != current_time_str:
-                    logger.info(f"وقت أذان صلاة {prayer_display_name} - بدء العملية")
-
-                    # التحقق من إعدادات الأذان للصلاة المحددة قبل أي إجراء
-                    prayer_adhan_enabled = getattr(self.settings, f'adhan_{prayer_key}_enabled', True)
-
-                    if not prayer_adhan_enabled:
-                        logger.info(f"تخطي أذان صلاة {prayer_display_name} لأن المستخدم عطّلها")
-                        self.last_notification_time[adhan_key] = current_time_str
-                        continue
-
-                    logger.info(f"إرسال أذان لصلاة {prayer_display_name}")
-                    self.notification_manager.send_notification(
-                        self._("prayer_time"),
-                        self._("its_time_for_prayer", prayer_name=prayer_display_name),
-                        timeout=20
-                    )
-
-                    if self.settings.sound_enabled:
-                        logger.info(f"تشغيل الصوت لأذان {prayer_display_name}")
-                        sound_file = self.settings.adhan_sound_file
-                        if sound_file:
-                            logger.info(f"استخدام ملف الصوت المخصص: {sound_file}")
-                            self.adhan_player.play_sound(sound_file, self.settings.sound_volume)
-                        else:
-                            logger.info("استخدام ملف الصوت الافتراضي: sounds/adhan_mekka.wma")
-                            self.adhan_player.play_sound('sounds/adhan_mekka.wma', self.settings.sound_volume)
-                        # إظهار نافذة الأذان مع زر الإيقاف - تأكد من التشغيل في الخيط الرئيسي
-                        logger.info(f"إظهار نافذة الأذان لصلاة {prayer_display_name}")
-                        self.root.after(0, lambda: self.show_adhan_dialog(prayer_display_name))
-                        # تعيين callback لإغلاق النافذة عند انتهاء الصوت
-                        self.adhan_player.set_end_callback(lambda: self.close_adhan_dialog_if_exists())
-                    else:
-                        logger.info("الصوت معطل في الإعدادات")
+        window = self._current_window()
+        if window is not None and city_data.day in window:
+            # الأمس واليوم والتالي: إشعار فجر الغد أو أي حدث بعد منتصف الليل (عشاء الأمس في العروض العليا)
+            # يبقى مجدولاً عبر الانتقال إلى اليوم الجديد؛ الأحداث الماضية يتجاهلها المجدول
+            entries = window.prayers(city_data.day - timedelta(days=1), 3)
+        else:
+            entries = list(zip(city_data.timeline.keys, city_data.timeline.times))
+        prayers = [(prayer_key, self._(prayer_key), when) for prayer_key, when in entries if prayer_key != 'sunrise']
+        events = PrayerScheduler.build_events(prayers, self.settings.notification_before_minutes)
+        self.prayer_scheduler.schedule(events)
+
+    def _on_new_day(self):
+        """
+        بعد منتصف الليل: الانتقال إلى سجل اليوم الجديد من نافذة المواقيت فورًا بدون شبكة،
+        ثم تمديد النافذة في الخلفية؛ إذا لم يتوفر سجل اليوم يُعاد التحميل الكامل
+        """
+        city, country = self.settings.selected_city, self.settings.selected_country
+        if not self.running or not city or not country:
+            return
+        today = self.clock.today()
+        window = self._current_window()
+        record = window.advance(today) if window is not None else None
+        if record is None:
+            self.fetch_and_display_times(city, country)
+            return
+
+        logger.info(f"الانتقال إلى مواقيت {today} لـ {city} من النافذة المحملة مسبقًا")
+        self.prayer_data[city] = record
+        self.display_prayer_times(record)
+        calc_key = self.settings.calculation_key()
+        self.fetcher.submit('api.aladhan.com', self._extend_window, city, country, calc_key, today,
+                            on_success=self._set_window, tag='prayer_window', key=(city, country, calc_key, today))
+
+    def handle_prayer_event(self, event: PrayerEvent):
+        """تنفيذ حدث من جدول اليوم: إشعار قبل الصلاة أو الأذان"""
+        prayer_key, prayer_display_name = event.prayer_key, event.display_name
+        logger.info(f"فحص الإشعارات - الإشعارات مفعلة: {self.settings.notifications_enabled}, متاحة: {NOTIFICATIONS_AVAILABLE}")
 
-                    self.last_notification_time[adhan_key] = current_time_str
+        if event.kind == PrayerEvent.PRE_NOTIFICATION:
+            # التحقق من إعدادات الإشعار للصلاة المحددة قبل أي إجراء
+            if not getattr(self.settings, f'notification_{prayer_key}_enabled', True):
+                logger.info(f"تخطي إشعار قبل صلاة {prayer_display_name} لأن المستخدم عطّلها")
+                return
+
+            logger.info(f"إرسال إشعار قبل صلاة {prayer_display_name}")
+            self.notification_manager.send_notification(
+                self._("prayer_notification_alert"),
+                self._("minutes_remaining_for_prayer", minutes=self.settings.notification_before_minutes, prayer_name=prayer_display_name),
+                timeout=15
+            )
+            if self.settings.sound_enabled:
+                sound_file = self.settings.notification_sound_file
+                if sound_file:
+                    self.adhan_player.play_sound(sound_file, self.settings.sound_volume)
                 else:
-                    logger.debug(f"تخطي أذان {prayer_display_name} - تم تشغيله مسبقاً في هذه الدقيقة")
-        
-        # جدولة الفحص التالي بناءً على الوقت المتبقي للإشعار أو الأذان القادم
-        if next_notification_seconds < 60:  # أقل من دقيقة
-            # فحص كل 10 ثوانٍ عندما يكون الوقت قريبًا جدًا
-            next_check = 10000
-        elif next_notification_seconds < 300:  # أقل من 5 دقائق
-            # فحص كل 30 ثانية عندما يكون الوقت قريبًا
-            next_check = 30000
-        elif next_notification_seconds < 1800:  # أقل من 30 دقيقة
-            # فحص كل دقيقة
-            next_check = 60000
-        else:
-            # فحص كل 5 دقائق عندما يكون الوقت بعيدًا
-            next_check = 300000
-        
-        # جدولة الفحص التالي فقط إذا كان التطبيق لا يزال قيد التشغيل
-        if self.root.winfo_exists() and self.running:
-            self.root.after(next_check, self.check_prayer_notifications)
-    
-    def update_prayer_statuses(self):
-        """تحديث حالة الصلوات في الجدول"""
-        if not hasattr(self, 'prayer_rows') or not self.prayer_rows:
+                    self.adhan_player.play_sound('sounds/notification.wav', self.settings.sound_volume)
             return
 
-        now = datetime.now()
-        current_minutes = now.hour * 60 + now.minute
+        logger.info(f"وقت أذان صلاة {prayer_display_name} - بدء العملية")
 
-        for i, row_data in enumerate(self.prayer_rows):
-            if 'prayer_orig' not in row_data:
-                continue
+        # التحقق من إعدادات الأذان للصلاة المحددة قبل أي إجراء
+        if not getattr(self.settings, f'adhan_{prayer_key}_enabled', True):
+            logger.info(f"تخطي أذان صلاة {prayer_display_name} لأن المستخدم عطّلها")
+            return
 
-            prayer_minutes = self.time_to_minutes(row_data['prayer_orig'])
-            status_label = row_data['status']
+        logger.info(f"إرسال أذان لصلاة {prayer_display_name}")
+        self.notification_manager.send_notification(
+            self._("prayer_time"),
+            self._("its_time_for_prayer", prayer_name=prayer_display_name),
+            timeout=20
+        )
 
-            if prayer_minutes <= current_minutes:
-                if i < len(self.prayer_rows) - 1:
-                    next_prayer_minutes = self.time_to_minutes(self.prayer_rows[i + 1]['prayer_orig'])
-                    if current_minutes < next_prayer_minutes:
-                        status = self._("prayer_status_now")
-                        status_color = self.colors['success']
-                    else:
-                        status = self._("prayer_status_finished")
-                        status_color = self.colors['text_secondary']
-                else:
-                    status = self._("prayer_status_finished")
-                    status_color = self.colors['text_secondary']
+        if self.settings.sound_enabled:
+            logger.info(f"تشغيل الصوت لأذان {prayer_display_name}")
+            sound_file = self.settings.adhan_sound_file
+            if sound_file:
+                logger.info(f"استخدام ملف الصوت المخصص: {sound_file}")
+                self.adhan_player.play_sound(sound_file, self.settings.sound_volume)
             else:
-                time_diff = prayer_minutes - current_minutes
-                if time_diff <= 60:
-                    status = self._("prayer_status_within_hour", time_diff=time_diff)
-                    status_color = self.colors['warning']
-                else:
-                    status = self._("prayer_status_upcoming")
-                    status_color = self.colors['text_secondary']
+                logger.info("استخدام ملف الصوت الافتراضي: sounds/adhan_mekka.wma")
+                self.adhan_player.play_sound('sounds/adhan_mekka.wma', self.settings.sound_volume)
+            # إظهار نافذة الأذان مع زر الإيقاف - تأكد من التشغيل في الخيط الرئيسي
+            logger.info(f"إظهار نافذة الأذان لصلاة {prayer_display_name}")
+            self.root.after(0, lambda: self.show_adhan_dialog(prayer_display_name))
+            # تعيين callback لإغلاق النافذة عند انتهاء الصوت
+            self.adhan_player.set_end_callback(lambda: self.close_adhan_dialog_if_exists())
+        else:
+            logger.info("الصوت معطل في الإعدادات")
+    
+    def update_prayer_statuses(self):
+        """تحديث حالة الصلوات في الجدول"""
+        timeline = self._current_timeline()
+        if not hasattr(self, 'prayer_rows') or not self.prayer_rows or timeline is None:
+            return
 
-            status_label.config(text=status, fg=status_color)
+        for row_data, row_status in zip(self.prayer_rows, timeline.statuses(self.clock.now())):
+            status, status_color = self._status_display(*row_status)
+            row_data['status'].config(text=status, fg=status_color)
 
     def update_next_prayer(self):
         """تمييز الصلاة القادمة"""
-        if not hasattr(self, 'prayer_rows') or not self.prayer_rows:
+        timeline = self._current_timeline()
+        if not hasattr(self, 'prayer_rows') or not self.prayer_rows or timeline is None:
             return
 
-        now = datetime.now()
-        current_minutes = now.hour * 60 + now.minute
-
         # إعادة تعيين جميع الصفوف إلى النمط الافتراضي
         for row_data in self.prayer_rows:
             row_data['icon'].config(font=('Segoe UI', 12))
@@ -1059,16 +1066,7 @@ class EnhancedPrayerTimesApp:
                 if isinstance(widget, tk.Label):
                     widget.config(bg=self.colors['bg_card'])
 
-        next_prayer_index = -1
-        for i, row_data in enumerate(self.prayer_rows):
-            if 'prayer_orig' in row_data:
-                prayer_minutes = self.time_to_minutes(row_data['prayer_orig'])
-                if prayer_minutes > current_minutes:
-                    next_prayer_index = i
-                    break
-
-        if next_prayer_index == -1:
-            next_prayer_index = 0
+        next_prayer_index = timeline.next_index(self.clock.now())
 
         if 0 <= next_prayer_index < len(self.prayer_rows):
             row_data = self.prayer_rows[next_prayer_index]
@@ -1083,84 +1081,20 @@ class EnhancedPrayerTimesApp:
                 if isinstance(widget, tk.Label):
                     widget.config(bg=highlight_color)
     
-    def update_calendar_display(self, city_data: dict):
+    def update_calendar_display(self, city_data: PrayerDay):
         """تحديث عرض التقويم"""
-        greg_parts = city_data['gregorian_date'].split('-')
-        if len(greg_parts) == 3:
-            day, month, year = greg_parts
-            month_names_ar = {'01': 'يناير', '02': 'فبراير', '03': 'مارس', '04': 'أبريل', '05': 'مايو', '06': 'يونيو', '07': 'يوليو', '08': 'أغسطس', '09': 'سبتمبر', '10': 'أكتوبر', '11': 'نوفمبر', '12': 'ديسمبر'}
-            month_names_en = {'01': 'January', '02': 'February', '03': 'March', '04': 'April', '05': 'May', '06': 'June', '07': 'July', '08': 'August', '09': 'September', '10': 'October', '11': 'November', '12': 'December'}
-            month_names = month_names_ar if self.settings.language == 'ar' else month_names_en
-            self.greg_day_label.config(text=day)
-            self.greg_month_label.config(text=month_names.get(month, month))
-            self.greg_year_label.config(text=year)
-        
-        hijri_text = city_data['hijri_date']
-        hijri_parts = hijri_text.split()
-        
-        if len(hijri_parts) >= 3:
-            hijri_day = hijri_parts[0]
-            hijri_year = hijri_parts[-1]
-            hijri_month = ' '.join(hijri_parts[1:-1])
-            
-            self.hijri_day_label.config(text=hijri_day)
-            self.hijri_month_label.config(text=hijri_month)
-            self.hijri_year_label.config(text=hijri_year)
-    
-    # تخزين مؤقت لتحويلات الوقت لتحسين الأداء
-    _time_conversion_cache = {}
-    _MAX_TIME_CACHE_SIZE = 50
-    
-    def time_to_minutes(self, time_str: str) -> int:
-        """
-        تحويل الوقت إلى دقائق مع تحسين معالجة الأخطاء وتخزين النتائج للاستخدام المتكرر        
-        :param time_str: سلسلة الوقت بتنسيق "HH:MM AM/PM" أو "HH:MM ص/م"
-        :return: الوقت محولاً إلى دقائق (من 0 إلى 1439)
-        """
-        # التحقق من التخزين المؤقت أولاً للتحسين
-        if time_str in self._time_conversion_cache:
-            return self._time_conversion_cache[time_str]
-            
-        if not time_str:
-            logger.warning("محاولة تحويل سلسلة وقت فارغة إلى دقائق")
-            return 0
-            
-        try:
-            # توحيد تنسيق السلسلة للتخزين المؤقت الفعّال
-            time_str = time_str.strip().upper()
-            match = re.match(r'(\d{1,2}):(\d{2})\s*(AM|PM|ص|م)', time_str)
-            
-            if not match:
-                logger.warning(f"تنسيق وقت غير صحيح: {time_str}")
-                return 0
-                
-            hours, minutes, period = int(match.group(1)), int(match.group(2)), match.group(3)
-            
-            # تحقق من صحة الوقت
-            if hours < 0 or hours > 12 or minutes < 0 or minutes > 59:
-                logger.warning(f"قيم وقت غير صالحة: الساعات={hours}, الدقائق={minutes}")
-                return 0
-                
-            # تحويل الوقت من نظام 12 ساعة إلى نظام 24 ساعة
-            if (period == 'م' or period == 'PM') and hours != 12:
-                hours += 12
-            elif (period == 'ص' or period == 'AM') and hours == 12:
-                hours = 0
-            
-            # حساب الدقائق الكلية
-            total_minutes = hours * 60 + minutes
-            
-            # تخزين النتيجة في التخزين المؤقت
-            if len(self._time_conversion_cache) >= self._MAX_TIME_CACHE_SIZE:
-                # حذف عنصر عشوائي إذا امتلأ التخزين المؤقت
-                self._time_conversion_cache.pop(next(iter(self._time_conversion_cache)))
-                
-            self._time_conversion_cache[time_str] = total_minutes
-            return total_minutes
-            
-        except Exception as e:
-            logger.error(f"خطأ في تحويل الوقت {time_str}: {e}")
-            return 0
+        day = city_data.day
+        month_names_ar = {'01': 'يناير', '02': 'فبراير', '03': 'مارس', '04': 'أبريل', '05': 'مايو', '06': 'يونيو', '07': 'يوليو', '08': 'أغسطس', '09': 'سبتمبر', '10': 'أكتوبر', '11': 'نوفمبر', '12': 'ديسمبر'}
+        month_names_en = {'01': 'January', '02': 'February', '03': 'March', '04': 'April', '05': 'May', '06': 'June', '07': 'July', '08': 'August', '09': 'September', '10': 'October', '11': 'November', '12': 'December'}
+        month_names = month_names_ar if self.settings.language == 'ar' else month_names_en
+        self.greg_day_label.config(text=f"{day.day:02d}")
+        self.greg_month_label.config(text=month_names[f"{day.month:02d}"])
+        self.greg_year_label.config(text=str(day.year))
+        
+        if city_data.hijri_day:
+            self.hijri_day_label.config(text=city_data.hijri_day)
+            self.hijri_month_label.config(text=city_data.hijri_month(self.settings.language))
+            self.hijri_year_label.config(text=city_data.hijri_year)
     
     def show_loading(self):
         """إظهار رسالة التحميل"""
@@ -1180,7 +1114,9 @@ class EnhancedPrayerTimesApp:
         def scheduled_update():
             try:
                 if not self.root.winfo_exists() or not self.running:
-                    return
+                    return None
+                if self._window_hidden():
+                    return self.HIDDEN_UPDATE_INTERVAL
 
                 # حساب الفترة المناسبة للتحديث التالي
                 next_update_interval = self._calculate_optimal_update_interval()
@@ -1191,74 +1127,60 @@ class EnhancedPrayerTimesApp:
                 self.update_prayer_statuses()  # تحديث حالة الصلوات في الجدول
 
                 # إعادة جدولة التحديث التالي بناءً على الفترة المحسوبة
-                self.root.after(next_update_interval, scheduled_update)
+                return next_update_interval
             except Exception as e:
                 logger.error(f"خطأ في حلقة التحديث {e}", exc_info=True)
+                return 60
 
-        # بدء نظام التحديث وفحص الإشعارات
-        self.root.after(1000, scheduled_update)  # بدء التحديث بعد ثانية واحدة
-        self.check_prayer_notifications()  # بدء نظام الإشعارات منفصلاً
+        # بدء نظام التحديث (الإشعارات تُجدول عند عرض المواقيت)
+        self._auto_update_timer = self.timers.call_later(1, scheduled_update)  # بدء التحديث بعد ثانية واحدة
+        self.root.bind('<Map>', self._on_window_mapped, add='+')
+
+    def _window_hidden(self) -> bool:
+        """النافذة مصغرة أو في شريط المهام: لا داعي لتحديث العناصر المرئية كل دقيقة"""
+        try:
+            return self.root.state() in ('withdrawn', 'iconic')
+        except tk.TclError:
+            return True
+
+    def _on_window_mapped(self, event=None):
+        """عند ظهور النافذة: تحديث العد التنازلي والحالة فورًا بدل انتظار الفترة الطويلة"""
+        if event is not None and event.widget is not self.root:
+            return
+        for timer in (getattr(self, '_countdown_timer', None), getattr(self, '_auto_update_timer', None)):
+            if timer is not None:
+                self.timers.reschedule(timer, 0)
     
     def _calculate_optimal_update_interval(self):
-        """حساب الفترة المثلى للتحديث بناءً على حالة التطبيق"""
+        """حساب الفترة المثلى للتحديث (بالثواني) بناءً على حالة التطبيق"""
         # التحديث الافتراضي كل 60 ثانية
-        default_interval = 60000  # 60 ثانية
-        
-        if not self.current_city or self.current_city not in self.prayer_data:
-            return default_interval
-        
-        now = datetime.now()
-        current_seconds = now.hour * 3600 + now.minute * 60 + now.second
-        
-        # الحصول على وقت الصلاة التالية
-        next_prayer_seconds = None
-        prayers_orig = []
+        default_interval = 60
         
         try:
-            city_data = self.prayer_data[self.current_city]
-            prayers_orig = [
-                (self._('fajr'), city_data['fajr_orig']),
-                (self._('sunrise'), city_data['sunrise_orig']),
-                (self._('dhuhr'), city_data['dhuhr_orig']),
-                (self._('asr'), city_data['asr_orig']),
-                (self._('maghrib'), city_data['maghrib_orig']),
-                (self._('isha'), city_data['isha_orig'])
-            ]
-            
-            # حساب الوقت المتبقي للصلاة التالية
-            for name, time_str in prayers_orig:
-                prayer_minutes = self.time_to_minutes(time_str)
-                prayer_seconds = prayer_minutes * 60
-                if prayer_seconds > current_seconds:
-                    next_prayer_seconds = prayer_seconds
-                    break
-            
-            # إذا لم نجد صلاة تالية، فالصلاة التالية هي صلاة الفجر في اليوم التالي
-            if next_prayer_seconds is None and prayers_orig:
-                next_prayer_seconds = self.time_to_minutes(prayers_orig[0][1]) * 60 + 24 * 3600
+            next_prayer_info = self._next_prayer()
         except Exception as e:
             logger.warning(f"خطأ في حساب فترة التحديث المثلى: {e}")
             return default_interval
         
-        if next_prayer_seconds is None:
+        if next_prayer_info is None:
             return default_interval
         
-        # حساب الثواني المتبقية للصلاة التالية
-        seconds_until_next_prayer = next_prayer_seconds - current_seconds
+        # الثواني المتبقية للصلاة التالية
+        seconds_until_next_prayer = next_prayer_info[1]
         
         # تحديد فترة التحديث المثلى بناءً على الوقت المتبقي
         if seconds_until_next_prayer < 60:  # أقل من دقيقة
-            return 1000  # تحديث كل ثانية
+            return 1  # تحديث كل ثانية
         elif seconds_until_next_prayer < 300:  # أقل من 5 دقائق
-            return 5000  # تحديث كل 5 ثوانٍ
+            return 5  # تحديث كل 5 ثوانٍ
         elif seconds_until_next_prayer < 1800:  # أقل من 30 دقيقة
-            return 15000  # تحديث كل 15 ثانية
+            return 15  # تحديث كل 15 ثانية
         else:
-            return 60000  # تحديث كل دقيقة
+            return default_interval  # تحديث كل دقيقة
     
     def update_time_display_realtime(self):
         """تحديث عرض الوقت الحقيقي"""
-        current_time = datetime.now()
+        current_time = self.clock.now()
         time_str = current_time.strftime("%H:%M:%S")
         date_str = current_time.strftime("%Y-%m-%d")
         
@@ -1268,50 +1190,38 @@ class EnhancedPrayerTimesApp:
             self.time_sync_label.config(text=self._("date_label", date_str=date_str))
     
     def check_connection(self):
-        """فحص حالة الاتصال بشكل دوري مع إعادة الاتصال التلقائي"""
+        """فحص حالة الاتصال بشكل دوري مع إعادة الاتصال التلقائي (مؤقت في TimerService بدل خيط دائم)"""
         def connection_test():
-            last_online_status = None  # تتبع الحالة السابقة للاتصال
-            
-            while self.running:
-                previous_status = self.is_online
-                
-                try:
-                    # استخدام موقع خفيف لفحص الاتصال
-                    response = requests.get("https://www.google.com", timeout=5)
-                    self.is_online = response.status_code == 200
-                except requests.exceptions.RequestException:
-                    self.is_online = False
-                
-                if not self.running:
-                    break
+            try:
+                # استخدام موقع خفيف لفحص الاتصال
+                response = http_client.head("https://www.google.com", timeout=5, respect_breaker=False)
+                online = response.status_code == 200
+            except requests.exceptions.RequestException:
+                online = False
+            self.fetcher.dispatch(self._on_connection_checked, online)
+
+        if self.running:
+            self.executor.submit(connection_test)
+
+    def _on_connection_checked(self, online: bool):
+        """معالجة نتيجة فحص الاتصال في خيط Tk وجدولة الفحص التالي"""
+        if not self.running or not self.root.winfo_exists():
+            return
+        previous_status = self.is_online
+        self.is_online = online
 
-                # اكتشاف عودة الاتصال وإعادة تحميل البيانات
-                connection_restored = (previous_status == False and self.is_online == True)
-                
-                if self.root.winfo_exists():
-                    if connection_restored:
-                        # إعادة تحميل البيانات عند عودة الاتصال
-                        logger.info("تم اكتشاف عودة الاتصال بالإنترنت - إعادة تحميل البيانات")
-                        self.root.after(0, lambda: self._reconnect_and_reload())
-                    else:
-                        # تحديث حالة الاتصال فقط
-                        self.root.after(0, self.update_connection_status)
-                
-                # تحديد فترة الفحص التالية بناءً على حالة الاتصال
-                if self.is_online:
-                    # إذا كان متصل: فحص كل 5 دقائق
-                    check_interval = 5 * 60
-                else:
-                    # إذا كان غير متصل: فحص كل دقيقة للاستجابة المعقولة
-                    check_interval = 60
-                
-                # الانتظار حتى الفحص التالي
-                for _ in range(check_interval):
-                    if not self.running:
-                        break
-                    time.sleep(1)
-        
-        self.executor.submit(connection_test)
+        # اكتشاف عودة الاتصال وإعادة تحميل البيانات
+        if previous_status == False and self.is_online == True:
+            logger.info("تم اكتشاف عودة الاتصال بالإنترنت - إعادة تحميل البيانات")
+            self._reconnect_and_reload()
+        else:
+            # تحديث حالة الاتصال فقط
+            self.update_connection_status()
+
+        # تحديد فترة الفحص التالية بناءً على حالة الاتصال:
+        # إذا كان متصل فحص كل 5 دقائق، وإذا كان غير متصل فحص كل دقيقة للاستجابة المعقولة
+        check_interval = 5 * 60 if self.is_online else 60
+        self.timers.call_later(check_interval, self.check_connection, leeway=5)
     
     def update_connection_status(self):
         """تحديث مؤشر حالة الاتصال"""
@@ -1328,6 +1238,10 @@ class EnhancedPrayerTimesApp:
             # تحديث مؤشر الحالة
             self.update_connection_status()
             
+            # الإخفاقات المسجلة أثناء انقطاع الاتصال لم تعد صالحة
+            CircuitBreaker.reset_all()
+            http_client.NegativeCache.forget_unreachable()
+            
             # إعادة تحميل البيانات إذا كانت المدينة والدولة محددتين
             if self.settings.selected_city and self.settings.selected_country:
                 logger.info(f"إعادة تحميل بيانات مواقيت الصلاة لـ {self.settings.selected_city}, {self.settings.selected_country}")
@@ -1337,7 +1251,7 @@ class EnhancedPrayerTimesApp:
 
     def update_last_update_time(self):
         """تحديث وقت آخر تحديث في شريط الحالة"""
-        now = datetime.now()
+        now = self.clock.now()
         update_time_str = now.strftime("%Y-%m-%d %H:%M:%S")
         if hasattr(self, 'last_update_label'):
             self.last_update_label.config(text=f'{self._("last_update")} {update_time_str}')
@@ -1347,15 +1261,19 @@ class EnhancedPrayerTimesApp:
         """فتح نافذة الإعدادات"""
         old_country = self.settings.selected_country
         old_city = self.settings.selected_city
-        old_method = self.settings.calculation_method
+        old_key = self.settings.calculation_key()
 
         def on_settings_saved():
             location_changed = (self.settings.selected_country != old_country or
                                 self.settings.selected_city != old_city)
-            method_changed = self.settings.calculation_method != old_method
+            method_changed = self.settings.calculation_key() != old_key
 
+            # كل مجموعة معاملات لها مفتاحها في التخزين المؤقت، فالعودة إلى طريقة سابقة تُعرض فورًا
             if location_changed or method_changed:
-                self.manual_refresh(show_success_message=False)
+                self.fetch_and_display_times(self.settings.selected_city, self.settings.selected_country)
+            else:
+                # قد تتغير مدة الإشعار المسبق أو تفعيل الأذان لصلاة معينة
+                self.schedule_prayer_events()
 
         try:
             # Make sure countries are loaded before opening settings
@@ -1373,12 +1291,10 @@ class EnhancedPrayerTimesApp:
         if self.settings.selected_city and self.settings.selected_country:
             city_to_clear = self.settings.selected_city
             country_to_clear = self.settings.selected_country
-            cache_file = self.cache_manager.get_cache_file(city_to_clear, country_to_clear)
-            if cache_file.exists():
-                cache_file.unlink()
-                logger.info(f"تم حذف البيانات المؤقتة لـ {city_to_clear}, {country_to_clear}")
+            self.cache_manager.delete_data(city_to_clear, country_to_clear, self.settings.calculation_key())
 
-            self.fetch_and_display_times(city_to_clear, country_to_clear)
+            # تحديث يطلبه المستخدم: التحقق من الخادم بدلاً من نسخة HTTP مخزنة قد يصل عمرها إلى ساعة
+            self.fetch_and_display_times(city_to_clear, country_to_clear, revalidate=True)
             if show_success_message:
                 messagebox.showinfo(self._("updated_successfully"), self._("prayer_times_updated_successfully") )
         else:
@@ -1515,13 +1431,22 @@ class EnhancedPrayerTimesApp:
             if hasattr(self, '_countdown_running'):
                 self._countdown_running = False
 
+            if hasattr(self, 'timers'):
+                self.timers.shutdown()
+
             if hasattr(self, 'adhan_player'):
                 self.adhan_player.stop_sound()
 
+            if hasattr(self, 'fetcher'):
+                self.fetcher.shutdown()
+
             if hasattr(self, 'executor'):
                 self.executor.shutdown(wait=True)
 
             self.settings.save_settings()
+            for host_stats in CircuitBreaker.health_report():
+                logger.info(f"صحة الاتصال بـ {host_stats['host']}: {host_stats}")
+            http_client.close()
 
             # cleanup_pyinstaller يتم استدعاؤه تلقائيًا عبر atexit
             logger.info("تم إغلاق التطبيق بنجاح")
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+"""
+mock_api_server.py
+خادم محلي بديل للخدمات الخارجية (Aladhan و Nominatim و restcountries و countriesnow)
+لاختبار مسارات الشبكة وقياسها بدون إنترنت، مع زمن استجابة ونسبة أخطاء وتقييد معدل قابلة للضبط
+
+الاستجابات تُعاد من ملفات مسجلة في مجلد --fixtures إن وجدت، وإلا تُبنى من البيانات المرفقة
+(countries.json و Countries&Cities والحساب المحلي للمواقيت) بنفس بنية الخدمات الحقيقية
+
+تشغيل البرنامج عبر الخادم:
+    python mock_api_server.py --port 8765 --latency 150 --error-rate 0.1
+    PRAYER_TIMES_API_BASE=http://127.0.0.1:8765 python main.py
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from config import WORLD_CITIES_DIR
+from data_manager import get_cached_coordinates
+from prayer_logic import PrayerTimesCalculator
+
+logger = logging.getLogger(__name__)
+
+COUNTRIES_FILE = Path(__file__).parent / 'countries.json'
+
+class MockConfig:
+    """سلوك الخادم: زمن الاستجابة بالمللي ثانية، ونسب الأخطاء، وتقييد المعدل (0 للتعطيل)"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0,
+                 drop_rate: float = 0.0, rate_limit: float = 0, fixtures_dir: Optional[Path] = None,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate    # نسبة الاستجابات 503
+        self.drop_rate = drop_rate      # نسبة الاتصالات التي تُغلق بدون رد
+        self.rate_limit = rate_limit    # الحد الأقصى للطلبات في الثانية لكل خدمة (429 عند تجاوزه)
+        self.fixtures_dir = fixtures_dir
+        self.seed = seed
+
+class MockApiServer:
+    """خادم HTTP متعدد الخيوط يحاكي الخدمات الخارجية ويجمع إحصائيات الطلبات"""
+
+    def __init__(self, config: MockConfig = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or MockConfig()
+        self.random = random.Random(self.config.seed)
+        self.stats = Counter()
+        self.status_counts = Counter()
+        self._recent: dict[str, deque] = {}
+        self._lock = threading.Lock()
+        handler = type('Handler', (_MockHandler,), {'server_state': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockApiServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-api', daemon=True)
+        self._thread.start()
+        logger.info(f"الخادم البديل يعمل على {self.base_url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+            self.status_counts.clear()
+
+    def record(self, service: str, status: int):
+        with self._lock:
+            self.stats[service] += 1
+            self.status_counts[status] += 1
+
+    def throttled(self, service: str) -> bool:
+        """هل تجاوزت الخدمة الحد المسموح خلال الثانية الأخيرة"""
+        if not self.config.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent.setdefault(service, deque())
+            while recent and now - recent[0] > 1.0:
+                recent.popleft()
+            if len(recent) >= self.config.rate_limit:
+                return True
+            recent.append(now)
+            return False
+
+    def roll(self, rate: float) -> bool:
+        with self._lock:
+            return self.random.random() < rate
+
+    def delay(self):
+        latency = self.config.latency_ms
+        if self.config.jitter_ms:
+            with self._lock:
+                latency += self.random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def fixture(self, method: str, path: str, query: str) -> Optional[bytes]:
+        """استجابة مسجلة مسبقًا إن وجدت: ملف باسم sha1 للطلب (الطريقة والمسار والمعاملات مرتبة)"""
+        if not self.config.fixtures_dir:
+            return None
+        canonical_query = '&'.join(sorted(query.split('&'))) if query else ''
+        name = hashlib.sha1(f"{method} {path}?{canonical_query}".encode()).hexdigest() + '.json'
+        fixture_file = self.config.fixtures_dir / name
+        return fixture_file.read_bytes() if fixture_file.exists() else None
+
+class _MockHandler(BaseHTTPRequestHandler):
+    server_state: MockApiServer
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_HEAD(self):
+        self._send(200, b'', service='connectivity')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method: str):
+        state = self.server_state
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        body = None
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+
+        service = _service_for_path(parts.path)
+        state.delay()
+        if state.roll(state.config.drop_rate):
+            state.record(service, 0)
+            self.close_connection = True
+            self.connection.close()
+            return
+        if state.throttled(service):
+            self._send(429, b'{"error": "rate limited"}', service=service, headers={'Retry-After': '1'})
+            return
+        if state.roll(state.config.error_rate):
+            self._send(503, b'{"error": "unavailable"}', service=service)
+            return
+
+        payload = state.fixture(method, parts.path, parts.query)
+        if payload is None:
+            try:
+                data = _synthesize(method, parts.path, query, body)
+            except (KeyError, ValueError) as e:
+                self._send(400, json.dumps({'code': 400, 'data': str(e)}).encode(), service=service)
+                return
+            if data is None:
+                self._send(404, b'{"code": 404, "data": "Not found"}', service=service)
+                return
+            payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+        etag = '"' + hashlib.sha1(payload).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, b'', service=service, headers={'ETag': etag})
+            return
+        self._send(200, payload, service=service, headers={'ETag': etag})
+
+    def _send(self, status: int, payload: bytes, service: str, headers: dict = None):
+        self.server_state.record(service, status)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+def _service_for_path(path: str) -> str:
+    if path.startswith('/v1/'):
+        return 'aladhan'
+    if path.startswith('/v3.1/'):
+        return 'restcountries'
+    if path.startswith('/api/v0.1/'):
+        return 'countriesnow'
+    if path.startswith('/search'):
+        return 'nominatim'
+    return 'other'
+
+def _place_coordinates(city: str, country: str) -> tuple[float, float, str]:
+    """إحداثيات المدينة من البيانات المرفقة، أو إحداثيات ثابتة مشتقة من الاسم"""
+    cached = get_cached_coordinates(city, country)
+    if cached:
+        return cached
+    digest = hashlib.sha1(f"{city.lower()}_{country.lower()}".encode()).digest()
+    lat = (int.from_bytes(digest[:4], 'big') / 2 ** 32) * 100 - 50
+    lon = (int.from_bytes(digest[4:8], 'big') / 2 ** 32) * 360 - 180
+    return round(lat, 4), round(lon, 4), ''
+
+def _aladhan_day(query: dict, day: date) -> dict:
+    lat, lon, timezone_name = _place_coordinates(query['city'], query['country'])
+    method = int(query.get('method', PrayerTimesCalculator.DEFAULT_METHOD))
+    asr_factor = int(query.get('school', 0)) + 1
+    return PrayerTimesCalculator.build_day_data(lat, lon, day, method, timezone_name, asr_factor=asr_factor)
+
+def _synthesize(method: str, path: str, query: dict, body: Optional[dict]):
+    """بناء استجابة بنفس بنية الخدمة الحقيقية من البيانات المرفقة"""
+    segments = [segment for segment in path.split('/') if segment]
+    if segments[:2] == ['v1', 'timingsByCity'] and len(segments) in (2, 3):
+        day = datetime.strptime(segments[2], "%d-%m-%Y").date() if len(segments) == 3 else date.today()
+        return {'code': 200, 'status': 'OK', 'data': _aladhan_day(query, day)}
+    if segments[:2] == ['v1', 'calendarByCity'] and len(segments) in (3, 4):
+        year = int(segments[2])
+        months = [int(segments[3])] if len(segments) == 4 else range(1, 13)
+        calendar = {}
+        for month in months:
+            days = []
+            day = date(year, month, 1)
+            while day.month == month:
+                days.append(_aladhan_day(query, day))
+                day = date.fromordinal(day.toordinal() + 1)
+            calendar[str(month)] = days
+        data = calendar[segments[3]] if len(segments) == 4 else calendar
+        return {'code': 200, 'status': 'OK', 'data': data}
+    if path == '/v3.1/all':
+        with open(COUNTRIES_FILE, 'r', encoding='utf-8') as f:
+            countries = json.load(f)
+        return [{'name': {'common': english}, 'translations': {'ara': {'common': arabic}}} for english, arabic in countries]
+    if path == '/api/v0.1/countries/cities' and method == 'POST':
+        country_file = WORLD_CITIES_DIR / f"{body.get('country', '')}.json"
+        if not country_file.exists():
+            return {'error': True, 'msg': 'country not found', 'data': []}
+        with open(country_file, 'r', encoding='utf-8') as f:
+            cities = json.load(f)
+        return {'error': False, 'msg': 'cities retrieved', 'data': [city['english_name'] for city in cities]}
+    if path == '/search':
+        city, _, country = query.get('q', '').partition(',')
+        if not city.strip() or not country.strip():
+            return []
+        lat, lon, _ = _place_coordinates(city.strip(), country.strip())
+        return [{'lat': str(lat), 'lon': str(lon), 'display_name': query['q']}]
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="خادم محلي بديل للخدمات الخارجية")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help="زمن الاستجابة بالمللي ثانية")
+    parser.add_argument('--jitter', type=float, default=0, help="تذبذب زمن الاستجابة بالمللي ثانية")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="نسبة استجابات 503 (0-1)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="نسبة الاتصالات المقطوعة (0-1)")
+    parser.add_argument('--rate-limit', type=float, default=0, help="الحد الأقصى للطلبات في الثانية لكل خدمة")
+    parser.add_argument('--fixtures', type=Path, help="مجلد الاستجابات المسجلة")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    config = MockConfig(args.latency, args.jitter, args.error_rate, args.drop_rate, args.rate_limit, args.fixtures, args.seed)
+    server = MockApiServer(config, args.host, args.port)
+    logger.info(f"الخادم البديل يعمل على {server.base_url} (PRAYER_TIMES_API_BASE={server.base_url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+prayer_day.py
+سجل مدمج لمواقيت يوم واحد: الأوقات كثوانٍ منذ منتصف الليل في مصفوفة أعداد صحيحة مع بيانات التاريخ
+التنسيق (12 ساعة، ص/م) يتم عند العرض فقط، والجدول الزمني PrayerTimeline يُبنى عند أول طلب
+"""
+
+import logging
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+from prayer_timeline import PrayerTimeline
+
+logger = logging.getLogger(__name__)
+
+class PrayerDay:
+    """مواقيت مدينة في يوم واحد"""
+    __slots__ = ('day', 'seconds', 'hijri_day', 'hijri_month_ar', 'hijri_month_en', 'hijri_year',
+                 'timezone', 'method', 'latitude', 'longitude', '_timeline')
+
+    PRAYER_KEYS = PrayerTimeline.PRAYER_KEYS
+    # أسماء الصلوات في استجابة Aladhan
+    API_NAMES = ('Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Maghrib', 'Isha')
+    _INDEX = {key: i for i, key in enumerate(PRAYER_KEYS)}
+
+    def __init__(self, day: date, seconds, hijri_day: str = '', hijri_month_ar: str = '', hijri_month_en: str = '',
+                 hijri_year: str = '', timezone: str = '', method: str = '', latitude: float = 0, longitude: float = 0):
+        self.day = day
+        # ثوانٍ منذ منتصف الليل لكل صلاة بترتيب PRAYER_KEYS
+        self.seconds = array('i', seconds)
+        self.hijri_day = hijri_day
+        self.hijri_month_ar = hijri_month_ar
+        self.hijri_month_en = hijri_month_en
+        self.hijri_year = hijri_year
+        self.timezone = timezone
+        self.method = method
+        self.latitude = latitude
+        self.longitude = longitude
+        self._timeline: Optional[PrayerTimeline] = None
+
+    @classmethod
+    def from_api(cls, data: dict, fallback_day: date) -> 'PrayerDay':
+        """
+        بناء السجل من بيانات يوم بصيغة Aladhan (من API أو الحساب المحلي أو التخزين المؤقت)
+        :param fallback_day: اليوم المطلوب (من ساعة التطبيق) إذا لم تحتوِ البيانات على تاريخ صالح
+        """
+        timings = data['timings']
+        seconds = []
+        for api_name in cls.API_NAMES:
+            try:
+                hours, minutes = timings[api_name].split(' ')[0].split(':')[:2]
+                seconds.append(int(hours) * 3600 + int(minutes) * 60)
+            except (KeyError, ValueError, AttributeError) as e:
+                logger.error(f"خطأ في تنسيق الوقت {timings.get(api_name)} {e}")
+                seconds.append(0)
+
+        try:
+            day = datetime.strptime(data['date']['gregorian']['date'], "%d-%m-%Y").date()
+        except (KeyError, ValueError):
+            day = fallback_day
+
+        hijri = data.get('date', {}).get('hijri', {})
+        meta = data.get('meta', {})
+        return cls(
+            day, seconds,
+            hijri_day=str(hijri.get('day', '')),
+            hijri_month_ar=hijri.get('month', {}).get('ar', ''),
+            hijri_month_en=hijri.get('month', {}).get('en', ''),
+            hijri_year=str(hijri.get('year', '')),
+            timezone=meta.get('timezone', ''),
+            method=meta.get('method', {}).get('name', ''),
+            latitude=meta.get('latitude', 0),
+            longitude=meta.get('longitude', 0),
+        )
+
+    def seconds_of(self, prayer_key: str) -> int:
+        return self.seconds[self._INDEX[prayer_key]]
+
+    def moment(self, prayer_key: str) -> datetime:
+        """لحظة الصلاة كتاريخ ووقت (قد تكون في اليوم التالي، انظر timeline)"""
+        return self.timeline.times[self._INDEX[prayer_key]]
+
+    @property
+    def timeline(self) -> PrayerTimeline:
+        """
+        اللحظات المطلقة بترتيب PRAYER_KEYS؛ الوقت الأسبق من الصلاة التي قبله يقع بعد منتصف الليل
+        (العشاء وأحيانًا المغرب في العروض العليا صيفًا) فيُنقل إلى اليوم التالي
+        """
+        if self._timeline is None:
+            midnight = datetime.combine(self.day, datetime.min.time())
+            entries = []
+            previous = None
+            for key, s in zip(self.PRAYER_KEYS, self.seconds):
+                when = midnight + timedelta(seconds=s)
+                if previous is not None and when < previous:
+                    midnight += timedelta(days=1)
+                    when += timedelta(days=1)
+                entries.append((key, when))
+                previous = when
+            self._timeline = PrayerTimeline(self.day, entries)
+        return self._timeline
+
+    def format_time(self, prayer_key: str, language: str) -> Tuple[str, str]:
+        """الوقت بنظام 12 ساعة والفترة ("5:12", "ص") للعرض"""
+        hours, minutes = divmod(self.seconds_of(prayer_key) // 60, 60)
+        if language == 'ar':
+            period = "ص" if hours < 12 else "م"
+        else:
+            period = "AM" if hours < 12 else "PM"
+        return f"{hours % 12 or 12}:{minutes:02d}", period
+
+    def hijri_month(self, language: str) -> str:
+        return self.hijri_month_ar if language == 'ar' else self.hijri_month_en
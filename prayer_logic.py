@@ -6,10 +6,20 @@ prayer_logic.py
 """
 
 import math
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
 import logging
 import requests
-from datetime import datetime
-from typing import Tuple
+from array import array
+from datetime import datetime, date, timedelta
+from typing import Tuple, Dict, Optional, List
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from config import CACHE_DIR
 
 logger = logging.getLogger(__name__)
 
@@ -20,81 +30,248 @@ except ImportError:
     NTPLIB_AVAILABLE = False
     logger.warning("ntplib غير متوفر - مزامنة الوقت معطلة")
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+    logger.info("numpy غير متوفر - سيتم حساب الجداول السنوية يومًا بيوم")
+
 class TimeSync:
-    """فئة مزامنة الوقت مع تخزين مؤقت للتقليل من طلبات الشبكة"""
+    """
+    فئة مزامنة الوقت مع تخزين مؤقت للتقليل من طلبات الشبكة
+    بعد كل مزامنة يُربط الوقت الصحيح بساعة time.monotonic() (التي لا تتأثر بتغيير ساعة النظام)
+    ويُقدّر انحراف الساعة المحلية من المزامنات المتتالية، فتطول الفترة بين المزامنات كلما كانت الساعة مستقرة
+    """
     
     # تخزين مؤقت للوقت المتزامن
     _last_sync_time = None
     _last_local_time = None
     _time_offset = None
     _last_sync_timestamp = 0
+
+    # نموذج الساعة: الوقت الصحيح (ثواني epoch) وقراءتا الساعتين الرتيبة والنظام عند آخر مزامنة
+    _anchor_true: Optional[float] = None
+    _anchor_mono = 0.0
+    _anchor_wall = 0.0
+    # انحراف الساعة الرتيبة (ثانية لكل ثانية؛ موجب إذا كانت بطيئة)
+    _drift = 0.0
+    _next_sync_mono = 0.0
+    # المرجع الحالي مؤقت (بعد قفزة في ساعة النظام) ولا يصلح لتقدير الانحراف
+    _step_pending = False
+    _lock = threading.Lock()
     
-    # الفاصل الزمني بين عمليات المزامنة (بالثواني)
-    SYNC_INTERVAL = 3600  # مزامنة مرة واحدة كل ساعة
+    # الفاصل الزمني بين عمليات المزامنة (بالثواني) يبدأ بساعة ويتكيف مع استقرار الساعة
+    SYNC_INTERVAL = 3600
+    MIN_SYNC_INTERVAL = 900
+    MAX_SYNC_INTERVAL = 12 * 3600
+    _sync_interval = SYNC_INTERVAL
+    # خطأ التنبؤ عند المزامنة الذي تُضاعف الفترة تحته وتُنصّف فوقه (بالثواني)
+    STABLE_ERROR = 0.05
+    UNSTABLE_ERROR = 0.5
+    # أقصى انحراف مقبول (500 جزء في المليون) وأقل مدة بين مزامنتين لتقدير الانحراف
+    MAX_DRIFT = 500e-6
+    MIN_DRIFT_SPAN = 300
+    # قفزة ساعة النظام (بالثواني) التي تُعتبر تغييرًا يدويًا أو تصحيحًا من النظام
+    STEP_THRESHOLD = 1.0
+
+    NTP_SERVERS = (
+        'pool.ntp.org',
+        'time.google.com',
+        'time.windows.com',
+        'time.nist.gov',
+    )
+    # مهلة كل طلب NTP، والمدة الإضافية لانتظار بقية الخوادم بعد أول رد (بالثواني)
+    PROBE_TIMEOUT = 5
+    PROBE_GRACE = 0.3
+
+    @classmethod
+    def _model_timestamp(cls, mono: float) -> float:
+        """الوقت الصحيح المتوقع (ثواني epoch) عند قراءة الساعة الرتيبة mono (يُستدعى والقفل محجوز)"""
+        return cls._anchor_true + (mono - cls._anchor_mono) * (1.0 + cls._drift)
+
+    @classmethod
+    def _model_datetime(cls, mono: float) -> Optional[datetime]:
+        """قراءة النموذج تحت القفل حتى لا يُجمع مرجع جديد من مزامنة جارية مع انحراف أو مرجع قديم"""
+        with cls._lock:
+            if cls._anchor_true is None:
+                return None
+            timestamp = cls._model_timestamp(mono)
+        return datetime.fromtimestamp(timestamp)
+
+    @classmethod
+    def _wall_clock_stepped(cls, mono: float) -> bool:
+        """
+        اكتشاف تغيير ساعة النظام منذ آخر مزامنة وطلب مزامنة فورية للتأكد
+        الساعة الرتيبة في لينكس لا تتقدم أثناء السكون، فلا يمكن الوثوق بالنموذج بعد القفزة:
+        يُعاد ربطه بساعة النظام مع آخر فرق معروف حتى تؤكده (أو تصححه) مزامنة ناجحة
+        """
+        with cls._lock:
+            if cls._anchor_true is None:
+                return False
+            expected_wall = cls._anchor_wall + (mono - cls._anchor_mono)
+            wall = time.time()
+            step = wall - expected_wall
+            if abs(step) < cls.STEP_THRESHOLD:
+                return False
+            offset = cls._model_timestamp(mono) - expected_wall
+            cls._anchor_true = wall + offset
+            cls._anchor_mono = mono
+            cls._anchor_wall = wall
+            cls._step_pending = True
+            cls._next_sync_mono = mono
+        logger.warning(f"تغيرت ساعة النظام بمقدار {step:+.1f} ثانية - إعادة المزامنة")
+        return True
     
     @classmethod
     def sync_time(cls) -> datetime:
         """مزامنة الوقت مع خادم NTP مع تخزين مؤقت للنتائج"""
-        current_time = datetime.now()
-        current_timestamp = current_time.timestamp()
-        
-        # إذا كان هناك فرق زمني محسوب سابقًا وما زال ضمن الفترة المسموح بها، استخدمه
-        if cls._time_offset is not None and (current_timestamp - cls._last_sync_timestamp) < cls.SYNC_INTERVAL:
-            adjusted_time = current_time + cls._time_offset
-            logger.debug("استخدام الفرق الزمني المخزن مؤقتًا")
-            return adjusted_time
+        mono = time.monotonic()
+
+        # إذا كان النموذج ما زال ضمن فترة المزامنة ولم تتغير ساعة النظام، استخدمه
+        if cls._anchor_true is not None and mono < cls._next_sync_mono and not cls._wall_clock_stepped(mono):
+            cached = cls._model_datetime(mono)
+            if cached is not None:
+                logger.debug("استخدام الفرق الزمني المخزن مؤقتًا")
+                return cached
             
         # إذا لم تكن المكتبة متوفرة، استخدم الوقت المحلي
         if not NTPLIB_AVAILABLE:
-            return current_time
-
-        NTP_SERVERS = [
-            'pool.ntp.org',
-            'time.google.com',
-            'time.windows.com',
-            'time.nist.gov'
-        ]
-        
-        for server in NTP_SERVERS:
+            return datetime.now()
+
+        samples = cls._probe_servers()
+        mono = time.monotonic()
+        if not samples:
+            logger.error("فشل في مزامنة الوقت من جميع خوادم NTP.")
+            with cls._lock:
+                # عدم إعادة المحاولة مع كل استدعاء؛ النموذج الحالي (إن وجد) يبقى مستخدمًا
+                # وبعد قفزة في ساعة النظام يكون مربوطًا بها مع آخر فرق معروف
+                cls._next_sync_mono = mono + cls.MIN_SYNC_INTERVAL
+            return cls._model_datetime(mono) or datetime.now()
+
+        # أقل تأخير ذهاب وإياب يعني أقل خطأ في حساب الفرق الزمني
+        server, response = min(samples, key=lambda sample: sample[1].delay)
+        wall = time.time()
+        true_time = wall + response.offset
+
+        with cls._lock:
+            if cls._step_pending:
+                # المرجع مؤقت من ساعة النظام: لا يُقاس عليه الانحراف ولا استقرار الساعة
+                cls._step_pending = False
+            elif cls._anchor_true is not None:
+                error = true_time - cls._model_timestamp(mono)
+                span = mono - cls._anchor_mono
+                if span >= cls.MIN_DRIFT_SPAN:
+                    measured = (true_time - cls._anchor_true) / span - 1.0
+                    drift = cls._drift + 0.5 * (measured - cls._drift)
+                    cls._drift = max(-cls.MAX_DRIFT, min(cls.MAX_DRIFT, drift))
+                if abs(error) < cls.STABLE_ERROR:
+                    cls._sync_interval = min(cls._sync_interval * 2, cls.MAX_SYNC_INTERVAL)
+                elif abs(error) > cls.UNSTABLE_ERROR:
+                    cls._sync_interval = max(cls._sync_interval / 2, cls.MIN_SYNC_INTERVAL)
+                logger.debug(f"خطأ نموذج الساعة {error * 1000:+.0f} ms, الانحراف {cls._drift * 1e6:+.1f} ppm")
+            cls._anchor_true = true_time
+            cls._anchor_mono = mono
+            cls._anchor_wall = wall
+            cls._next_sync_mono = mono + cls._sync_interval
+
+            synced_time = datetime.fromtimestamp(true_time)
+            cls._time_offset = timedelta(seconds=response.offset)
+            cls._last_sync_time = synced_time
+            cls._last_local_time = datetime.fromtimestamp(wall)
+            cls._last_sync_timestamp = wall
+
+        logger.info(f"تم مزامنة الوقت مع خادم NTP: {server} (التأخير {response.delay * 1000:.0f} ms "
+                    f"من {len(samples)} خوادم), الفرق: {cls._time_offset}, المزامنة التالية بعد {cls._sync_interval / 60:.0f} دقيقة")
+        return synced_time
+
+    @classmethod
+    def _probe_servers(cls) -> List[tuple]:
+        """
+        إرسال طلبات NTP إلى جميع الخوادم بالتوازي وإرجاع الردود [(الخادم، الرد)]
+        بعد أول رد يُنتظر PROBE_GRACE فقط لبقية الخوادم، ولا يُنتظر الخوادم التي لا ترد
+        """
+        servers = []
+        for server in cls.NTP_SERVERS:
+            # تخطي الخوادم المعروف أنها غير متاحة حاليًا بدلاً من انتظار المهلة الكاملة
+            breaker = CircuitBreaker.for_host(server)
             try:
-                client = ntplib.NTPClient()
-                response = client.request(server, timeout=5)  # تقليل فترة انتظار الطلب
-                
-                # احسب الوقت المتزامن
-                synced_time = datetime.fromtimestamp(response.tx_time)
-                
-                # احسب الفرق الزمني بين الوقت المحلي والوقت المتزامن
-                cls._time_offset = synced_time - current_time
-                cls._last_sync_time = synced_time
-                cls._last_local_time = current_time
-                cls._last_sync_timestamp = current_timestamp
-                
-                logger.info(f"تم مزامنة الوقت مع خادم NTP: {server}, الفرق: {cls._time_offset}")
-                return synced_time
+                breaker.before_call()
+            except CircuitOpenError as e:
+                logger.debug(f"تخطي خادم NTP {server}: {e}")
+                continue
+            servers.append((server, breaker))
+        if not servers:
+            return []
+
+        # خيوط daemon: الطلب المعلق لخادم لا يرد ينتهي بمهلته في الخلفية ولا يؤخر إغلاق البرنامج
+        # (خيوط ThreadPoolExecutor يُنتظر انتهاؤها عند الخروج)
+        results = queue.Queue()
+
+        def probe(server: str, breaker: CircuitBreaker):
+            started = time.monotonic()
+            try:
+                response = ntplib.NTPClient().request(server, timeout=cls.PROBE_TIMEOUT)
             except Exception as e:
+                breaker.record_failure(e)
                 logger.warning(f"فشل في مزامنة الوقت من {server}: {e}")
-        
-        logger.error("فشل في مزامنة الوقت من جميع خوادم NTP.")
-        return current_time
-    
+                results.put(None)
+                return
+            breaker.record_success(time.monotonic() - started)
+            results.put((server, response))
+
+        for server, breaker in servers:
+            threading.Thread(target=probe, args=(server, breaker), name=f'ntp-{server}', daemon=True).start()
+
+        samples = []
+        deadline = time.monotonic() + cls.PROBE_TIMEOUT + 1
+        for _ in servers:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                result = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if result is None:
+                continue
+            if not samples:
+                # بعد أول رد يُنتظر بقية الخوادم لمدة قصيرة فقط لاختيار أقلها تأخيرًا
+                deadline = min(deadline, time.monotonic() + cls.PROBE_GRACE)
+            samples.append(result)
+        return samples
+
+    @classmethod
+    def sync_due(cls) -> bool:
+        """
+        هل حان موعد المزامنة التالية (أو لم تتم مزامنة ناجحة بعد، أو تغيرت ساعة النظام)
+        فحص قفزة ساعة النظام يتم هنا فقط (يستدعيه SystemClock مع كل قراءة للوقت في حلقة التحديث)
+        """
+        mono = time.monotonic()
+        cls._wall_clock_stepped(mono)
+        return NTPLIB_AVAILABLE and mono >= cls._next_sync_mono
+
+    @classmethod
+    def now(cls) -> datetime:
+        """الوقت الحالي حسب نموذج الساعة بدون أي اتصال بالشبكة (الوقت المحلي قبل أول مزامنة)"""
+        return cls._model_datetime(time.monotonic()) or datetime.now()
+
     @classmethod
     def get_current_time(cls) -> datetime:
         """الحصول على الوقت الحالي المتزامن بدون الاتصال بالخادم في كل مرة"""
-        if cls._time_offset is None:
-            # إذا لم تتم المزامنة من قبل، قم بإجراء المزامنة
-            return cls.sync_time()
-        
-        # استخدم الفرق الزمني المحسوب مسبقًا
-        current_time = datetime.now()
-        current_timestamp = current_time.timestamp()
-        
-        # إذا مر وقت طويل منذ آخر مزامنة، قم بمزامنة جديدة
-        if (current_timestamp - cls._last_sync_timestamp) >= cls.SYNC_INTERVAL:
+        mono = time.monotonic()
+        if cls._anchor_true is None:
+            # إذا لم تتم المزامنة من قبل، قم بإجراء المزامنة (إلا بعد فشل حديث)
+            if mono >= cls._next_sync_mono:
+                return cls.sync_time()
+            return datetime.now()
+
+        # إذا حان موعد المزامنة التالية أو تغيرت ساعة النظام، قم بمزامنة جديدة
+        if mono >= cls._next_sync_mono or cls._wall_clock_stepped(mono):
             return cls.sync_time()
-            
-        # استخدم الفرق الزمني المحسوب مسبقًا
-        adjusted_time = current_time + cls._time_offset
-        return adjusted_time
+
+        return cls._model_datetime(mono) or datetime.now()
 
 class QiblaCalculator:
     """حاسبة اتجاه القبلة مع تخزين مؤقت للنتائج"""
@@ -184,3 +361,538 @@ class QiblaCalculator:
         cls._qibla_cache.clear()
         cls._distance_cache.clear()
         logger.debug("تم مسح التخزين المؤقت لحسابات القبلة")
+
+class PrayerTimesCalculator:
+    """
+    حاسبة مواقيت الصلاة محلياً بدون اتصال بالشبكة
+    تعتمد على خوارزمية PrayTimes الفلكية (موقع الشمس ومعادلة الزمن)
+    ومعرفات طرق الحساب مطابقة لمعرفات Aladhan API حتى تتطابق النتائج مع الخادم
+    """
+
+    # معاملات طرق الحساب: زوايا الفجر/العشاء بالدرجات، أو عدد دقائق العشاء بعد المغرب
+    METHOD_PARAMS = {
+        1: {'name': 'University of Islamic Sciences, Karachi', 'fajr': 18, 'isha': 18},
+        2: {'name': 'Islamic Society of North America (ISNA)', 'fajr': 15, 'isha': 15},
+        3: {'name': 'Muslim World League', 'fajr': 18, 'isha': 17},
+        4: {'name': 'Umm Al-Qura University, Makkah', 'fajr': 18.5, 'isha_minutes': 90},
+        5: {'name': 'Egyptian General Authority of Survey', 'fajr': 19.5, 'isha': 17.5},
+        7: {'name': 'Institute of Geophysics, University of Tehran', 'fajr': 17.7, 'isha': 14, 'maghrib': 4.5},
+        8: {'name': 'Gulf Region', 'fajr': 19.5, 'isha_minutes': 90},
+        9: {'name': 'Kuwait', 'fajr': 18, 'isha': 17.5},
+        10: {'name': 'Qatar', 'fajr': 18, 'isha_minutes': 90},
+        11: {'name': 'Majlis Ugama Islam Singapura, Singapore', 'fajr': 20, 'isha': 18},
+        12: {'name': 'Union Organization islamic de France', 'fajr': 12, 'isha': 12},
+        13: {'name': 'Diyanet İşleri Başkanlığı, Turkey', 'fajr': 18, 'isha': 17,
+             'offsets': {'Sunrise': -7, 'Dhuhr': 5, 'Asr': 4, 'Maghrib': 7}},
+        14: {'name': 'Spiritual Administration of Muslims of Russia', 'fajr': 16, 'isha': 15},
+        15: {'name': 'Moonsighting Committee Worldwide', 'fajr': 18, 'isha': 18},
+    }
+    DEFAULT_METHOD = 5
+
+    PRAYER_NAMES = ('Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Maghrib', 'Isha')
+    SUNRISE_ANGLE = 0.833
+
+    HIJRI_MONTHS = {
+        'ar': ['مُحَرَّم', 'صَفَر', 'رَبيع الأوَّل', 'رَبيع الثاني', 'جُمادى الأولى', 'جُمادى الآخرة',
+               'رَجَب', 'شَعْبان', 'رَمَضان', 'شَوّال', 'ذوالقعدة', 'ذوالحجة'],
+        'en': ['Muḥarram', 'Ṣafar', 'Rabīʿ al-awwal', 'Rabīʿ al-thānī', 'Jumādá al-ūlá', 'Jumādá al-ākhirah',
+               'Rajab', 'Shaʿbān', 'Ramaḍān', 'Shawwāl', 'Dhū al-Qaʿdah', 'Dhū al-Ḥijjah'],
+    }
+
+    @staticmethod
+    def _fix(value: float, mod: float) -> float:
+        """تطبيع قيمة ضمن المدى [0, mod)"""
+        if math.isnan(value):
+            return value
+        value = value - mod * math.floor(value / mod)
+        return value + mod if value < 0 else value
+
+    @staticmethod
+    def julian_date(year: int, month: int, day: int) -> float:
+        """حساب اليوم اليولياني لتاريخ ميلادي"""
+        if month <= 2:
+            year -= 1
+            month += 12
+        a = math.floor(year / 100)
+        b = 2 - a + math.floor(a / 4)
+        return math.floor(365.25 * (year + 4716)) + math.floor(30.6001 * (month + 1)) + day + b - 1524.5
+
+    @classmethod
+    def sun_position(cls, jd: float) -> Tuple[float, float]:
+        """ميل الشمس (بالدرجات) ومعادلة الزمن (بالساعات) من الجدول المشترك، أو بالحساب المباشر خارج مداه"""
+        position = SolarEphemeris.lookup(jd)
+        if position is not None:
+            return position
+        return cls.sun_position_series(jd)
+
+    @classmethod
+    def sun_position_series(cls, jd: float) -> Tuple[float, float]:
+        """حساب ميل الشمس (بالدرجات) ومعادلة الزمن (بالساعات) ليوم يولياني من المتسلسلة المثلثية"""
+        d = jd - 2451545.0
+        g = math.radians(cls._fix(357.529 + 0.98560028 * d, 360))
+        q = cls._fix(280.459 + 0.98564736 * d, 360)
+        l = math.radians(cls._fix(q + 1.915 * math.sin(g) + 0.020 * math.sin(2 * g), 360))
+        e = math.radians(23.439 - 0.00000036 * d)
+
+        ra = math.degrees(math.atan2(math.cos(e) * math.sin(l), math.cos(l))) / 15
+        equation = q / 15 - cls._fix(ra, 24)
+        declination = math.degrees(math.asin(math.sin(e) * math.sin(l)))
+        return declination, equation
+
+    @staticmethod
+    def local_utc_offset(day: date, timezone_name: str = '') -> float:
+        """فرق التوقيت عن UTC بالساعات للتاريخ المحدد (المنطقة الزمنية للمدينة أو للنظام)"""
+        noon = datetime(day.year, day.month, day.day, 12)
+        if timezone_name:
+            try:
+                from zoneinfo import ZoneInfo
+                return noon.replace(tzinfo=ZoneInfo(timezone_name)).utcoffset().total_seconds() / 3600
+            except Exception as e:
+                logger.warning(f"تعذر تحميل المنطقة الزمنية {timezone_name}: {e}")
+        return noon.astimezone().utcoffset().total_seconds() / 3600
+
+    @classmethod
+    def calculate(cls, lat: float, lon: float, day: date, method: int = DEFAULT_METHOD,
+                  tz_offset: Optional[float] = None, asr_factor: int = 1,
+                  adjustments: Optional[Dict[str, int]] = None) -> Dict[str, float]:
+        """
+        حساب مواقيت الصلاة بالساعات العشرية (بالتوقيت المحلي للمدينة)
+        :param tz_offset: فرق التوقيت عن UTC بالساعات، إذا لم يحدد يستخدم توقيت النظام
+        :param asr_factor: 1 للمذهب الشافعي (الجمهور) و 2 للمذهب الحنفي
+        :param adjustments: تعديلات المستخدم بالدقائق لكل صلاة (مثل {'Fajr': 2})
+        :return: قاموس من اسم الصلاة إلى الوقت (قد يكون NaN في خطوط العرض القصوى)
+        """
+        params = cls.METHOD_PARAMS.get(method, cls.METHOD_PARAMS[cls.DEFAULT_METHOD])
+        if tz_offset is None:
+            tz_offset = cls.local_utc_offset(day)
+
+        jdate = cls.julian_date(day.year, day.month, day.day) - lon / (15 * 24)
+        lat_rad = math.radians(lat)
+
+        def mid_day(portion: float) -> float:
+            _, equation = cls.sun_position(jdate + portion)
+            return cls._fix(12 - equation, 24)
+
+        def sun_angle_time(angle: float, portion: float, ccw: bool = False) -> float:
+            declination, equation = cls.sun_position(jdate + portion)
+            decl_rad = math.radians(declination)
+            noon = cls._fix(12 - equation, 24)
+            cos_t = (-math.sin(math.radians(angle)) - math.sin(decl_rad) * math.sin(lat_rad)) / \
+                    (math.cos(decl_rad) * math.cos(lat_rad))
+            if cos_t < -1 or cos_t > 1:
+                return math.nan
+            t = math.degrees(math.acos(cos_t)) / 15
+            return noon - t if ccw else noon + t
+
+        def asr_time(portion: float) -> float:
+            declination, _ = cls.sun_position(jdate + portion)
+            angle = -math.degrees(math.atan(1 / (asr_factor + math.tan(math.radians(abs(lat - declination))))))
+            return sun_angle_time(angle, portion)
+
+        # تقدير أولي ثم تكرار واحد كما في الخوارزمية الأصلية
+        fajr = sun_angle_time(params['fajr'], 5 / 24, ccw=True)
+        sunrise = sun_angle_time(cls.SUNRISE_ANGLE, 6 / 24, ccw=True)
+        dhuhr = mid_day(12 / 24)
+        asr = asr_time(13 / 24)
+        sunset = sun_angle_time(cls.SUNRISE_ANGLE, 18 / 24)
+        maghrib = sun_angle_time(params['maghrib'], 18 / 24) if 'maghrib' in params else sunset
+        isha = sun_angle_time(params['isha'], 18 / 24) if 'isha' in params else math.nan
+
+        # التحويل من التوقيت الشمسي إلى التوقيت المحلي
+        shift = tz_offset - lon / 15
+        fajr, sunrise, dhuhr, asr, sunset, maghrib, isha = (
+            t + shift for t in (fajr, sunrise, dhuhr, asr, sunset, maghrib, isha))
+
+        # معالجة خطوط العرض العالية (طريقة الزاوية)
+        night = cls._fix(sunrise - sunset, 24)
+        fajr = cls._adjust_high_latitude(fajr, sunrise, params['fajr'], night, ccw=True)
+        if 'isha' in params:
+            isha = cls._adjust_high_latitude(isha, sunset, params['isha'], night)
+        if 'maghrib' in params:
+            maghrib = cls._adjust_high_latitude(maghrib, sunset, params['maghrib'], night)
+
+        if 'isha_minutes' in params:
+            isha_minutes = params['isha_minutes']
+            # أم القرى تؤخر العشاء إلى ساعتين في رمضان
+            if method == 4 and cls.gregorian_to_hijri(day)[1] == 9:
+                isha_minutes = 120
+            isha = maghrib + isha_minutes / 60
+
+        times = dict(zip(cls.PRAYER_NAMES, (fajr, sunrise, dhuhr, asr, maghrib, isha)))
+        for offsets in (params.get('offsets', {}), adjustments or {}):
+            for name, minutes in offsets.items():
+                times[name] += minutes / 60
+        return times
+
+    @classmethod
+    def _adjust_high_latitude(cls, time_value: float, base: float, angle: float, night: float,
+                              ccw: bool = False) -> float:
+        """تقييد الوقت بجزء من الليل يتناسب مع الزاوية عندما لا تصل الشمس للزاوية المطلوبة"""
+        portion = angle / 60 * night
+        if math.isnan(time_value):
+            return base - portion if ccw else base + portion
+        diff = cls._fix(base - time_value, 24) if ccw else cls._fix(time_value - base, 24)
+        if diff > portion:
+            return base - portion if ccw else base + portion
+        return time_value
+
+    @classmethod
+    def format_time(cls, hours: float) -> str:
+        """تنسيق الوقت العشري بصيغة HH:MM مع التقريب لأقرب دقيقة"""
+        if math.isnan(hours):
+            return '--:--'
+        hours = cls._fix(hours + 0.5 / 60, 24)
+        h = int(hours)
+        m = int((hours - h) * 60)
+        return f"{h:02d}:{m:02d}"
+
+    @classmethod
+    def get_timings(cls, lat: float, lon: float, day: date, method: int = DEFAULT_METHOD,
+                    tz_offset: Optional[float] = None, asr_factor: int = 1,
+                    adjustments: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+        """حساب المواقيت منسقة بصيغة HH:MM كما يعيدها Aladhan API"""
+        times = cls.calculate(lat, lon, day, method, tz_offset, asr_factor, adjustments)
+        return {name: cls.format_time(value) for name, value in times.items()}
+
+    @staticmethod
+    def gregorian_to_hijri(day: date) -> Tuple[int, int, int]:
+        """تحويل تاريخ ميلادي إلى هجري بالتقويم الجدولي (قد يختلف بيوم عن رؤية الهلال)"""
+        jd = day.toordinal() + 1721425  # اليوم اليولياني عند منتصف النهار
+        days = jd - 1948440 + 10632
+        cycle = (days - 1) // 10631
+        days = days - 10631 * cycle + 354
+        j = ((10985 - days) // 5316) * ((50 * days) // 17719) + (days // 5670) * ((43 * days) // 15238)
+        days = days - ((30 - j) // 15) * ((17719 * j) // 50) - (j // 16) * ((15238 * j) // 43) + 29
+        month = (24 * days) // 709
+        hijri_day = days - (709 * month) // 24
+        year = 30 * cycle + j - 30
+        return hijri_day, month, year
+
+    @classmethod
+    def build_day_data(cls, lat: float, lon: float, day: date, method: int = DEFAULT_METHOD,
+                       timezone_name: str = '', asr_factor: int = 1,
+                       adjustments: Optional[Dict[str, int]] = None) -> dict:
+        """
+        حساب مواقيت يوم كامل وإرجاعها بنفس بنية بيانات Aladhan API
+        حتى يمكن تمريرها مباشرة إلى parse_api_data والتخزين المؤقت
+        """
+        tz_offset = cls.local_utc_offset(day, timezone_name)
+        hijri_day, hijri_month, hijri_year = cls.gregorian_to_hijri(day)
+        params = cls.METHOD_PARAMS.get(method, cls.METHOD_PARAMS[cls.DEFAULT_METHOD])
+        return {
+            'timings': cls.get_timings(lat, lon, day, method, tz_offset, asr_factor, adjustments),
+            'date': {
+                'gregorian': {'date': day.strftime('%d-%m-%Y')},
+                'hijri': {
+                    'day': f"{hijri_day:02d}",
+                    'month': {'number': hijri_month,
+                              'ar': cls.HIJRI_MONTHS['ar'][hijri_month - 1],
+                              'en': cls.HIJRI_MONTHS['en'][hijri_month - 1]},
+                    'year': str(hijri_year),
+                },
+            },
+            'meta': {
+                'latitude': lat,
+                'longitude': lon,
+                'timezone': timezone_name,
+                'method': {'id': method, 'name': params['name']},
+                'source': 'local',
+            },
+        }
+
+    @classmethod
+    def calculate_array(cls, lat, lon, jd, tz_offset, method: int = DEFAULT_METHOD,
+                        asr_factor: int = 1, hijri_months=None,
+                        adjustments: Optional[Dict[str, int]] = None) -> Dict[str, "np.ndarray"]:
+        """
+        النسخة المتجهة من calculate باستخدام numpy
+        جميع المدخلات (lat, lon, jd, tz_offset) مصفوفات قابلة للبث (broadcast) معًا،
+        فيمكن حساب سنة كاملة لمدينة واحدة أو يوم واحد لآلاف المدن في تمريرة واحدة
+        :param jd: اليوم اليولياني لمنتصف الليل (ناتج julian_date)
+        :param hijri_months: أرقام الأشهر الهجرية (مطلوبة فقط لطريقة أم القرى في رمضان)
+        """
+        params = cls.METHOD_PARAMS.get(method, cls.METHOD_PARAMS[cls.DEFAULT_METHOD])
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        jdate = np.asarray(jd, dtype=np.float64) - lon / (15 * 24)
+        tz_offset = np.asarray(tz_offset, dtype=np.float64)
+        lat_rad = np.radians(lat)
+
+        def mid_day(portion):
+            _, equation = cls.sun_position_array(jdate + portion)
+            return (12 - equation) % 24
+
+        def sun_angle_time(angle, portion, ccw=False):
+            declination, equation = cls.sun_position_array(jdate + portion)
+            decl_rad = np.radians(declination)
+            noon = (12 - equation) % 24
+            cos_t = (-np.sin(np.radians(angle)) - np.sin(decl_rad) * np.sin(lat_rad)) / \
+                    (np.cos(decl_rad) * np.cos(lat_rad))
+            t = np.degrees(np.arccos(cos_t)) / 15
+            return noon - t if ccw else noon + t
+
+        def asr_time(portion):
+            declination, _ = cls.sun_position_array(jdate + portion)
+            angle = -np.degrees(np.arctan(1 / (asr_factor + np.tan(np.radians(np.abs(lat - declination))))))
+            return sun_angle_time(angle, portion)
+
+        def adjust_high_latitude(time_value, base, angle, night, ccw=False):
+            portion = angle / 60 * night
+            diff = (base - time_value) % 24 if ccw else (time_value - base) % 24
+            adjusted = base - portion if ccw else base + portion
+            return np.where(np.isnan(time_value) | (diff > portion), adjusted, time_value)
+
+        with np.errstate(invalid='ignore'):
+            fajr = sun_angle_time(params['fajr'], 5 / 24, ccw=True)
+            sunrise = sun_angle_time(cls.SUNRISE_ANGLE, 6 / 24, ccw=True)
+            dhuhr = mid_day(12 / 24)
+            asr = asr_time(13 / 24)
+            sunset = sun_angle_time(cls.SUNRISE_ANGLE, 18 / 24)
+            maghrib = sun_angle_time(params['maghrib'], 18 / 24) if 'maghrib' in params else sunset
+            isha = sun_angle_time(params['isha'], 18 / 24) if 'isha' in params else np.full_like(sunset, np.nan)
+
+            shift = tz_offset - lon / 15
+            fajr, sunrise, dhuhr, asr, sunset, maghrib, isha = (
+                t + shift for t in (fajr, sunrise, dhuhr, asr, sunset, maghrib, isha))
+
+            night = (sunrise - sunset) % 24
+            fajr = adjust_high_latitude(fajr, sunrise, params['fajr'], night, ccw=True)
+            if 'isha' in params:
+                isha = adjust_high_latitude(isha, sunset, params['isha'], night)
+            if 'maghrib' in params:
+                maghrib = adjust_high_latitude(maghrib, sunset, params['maghrib'], night)
+
+        if 'isha_minutes' in params:
+            isha_minutes = params['isha_minutes']
+            if method == 4 and hijri_months is not None:
+                isha_minutes = np.where(np.asarray(hijri_months) == 9, 120, isha_minutes)
+            isha = maghrib + np.asarray(isha_minutes) / 60
+
+        times = dict(zip(cls.PRAYER_NAMES, (fajr, sunrise, dhuhr, asr, maghrib, isha)))
+        for offsets in (params.get('offsets', {}), adjustments or {}):
+            for name, minutes in offsets.items():
+                times[name] = times[name] + minutes / 60
+        return times
+
+    @classmethod
+    def sun_position_array(cls, jd):
+        """النسخة المتجهة من sun_position"""
+        position = SolarEphemeris.lookup_array(jd)
+        if position is not None:
+            return position
+        return cls.sun_position_series_array(jd)
+
+    @staticmethod
+    def sun_position_series_array(jd):
+        """النسخة المتجهة من sun_position_series"""
+        d = jd - 2451545.0
+        g = np.radians((357.529 + 0.98560028 * d) % 360)
+        q = (280.459 + 0.98564736 * d) % 360
+        l = np.radians((q + 1.915 * np.sin(g) + 0.020 * np.sin(2 * g)) % 360)
+        e = np.radians(23.439 - 0.00000036 * d)
+
+        ra = np.degrees(np.arctan2(np.cos(e) * np.sin(l), np.cos(l))) / 15
+        equation = q / 15 - ra % 24
+        declination = np.degrees(np.arcsin(np.sin(e) * np.sin(l)))
+        return declination, equation
+
+    @staticmethod
+    def hours_to_minutes_array(hours):
+        """تحويل الأوقات العشرية إلى دقائق منذ منتصف الليل (int16) بنفس تقريب format_time، و -1 للقيم غير المعرفة"""
+        with np.errstate(invalid='ignore'):
+            wrapped = (hours + 0.5 / 60) % 24
+            whole_hours = np.floor(wrapped)
+            minutes = whole_hours * 60 + np.floor((wrapped - whole_hours) * 60)
+        return np.where(np.isnan(minutes), -1, minutes).astype(np.int16)
+
+    @classmethod
+    def calculate_days(cls, lat: float, lon: float, days: List[date], method: int = DEFAULT_METHOD,
+                       timezone_name: str = '', asr_factor: int = 1,
+                       adjustments: Optional[Dict[str, int]] = None):
+        """
+        حساب جدول مواقيت لعدة أيام لمدينة واحدة في تمريرة متجهة واحدة
+        :return: مصفوفة int16 بحجم (عدد الأيام، 6) بالدقائق منذ منتصف الليل بترتيب PRAYER_NAMES،
+                 و -1 للأوقات غير المعرفة. بدون numpy تعاد array('h') مسطحة (6 قيم لكل يوم)
+        """
+        tz_offsets = [cls.local_utc_offset(day, timezone_name) for day in days]
+        if not NUMPY_AVAILABLE:
+            table = array('h')
+            for day, tz_offset in zip(days, tz_offsets):
+                table.extend(cls._minutes_row(lat, lon, day, method, tz_offset, asr_factor, adjustments))
+            return table
+
+        jd = np.array([cls.julian_date(day.year, day.month, day.day) for day in days])
+        hijri_months = [cls.gregorian_to_hijri(day)[1] for day in days] if method == 4 else None
+        times = cls.calculate_array(lat, lon, jd, tz_offsets, method, asr_factor, hijri_months, adjustments)
+        return np.stack([cls.hours_to_minutes_array(times[name]) for name in cls.PRAYER_NAMES], axis=1)
+
+    @classmethod
+    def _minutes_row(cls, lat: float, lon: float, day: date, method: int, tz_offset: float,
+                     asr_factor: int, adjustments: Optional[Dict[str, int]] = None) -> List[int]:
+        """حساب يوم واحد بالمسار العادي كصف دقائق (يستخدم عند غياب numpy)"""
+        times = cls.calculate(lat, lon, day, method, tz_offset, asr_factor, adjustments)
+        row = []
+        for name in cls.PRAYER_NAMES:
+            formatted = cls.format_time(times[name])
+            row.append(-1 if formatted == '--:--' else int(formatted[:2]) * 60 + int(formatted[3:]))
+        return row
+
+    @classmethod
+    def calculate_locations(cls, lats, lons, day: date, tz_offsets, method: int = DEFAULT_METHOD,
+                            asr_factor: int = 1, adjustments: Optional[Dict[str, int]] = None):
+        """
+        حساب مواقيت يوم واحد لعدد كبير من المواقع كعملية مصفوفية واحدة
+        :param tz_offsets: فرق التوقيت عن UTC لكل موقع بالساعات
+        :return: مصفوفة int16 بحجم (عدد المواقع، 6) بنفس تنسيق calculate_days
+        """
+        if not NUMPY_AVAILABLE:
+            table = array('h')
+            for lat, lon, tz_offset in zip(lats, lons, tz_offsets):
+                table.extend(cls._minutes_row(lat, lon, day, method, tz_offset, asr_factor, adjustments))
+            return table
+
+        jd = cls.julian_date(day.year, day.month, day.day)
+        hijri_months = cls.gregorian_to_hijri(day)[1] if method == 4 else None
+        times = cls.calculate_array(lats, lons, jd, tz_offsets, method, asr_factor, hijri_months, adjustments)
+        return np.stack([cls.hours_to_minutes_array(times[name]) for name in cls.PRAYER_NAMES], axis=1)
+
+    @classmethod
+    def calculate_year(cls, lat: float, lon: float, year: int, method: int = DEFAULT_METHOD,
+                       timezone_name: str = '', asr_factor: int = 1,
+                       adjustments: Optional[Dict[str, int]] = None):
+        """حساب جدول سنة كاملة لمدينة واحدة (انظر calculate_days لشكل النتيجة)"""
+        first_day = date(year, 1, 1)
+        day_count = (date(year + 1, 1, 1) - first_day).days
+        days = [first_day + timedelta(days=i) for i in range(day_count)]
+        return cls.calculate_days(lat, lon, days, method, timezone_name, asr_factor, adjustments)
+
+
+class SolarEphemeris:
+    """
+    جدول مشترك مسبق الحساب لميل الشمس ومعادلة الزمن لكل يوم من 1900 إلى 2100
+    هذه القيم تعتمد على التاريخ فقط وليس على المدينة، فتُحسب مرة واحدة وتُحفظ في ملف ثنائي
+    يُفتح عبر mmap، ثم تُستخرج قيم أي لحظة بالاستيفاء الخطي بين يومين متتاليين
+    """
+
+    FIRST_YEAR = 1900
+    LAST_YEAR = 2100
+    MAGIC = b'PTEPHEM1'
+    # الترويسة: المعرّف، اليوم اليولياني لأول صف، عدد الصفوف (بحجم 32 بايت لمحاذاة القيم)
+    HEADER = struct.Struct('<8sdI12x')
+    TABLE_FILE = CACHE_DIR / 'solar_ephemeris_1900_2100.bin'
+
+    _lock = threading.Lock()
+    _loaded = False
+    _values = None      # memoryview مسطح من نوع 'd' (ميل، معادلة) لكل يوم
+    _array = None       # نفس البيانات كمصفوفة numpy (عدد الأيام × 2) بدون نسخ
+    _start_jd = 0.0
+    _count = 0
+    _mmap = None
+
+    @classmethod
+    def _expected_range(cls) -> Tuple[float, int]:
+        start_jd = PrayerTimesCalculator.julian_date(cls.FIRST_YEAR, 1, 1)
+        end_jd = PrayerTimesCalculator.julian_date(cls.LAST_YEAR, 12, 31)
+        return start_jd, int(end_jd - start_jd) + 1
+
+    @classmethod
+    def build(cls) -> bytes:
+        """حساب الجدول كاملاً وإرجاعه بالتنسيق الثنائي (الترويسة ثم القيم)"""
+        start_jd, count = cls._expected_range()
+        if NUMPY_AVAILABLE:
+            jd = start_jd + np.arange(count, dtype=np.float64)
+            declination, equation = PrayerTimesCalculator.sun_position_series_array(jd)
+            # حصر معادلة الزمن في [-12, 12) حتى يكون الاستيفاء بين يومين متصلاً
+            equation = (equation + 12) % 24 - 12
+            body = np.column_stack((declination, equation)).astype('<f8').tobytes()
+        else:
+            values = array('d')
+            for i in range(count):
+                declination, equation = PrayerTimesCalculator.sun_position_series(start_jd + i)
+                values.extend((declination, (equation + 12) % 24 - 12))
+            body = values.tobytes()
+        return cls.HEADER.pack(cls.MAGIC, start_jd, count) + body
+
+    @classmethod
+    def _is_valid(cls, buffer) -> bool:
+        start_jd, count = cls._expected_range()
+        if len(buffer) != cls.HEADER.size + count * 16:
+            return False
+        magic, file_start_jd, file_count = cls.HEADER.unpack_from(buffer, 0)
+        return magic == cls.MAGIC and file_start_jd == start_jd and file_count == count
+
+    @classmethod
+    def _open_table_file(cls):
+        """فتح ملف الجدول عبر mmap، مع إنشائه أولاً إذا لم يكن موجودًا أو كان تالفًا"""
+        table_file = cls.TABLE_FILE
+        if table_file.exists():
+            with open(table_file, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if cls._is_valid(mapped):
+                return mapped
+            mapped.close()
+            logger.warning("ملف جدول موقع الشمس تالف - سيتم إعادة إنشائه")
+
+        data = cls.build()
+        try:
+            table_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = table_file.with_suffix('.tmp')
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, table_file)
+            logger.info(f"تم إنشاء جدول موقع الشمس {table_file}")
+            with open(table_file, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError as e:
+            logger.warning(f"تعذر حفظ جدول موقع الشمس، سيتم استخدامه من الذاكرة: {e}")
+            return data
+
+    @classmethod
+    def _ensure_loaded(cls) -> bool:
+        if cls._loaded:
+            return cls._values is not None
+        with cls._lock:
+            if not cls._loaded:
+                try:
+                    buffer = cls._open_table_file()
+                    if isinstance(buffer, mmap.mmap):
+                        cls._mmap = buffer
+                    cls._start_jd, cls._count = cls._expected_range()
+                    cls._values = memoryview(buffer)[cls.HEADER.size:].cast('d')
+                    if NUMPY_AVAILABLE:
+                        cls._array = np.frombuffer(buffer, dtype='<f8', offset=cls.HEADER.size).reshape(-1, 2)
+                except Exception as e:
+                    logger.error(f"خطأ في تحميل جدول موقع الشمس، سيتم الحساب المباشر: {e}")
+                    cls._values = None
+                    cls._array = None
+                cls._loaded = True
+        return cls._values is not None
+
+    @classmethod
+    def lookup(cls, jd: float) -> Optional[Tuple[float, float]]:
+        """ميل الشمس ومعادلة الزمن للحظة jd بالاستيفاء، أو None إذا كانت خارج مدى الجدول"""
+        if not cls._ensure_loaded():
+            return None
+        position = jd - cls._start_jd
+        index = math.floor(position)
+        if index < 0 or index + 1 >= cls._count:
+            return None
+        fraction = position - index
+        values = cls._values
+        decl_0, eq_0, decl_1, eq_1 = values[2 * index:2 * index + 4]
+        return decl_0 + (decl_1 - decl_0) * fraction, eq_0 + (eq_1 - eq_0) * fraction
+
+    @classmethod
+    def lookup_array(cls, jd):
+        """النسخة المتجهة من lookup (None إذا كانت أي قيمة خارج مدى الجدول)"""
+        if not cls._ensure_loaded() or cls._array is None:
+            return None
+        position = np.asarray(jd, dtype=np.float64) - cls._start_jd
+        index = np.floor(position).astype(np.int64)
+        if index.size and (index.min() < 0 or index.max() + 1 >= cls._count):
+            return None
+        fraction = position - index
+        first = cls._array[index]
+        second = cls._array[index + 1]
+        values = first + (second - first) * fraction[..., np.newaxis]
+        return values[..., 0], values[..., 1]
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+prayer_scheduler.py
+جدولة إشعارات الصلاة والأذان بالأحداث بدلاً من الفحص الدوري
+تُبنى قائمة أحداث اليوم مرة واحدة (إشعار مسبق وأذان لكل صلاة) ويُضبط مؤقت واحد على موعد الحدث التالي بالضبط،
+فلا يستيقظ البرنامج بين الأحداث، والحدث المتأخر (انشغال الواجهة أو تأخر المؤقت) يُنفذ فور الاستيقاظ بدلاً من تفويته
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from clock import Clock
+from timer_service import TimerService
+
+logger = logging.getLogger(__name__)
+
+class PrayerEvent:
+    """حدث واحد في جدول اليوم"""
+    __slots__ = ('kind', 'prayer_key', 'display_name', 'when')
+
+    PRE_NOTIFICATION = 'pre'
+    ADHAN = 'adhan'
+
+    def __init__(self, kind: str, prayer_key: str, display_name: str, when: datetime):
+        self.kind = kind
+        self.prayer_key = prayer_key
+        self.display_name = display_name
+        self.when = when
+
+    def __repr__(self):
+        return f"PrayerEvent({self.kind}, {self.prayer_key}, {self.when:%Y-%m-%d %H:%M})"
+
+class PrayerScheduler:
+    """مؤقت واحد مضبوط دائمًا على أقرب حدث قادم"""
+
+    # الحدث الذي فات موعده بأكثر من هذه المدة (سبات الجهاز مثلاً) يُتجاهل بدلاً من تشغيل أذان قديم
+    LATE_TOLERANCE = timedelta(minutes=10)
+    # أقصى مدة يُضبط عليها المؤقت؛ بعدها يُعاد حساب الموعد من الساعة (تحسبًا لتصحيح الوقت أو سبات الجهاز)
+    MAX_ARM_SECONDS = 6 * 3600
+
+    def __init__(self, timers: TimerService, clock: Clock, on_event: Callable[[PrayerEvent], None],
+                 on_day_change: Optional[Callable[[], None]] = None):
+        """
+        :param timers: خدمة المؤقتات المشتركة للواجهة
+        :param on_event: تُستدعى في خيط Tk عند حلول كل حدث
+        :param on_day_change: تُستدعى مرة واحدة بعد كل منتصف ليل للانتقال إلى مواقيت اليوم الجديد
+        """
+        self.timers = timers
+        self.clock = clock
+        self.on_event = on_event
+        self.on_day_change = on_day_change
+        self._events: List[PrayerEvent] = []
+        self._timer = None
+        self._day_end: Optional[datetime] = None
+
+    @staticmethod
+    def build_events(prayers: list, notify_before_minutes: int) -> List[PrayerEvent]:
+        """
+        أحداث يوم واحد مرتبة زمنيًا
+        :param prayers: [(مفتاح الصلاة، الاسم المعروض، لحظة الأذان)] من PrayerTimeline
+        """
+        events = []
+        for prayer_key, display_name, adhan_time in prayers:
+            if notify_before_minutes > 0:
+                events.append(PrayerEvent(PrayerEvent.PRE_NOTIFICATION, prayer_key, display_name,
+                                          adhan_time - timedelta(minutes=notify_before_minutes)))
+            events.append(PrayerEvent(PrayerEvent.ADHAN, prayer_key, display_name, adhan_time))
+        events.sort(key=lambda event: event.when)
+        return events
+
+    def schedule(self, events: List[PrayerEvent]):
+        """استبدال الجدول الحالي وضبط المؤقت على أول حدث لم يفت موعده"""
+        now = self.clock.now()
+        self._events = [event for event in sorted(events, key=lambda event: event.when) if event.when > now]
+        # تغير اليوم مستقل عن الأحداث: قد يحتوي الجدول على أحداث بعد منتصف الليل من مواقيت اليوم التالي
+        self._day_end = self._midnight_after(now)
+        logger.info(f"تمت جدولة {len(self._events)} حدث، التالي: {self._events[0] if self._events else None}")
+        self._arm()
+
+    def next_event(self) -> Optional[PrayerEvent]:
+        return self._events[0] if self._events else None
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    @staticmethod
+    def _midnight_after(now: datetime) -> datetime:
+        return datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+
+    def _next_deadline(self) -> datetime:
+        if self.on_day_change is None or self._day_end is None:
+            return self._events[0].when
+        # الاستيقاظ بعد منتصف الليل مباشرة للانتقال إلى اليوم الجديد حتى لو بقيت أحداث بعده
+        day_change = self._day_end + timedelta(seconds=1)
+        return min(self._events[0].when, day_change) if self._events else day_change
+
+    def _arm(self):
+        self.cancel()
+        if not self._events and (self.on_day_change is None or self._day_end is None):
+            return
+        delay = (self._next_deadline() - self.clock.now()).total_seconds()
+        delay = min(max(delay, 0.0), self.MAX_ARM_SECONDS)
+        # بدون هامش سماح: الأذان لا يُقدَّم ليُدمج مع مؤقتات أخرى
+        self._timer = self.timers.call_later(delay, self._on_timer, leeway=0.0, name='prayer_event')
+
+    def _on_timer(self):
+        self._timer = None
+        self.run_due()
+
+    def run_due(self) -> int:
+        """
+        تنفيذ جميع الأحداث التي حل موعدها ثم ضبط المؤقت على الحدث التالي
+        (يمكن استدعاؤها مباشرة مع VirtualClock لمحاكاة يوم كامل)
+        :return: عدد الأحداث المنفذة
+        """
+        now = self.clock.now()
+        fired = 0
+        while self._events and self._events[0].when <= now:
+            event = self._events.pop(0)
+            if now - event.when > self.LATE_TOLERANCE:
+                logger.warning(f"تجاهل حدث فات موعده بمدة طويلة: {event}")
+                continue
+            try:
+                self.on_event(event)
+            except Exception as e:
+                logger.error(f"خطأ في تنفيذ حدث {event}: {e}")
+            fired += 1
+        if self.on_day_change is not None and self._day_end is not None and now >= self._day_end:
+            # بعد منتصف الليل: ينتقل المستدعي إلى اليوم الجديد (ويستدعي schedule مرة أخرى عادةً)؛
+            # الأحداث المتبقية تبقى مجدولة إن لم يفعل
+            self._day_end = self._midnight_after(now)
+            self.cancel()
+            try:
+                self.on_day_change()
+            except Exception as e:
+                logger.error(f"خطأ في الانتقال إلى اليوم الجديد: {e}")
+            if self._timer is None:
+                self._arm()
+            return fired
+        self._arm()
+        return fired
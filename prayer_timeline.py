@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+prayer_timeline.py
+الجدول الزمني لمواقيت يوم واحد كلحظات مطلقة، يُبنى مرة واحدة عند تحميل البيانات
+ويجيب عن الصلاة الحالية والقادمة والوقت المتبقي وحالة كل صف بالبحث الثنائي (bisect)
+بدلاً من تحليل نصوص الأوقات في كل تحديث للواجهة
+"""
+
+import logging
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class PrayerTimeline:
+    """
+    مواقيت يوم واحد (غير قابلة للتعديل بعد الإنشاء)
+    keys و times بترتيب الجدول كما في الواجهة، والبحث يتم على نسخة مرتبة زمنيًا؛
+    فالعشاء بعد منتصف الليل أو وقت فشل تحليله لا يُزيح صفوف الجدول
+    """
+    __slots__ = ('day', 'keys', 'times', '_order', '_sorted', '_rank')
+
+    # مفاتيح الصلوات بترتيب اليوم
+    PRAYER_KEYS = ('fajr', 'sunrise', 'dhuhr', 'asr', 'maghrib', 'isha')
+
+    # حالات صفوف الجدول
+    FINISHED = 'finished'
+    CURRENT = 'now'
+    WITHIN_HOUR = 'within_hour'
+    UPCOMING = 'upcoming'
+
+    def __init__(self, day: date, entries: List[Tuple[str, datetime]]):
+        self.day = day
+        self.keys = tuple(key for key, _ in entries)
+        self.times = tuple(when for _, when in entries)
+        # فهارس الجدول مرتبة زمنيًا، والأوقات المرتبة للبحث الثنائي، وترتيب كل صف زمنيًا
+        self._order = tuple(sorted(range(len(self.times)), key=self.times.__getitem__))
+        self._sorted = tuple(self.times[i] for i in self._order)
+        rank = [0] * len(self._order)
+        for position, i in enumerate(self._order):
+            rank[i] = position
+        self._rank = tuple(rank)
+
+    def __len__(self):
+        return len(self.times)
+
+    def _position_at(self, now: datetime) -> int:
+        """الترتيب الزمني لآخر صلاة دخل وقتها (‎-1 قبل أول صلاة)"""
+        return bisect_right(self._sorted, now) - 1
+
+    def index_at(self, now: datetime) -> int:
+        """فهرس (بترتيب الجدول) آخر صلاة دخل وقتها (‎-1 قبل أول صلاة)"""
+        position = self._position_at(now)
+        return self._order[position] if position >= 0 else -1
+
+    def current(self, now: datetime) -> Optional[str]:
+        """الصلاة الحالية؛ آخر صلاة في اليوم تُعتبر منتهية كما في جدول الواجهة"""
+        position = self._position_at(now)
+        return self.keys[self._order[position]] if 0 <= position < len(self.times) - 1 else None
+
+    def next_index(self, now: datetime) -> int:
+        """فهرس (بترتيب الجدول) الصلاة القادمة؛ بعد آخر صلاة: أول صلاة في اليوم التالي"""
+        position = self._position_at(now) + 1
+        return self._order[position if position < len(self.times) else 0]
+
+    def first(self) -> Tuple[str, datetime]:
+        """أول صلاة في اليوم زمنيًا"""
+        index = self._order[0]
+        return self.keys[index], self.times[index]
+
+    def upcoming(self, now: datetime) -> Optional[Tuple[str, datetime]]:
+        """الصلاة القادمة في اليوم نفسه ولحظتها (None بعد آخر صلاة)"""
+        position = self._position_at(now) + 1
+        if position < len(self.times):
+            index = self._order[position]
+            return self.keys[index], self.times[index]
+        return None
+
+    def next(self, now: datetime) -> Tuple[str, datetime]:
+        """الصلاة القادمة ولحظتها؛ بعد آخر صلاة تُقدّر صلاة الغد الأولى بلحظتها اليوم + 24 ساعة"""
+        upcoming = self.upcoming(now)
+        if upcoming is not None:
+            return upcoming
+        key, when = self.first()
+        return key, when + timedelta(days=1)
+
+    def seconds_until_next(self, now: datetime) -> int:
+        """الثواني الكاملة المتبقية حتى الصلاة القادمة"""
+        return int((self.next(now)[1] - now.replace(microsecond=0)).total_seconds())
+
+    def statuses(self, now: datetime) -> List[Tuple[str, int]]:
+        """
+        حالة كل صف بترتيب الجدول: (الحالة، الدقائق المتبقية للصلوات القادمة)
+        الحدود تُحسب بالبحث الثنائي مرة واحدة، ثم تُحدد حالة كل صف من ترتيبه الزمني
+        """
+        position = self._position_at(now)
+        last = len(self.times) - 1
+        current_minute = now.replace(second=0, microsecond=0)
+        result = []
+        for rank, when in zip(self._rank, self.times):
+            if rank <= position:
+                status = self.CURRENT if rank == position and rank < last else self.FINISHED
+                result.append((status, 0))
+                continue
+            minutes_left = int((when - current_minute).total_seconds() // 60)
+            result.append((self.WITHIN_HOUR if minutes_left <= 60 else self.UPCOMING, minutes_left))
+        return result
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+prayer_window.py
+نافذة متحركة لمواقيت مدينة: اليوم والأيام القليلة التالية كسجلات PrayerDay جاهزة في الذاكرة
+عند منتصف الليل تنتقل النافذة إلى اليوم التالي بدون أي طلب شبكة، ويستمر العد التنازلي
+والإشعارات عبر منتصف الليل بالمواقيت الحقيقية لليوم التالي بدلاً من تقدير فجر اليوم + 24 ساعة
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from prayer_day import PrayerDay
+
+logger = logging.getLogger(__name__)
+
+class PrayerWindow:
+    """سجلات PrayerDay لمدينة ومعاملات حساب محددة مفهرسة بالتاريخ"""
+
+    def __init__(self, city: str, country: str, calc_key: tuple):
+        self.city = city
+        self.country = country
+        self.calc_key = calc_key
+        self._days: Dict[date, PrayerDay] = {}
+
+    def __len__(self):
+        return len(self._days)
+
+    def __contains__(self, day: date) -> bool:
+        return day in self._days
+
+    def matches(self, city: str, country: str, calc_key: tuple) -> bool:
+        return (self.city, self.country, self.calc_key) == (city, country, calc_key)
+
+    def put(self, record: PrayerDay):
+        self._days[record.day] = record
+
+    def get(self, day: date) -> Optional[PrayerDay]:
+        return self._days.get(day)
+
+    def advance(self, today: date) -> Optional[PrayerDay]:
+        """
+        حذف الأيام الماضية وإرجاع سجل اليوم الجديد إن وُجد
+        يُبقى سجل الأمس لأن عشاءه قد يقع بعد منتصف الليل
+        """
+        yesterday = today - timedelta(days=1)
+        for day in [day for day in self._days if day < yesterday]:
+            del self._days[day]
+        return self._days.get(today)
+
+    def days_ahead(self, today: date) -> int:
+        """عدد الأيام المتتالية المتوفرة بدءًا من اليوم"""
+        count = 0
+        while today + timedelta(days=count) in self._days:
+            count += 1
+        return count
+
+    def prayers(self, start: date, days: int) -> List[Tuple[str, datetime]]:
+        """مواقيت الأيام المتوفرة من start لعدد days أيام كقائمة (مفتاح الصلاة، اللحظة) مرتبة زمنيًا"""
+        result = []
+        for offset in range(days):
+            record = self._days.get(start + timedelta(days=offset))
+            if record is not None:
+                timeline = record.timeline
+                result.extend(zip(timeline.keys, timeline.times))
+        result.sort(key=lambda entry: entry[1])
+        return result
+
+    def next_prayer(self, now: datetime) -> Optional[Tuple[str, datetime]]:
+        """
+        الصلاة القادمة ولحظتها؛ بعد آخر صلاة في اليوم تُستخدم أول صلاة من سجل اليوم التالي
+        وإذا لم يتوفر سجل اليوم التالي يُستخدم تقدير PrayerTimeline (فجر اليوم + 24 ساعة)
+        """
+        record = self._days.get(now.date())
+        if record is None:
+            return None
+        # عشاء الأمس بعد منتصف الليل يسبق أول صلاة اليوم
+        yesterday = self._days.get(now.date() - timedelta(days=1))
+        if yesterday is not None:
+            upcoming = yesterday.timeline.upcoming(now)
+            if upcoming is not None:
+                return upcoming
+        timeline = record.timeline
+        upcoming = timeline.upcoming(now)
+        if upcoming is not None:
+            return upcoming
+        tomorrow = self._days.get(now.date() + timedelta(days=1))
+        if tomorrow is not None:
+            return tomorrow.timeline.first()
+        return timeline.next(now)
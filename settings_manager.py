@@ -18,6 +18,8 @@ class Settings:
         self.notifications_enabled = True
         self.sound_enabled = True
         self.calculation_method = 5
+        self.asr_school = 0  # مذهب حساب العصر: 0 للشافعي (الجمهور)، 1 للحنفي
+        self.prayer_adjustments = {}  # تعديلات يدوية بالدقائق لكل صلاة، مثل {"fajr": 2}
         self.theme = "light"
         self.language = "ar"
         self.notification_before_minutes = 5
@@ -42,8 +44,24 @@ class Settings:
         self.notification_maghrib_enabled = True
         self.notification_isha_enabled = True
         self.run_at_startup = False  # تشغيل البرنامج مع بدء التشغيل
+        self.prefetch_mode = "month"  # جلب المواقيت مسبقًا لشهر ("month") أو لسنة كاملة ("year")
         self.load_settings()
     
+    # ترتيب الأوقات في معامل tune الخاص بـ Aladhan API
+    TUNE_ORDER = ('imsak', 'fajr', 'sunrise', 'dhuhr', 'asr', 'maghrib', 'sunset', 'isha', 'midnight')
+
+    def get_tune_string(self) -> str:
+        """تعديلات الدقائق بصيغة معامل tune في Aladhan API"""
+        return ','.join(str(int(self.prayer_adjustments.get(name, 0))) for name in self.TUNE_ORDER)
+
+    def calculation_key(self) -> tuple:
+        """مفتاح معاملات الحساب الكاملة (الطريقة، المذهب، التعديلات) للتخزين المؤقت"""
+        return (self.calculation_method, self.asr_school, self.get_tune_string())
+
+    def calculation_api_params(self) -> dict:
+        """معاملات الحساب كما ترسل إلى Aladhan API"""
+        return {'method': self.calculation_method, 'school': self.asr_school, 'tune': self.get_tune_string()}
+
     def load_settings(self):
         """تحميل الإعدادات من ملف"""
         try:
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_clock.py
+اختبارات مصدر الوقت: قفزات ساعة النظام في نموذج TimeSync، والساعة الافتراضية تقود
+المؤقتات وجدول الأحداث والتخزين المؤقت عبر منتصف الليل
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import data_manager
+import prayer_logic
+from clock import SystemClock, VirtualClock
+from data_manager import CacheManager
+from prayer_day import PrayerDay
+from prayer_logic import TimeSync
+from prayer_scheduler import PrayerEvent, PrayerScheduler
+from timer_service import TimerService
+
+
+class FakeRoot:
+    """بديل Tk لـ TimerService: يسجل مؤقتات after بدون تشغيلها، والاختبار يستدعي run_due بنفسه"""
+
+    def __init__(self):
+        self.pending = {}
+        self._ids = 0
+
+    def after(self, delay_ms, callback):
+        self._ids += 1
+        self.pending[self._ids] = (delay_ms, callback)
+        return self._ids
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+
+class FakeTime:
+    """ساعة النظام والساعة الرتيبة كقيم يتحكم بها الاختبار"""
+
+    def __init__(self, wall: float, mono: float):
+        self.wall = wall
+        self.mono = mono
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime(wall=1_780_000_000.0, mono=5_000.0)
+    monkeypatch.setattr(prayer_logic.time, 'time', fake.time)
+    monkeypatch.setattr(prayer_logic.time, 'monotonic', fake.monotonic)
+    monkeypatch.setattr(prayer_logic, 'NTPLIB_AVAILABLE', True)
+    # نموذج متزامن: الساعة المحلية متأخرة نصف ثانية، والمزامنة التالية بعد ساعة
+    state = {name: getattr(TimeSync, name) for name in
+             ('_anchor_true', '_anchor_mono', '_anchor_wall', '_drift', '_next_sync_mono', '_step_pending')}
+    TimeSync._anchor_true = fake.wall + 0.5
+    TimeSync._anchor_mono = fake.mono
+    TimeSync._anchor_wall = fake.wall
+    TimeSync._drift = 0.0
+    TimeSync._next_sync_mono = fake.mono + 3600
+    TimeSync._step_pending = False
+    yield fake
+    for name, value in state.items():
+        setattr(TimeSync, name, value)
+
+
+def test_suspend_step_makes_sync_due_and_moves_now(fake_time):
+    fake_time.wall += 10
+    fake_time.mono += 10
+    assert not TimeSync.sync_due()
+    assert TimeSync.now().timestamp() == pytest.approx(fake_time.wall + 0.5)
+
+    # سكون لمدة ساعتين: ساعة النظام تتقدم والساعة الرتيبة لا تتقدم
+    fake_time.wall += 2 * 3600
+    assert TimeSync.sync_due()
+    assert TimeSync.now().timestamp() == pytest.approx(fake_time.wall + 0.5)
+
+
+def test_failed_resync_after_step_keeps_wall_clock_and_offset(fake_time, monkeypatch):
+    monkeypatch.setattr(TimeSync, '_probe_servers', classmethod(lambda cls: []))
+    fake_time.wall += 2 * 3600
+    assert TimeSync.sync_due()
+    synced = TimeSync.sync_time()
+    assert synced.timestamp() == pytest.approx(fake_time.wall + 0.5)
+    # بعد الفشل لا تُعاد المحاولة قبل الحد الأدنى، والنموذج يبقى مربوطًا بساعة النظام
+    assert not TimeSync.sync_due()
+    fake_time.wall += 60
+    fake_time.mono += 60
+    assert TimeSync.now().timestamp() == pytest.approx(fake_time.wall + 0.5)
+
+
+def test_system_clock_starts_background_sync_on_step(fake_time, monkeypatch):
+    started = []
+    system_clock = SystemClock()
+    monkeypatch.setattr(system_clock, '_start_background_sync', lambda: started.append(True))
+    system_clock.now()
+    assert not started
+    fake_time.wall -= 3600
+    assert system_clock.now().timestamp() == pytest.approx(fake_time.wall + 0.5)
+    assert started == [True]
+
+
+def test_virtual_clock_step_leaves_monotonic_alone():
+    virtual = VirtualClock(datetime(2026, 3, 1, 12, 0))
+    virtual.advance(30)
+    virtual.step(timedelta(hours=-1))
+    assert virtual.now() == datetime(2026, 3, 1, 11, 0, 30)
+    assert virtual.monotonic() == 30
+    with pytest.raises(ValueError):
+        virtual.advance(-1)
+
+
+def _scheduler(virtual, fired, day_changes):
+    timers = TimerService(FakeRoot(), virtual)
+    scheduler = PrayerScheduler(timers, virtual, fired.append, on_day_change=lambda: day_changes.append(virtual.today()))
+    return timers, scheduler
+
+
+def _run_until(virtual, timers, moment):
+    """تقديم الساعة من موعد مؤقت إلى التالي حتى اللحظة المطلوبة كما تفعل حلقة Tk"""
+    while True:
+        deadline = timers.next_deadline()
+        if deadline is None or virtual.now() + timedelta(seconds=deadline - virtual.monotonic()) > moment:
+            break
+        virtual.advance(max(0.0, deadline - virtual.monotonic()))
+        timers.run_due()
+    virtual.set(moment)
+    timers.run_due()
+
+
+def test_scheduler_fires_across_day_rollover():
+    virtual = VirtualClock(datetime(2026, 3, 1, 19, 0))
+    fired, day_changes = [], []
+    timers, scheduler = _scheduler(virtual, fired, day_changes)
+    prayers = [('isha', 'Isha', datetime(2026, 3, 1, 19, 30)), ('fajr', 'Fajr', datetime(2026, 3, 2, 4, 50))]
+    scheduler.schedule(PrayerScheduler.build_events(prayers, 10))
+
+    _run_until(virtual, timers, datetime(2026, 3, 2, 5, 0))
+    assert [(event.kind, event.prayer_key) for event in fired] == [
+        (PrayerEvent.PRE_NOTIFICATION, 'isha'), (PrayerEvent.ADHAN, 'isha'),
+        (PrayerEvent.PRE_NOTIFICATION, 'fajr'), (PrayerEvent.ADHAN, 'fajr'),
+    ]
+    assert day_changes == [date(2026, 3, 2)]
+
+
+def test_scheduler_skips_events_missed_during_step():
+    virtual = VirtualClock(datetime(2026, 3, 1, 12, 0))
+    fired, day_changes = [], []
+    timers, scheduler = _scheduler(virtual, fired, day_changes)
+    prayers = [('asr', 'Asr', datetime(2026, 3, 1, 12, 30)), ('maghrib', 'Maghrib', datetime(2026, 3, 1, 18, 0))]
+    scheduler.schedule(PrayerScheduler.build_events(prayers, 0))
+
+    # سكون من 12:00 إلى 17:00: أذان العصر فات بأكثر من مهلة السماح فلا يُشغّل متأخرًا
+    virtual.step(timedelta(hours=5))
+    scheduler.run_due()
+    assert fired == []
+    assert scheduler.next_event().prayer_key == 'maghrib'
+    _run_until(virtual, timers, datetime(2026, 3, 1, 18, 0, 1))
+    assert [event.prayer_key for event in fired] == ['maghrib']
+
+
+def test_cache_days_follow_the_app_clock(tmp_path, monkeypatch):
+    # لا يُلمس التخزين المؤقت الحقيقي للمستخدم
+    monkeypatch.setattr(data_manager, 'CACHE_DIR', tmp_path)
+    monkeypatch.setattr(data_manager, 'COUNTRIES_CACHE_FILE', tmp_path / 'countries.json')
+    monkeypatch.setattr(data_manager.http_client.ResponseCache, 'prune', classmethod(lambda cls: 0))
+    monkeypatch.setattr(data_manager.CoordinatesIndex, 'last_modified', classmethod(lambda cls: None))
+    virtual = VirtualClock(datetime(2030, 1, 30, 23, 59))
+    cache = CacheManager(virtual)
+    calc_key = (3, 0, '')
+    timings = {'Fajr': '05:00', 'Sunrise': '06:30', 'Dhuhr': '12:00', 'Asr': '15:00', 'Maghrib': '17:30', 'Isha': '19:00'}
+    for offset in range(-2, 3):
+        day = date(2030, 1, 30) + timedelta(days=offset)
+        cache.save_data('Oslo', 'Norway', {'timings': timings}, calc_key, day)
+    assert cache.cached_days_ahead('Oslo', 'Norway', calc_key, 5) == 3
+
+    virtual.advance(60)
+    assert cache.cached_days_ahead('Oslo', 'Norway', calc_key, 5) == 2
+    cache.cleanup_old_cache()
+    # يُحذف ما قبل الأمس حسب الساعة الافتراضية لا حسب التاريخ الحقيقي
+    assert cache.load_days('Oslo', 'Norway', calc_key, date(2030, 1, 1), date(2030, 2, 28)) == {
+        '2030-01-30', '2030-01-31', '2030-02-01'}
+
+    record = PrayerDay.from_api({'timings': timings}, fallback_day=virtual.today())
+    assert record.day == date(2030, 1, 31)
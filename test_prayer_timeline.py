@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_prayer_timeline.py
+اختبارات الجدول الزمني ليوم واحد ونافذة المواقيت، خاصة العشاء بعد منتصف الليل في العروض العليا
+"""
+
+from datetime import date, datetime, timedelta
+
+from prayer_day import PrayerDay
+from prayer_timeline import PrayerTimeline
+from prayer_window import PrayerWindow
+
+DAY = date(2026, 6, 21)
+
+
+def _seconds(*times):
+    return [hours * 3600 + minutes * 60 for hours, minutes in times]
+
+
+def _late_isha_day(day=DAY):
+    # فجر 02:10، شروق 03:40، ظهر 13:20، عصر 17:50، مغرب 22:55، عشاء 00:30 (بعد منتصف الليل)
+    return PrayerDay(day, _seconds((2, 10), (3, 40), (13, 20), (17, 50), (22, 55), (0, 30)))
+
+
+def test_isha_after_midnight_moves_to_next_day():
+    record = _late_isha_day()
+    assert record.moment('isha') == datetime(2026, 6, 22, 0, 30)
+    assert record.moment('maghrib') == datetime(2026, 6, 21, 22, 55)
+    assert record.timeline.keys == PrayerTimeline.PRAYER_KEYS
+
+
+def test_statuses_follow_table_order_with_late_isha():
+    timeline = _late_isha_day().timeline
+    now = datetime(2026, 6, 21, 14, 0)
+    statuses = [status for status, _ in timeline.statuses(now)]
+    assert statuses == [PrayerTimeline.FINISHED, PrayerTimeline.FINISHED, PrayerTimeline.CURRENT,
+                        PrayerTimeline.UPCOMING, PrayerTimeline.UPCOMING, PrayerTimeline.UPCOMING]
+    assert timeline.next_index(now) == PrayerTimeline.PRAYER_KEYS.index('asr')
+    assert timeline.current(now) == 'dhuhr'
+
+
+def test_late_isha_is_next_after_maghrib():
+    timeline = _late_isha_day().timeline
+    now = datetime(2026, 6, 21, 23, 30)
+    assert timeline.next(now) == ('isha', datetime(2026, 6, 22, 0, 30))
+    assert timeline.next_index(now) == PrayerTimeline.PRAYER_KEYS.index('isha')
+    assert timeline.seconds_until_next(now) == 3600
+
+
+def test_window_keeps_yesterdays_late_isha_after_midnight():
+    window = PrayerWindow('Tromsø', 'Norway', (3, 0, ''))
+    for offset in range(3):
+        window.put(_late_isha_day(DAY + timedelta(days=offset)))
+    tomorrow = DAY + timedelta(days=1)
+    assert window.advance(tomorrow) is not None
+    # بعد منتصف الليل ما زال عشاء الأمس قادمًا قبل فجر اليوم الجديد
+    assert window.next_prayer(datetime(2026, 6, 22, 0, 10)) == ('isha', datetime(2026, 6, 22, 0, 30))
+    assert window.next_prayer(datetime(2026, 6, 22, 0, 40)) == ('fajr', datetime(2026, 6, 22, 2, 10))
+    entries = window.prayers(DAY, 3)
+    assert ('isha', datetime(2026, 6, 22, 0, 30)) in entries
+    assert [when for _, when in entries] == sorted(when for _, when in entries)
+
+
+def test_normal_day_is_unchanged():
+    record = PrayerDay(DAY, _seconds((4, 0), (5, 30), (12, 0), (15, 30), (18, 0), (19, 30)))
+    assert record.timeline.times == tuple(
+        datetime.combine(DAY, datetime.min.time()) + timedelta(seconds=s) for s in record.seconds
+    )
+    assert record.timeline.next(datetime(2026, 6, 21, 20, 0)) == ('fajr', datetime(2026, 6, 22, 4, 0))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+timer_service.py
+خدمة مؤقتات موحدة لجميع الحلقات الدورية في الواجهة (العد التنازلي، تحديث الحالة، فحص الاتصال، جدول الأذان)
+المواعيد محفوظة في كومة (heap) حسب الساعة الرتيبة، ومؤقت Tk واحد فقط مضبوط على أقرب موعد؛
+المواعيد المتقاربة تُنفذ في استيقاظ واحد حسب هامش السماح لكل مؤقت
+"""
+
+import heapq
+import itertools
+import logging
+import math
+from typing import Callable, List, Optional
+
+from clock import Clock
+
+logger = logging.getLogger(__name__)
+
+class TimerHandle:
+    """مؤقت مسجل؛ cancel() يلغيه (ويوقف تكراره)"""
+    __slots__ = ('deadline', 'leeway', 'callback', 'args', 'name', 'cancelled')
+
+    def __init__(self, deadline: float, leeway: float, callback: Callable, args: tuple, name: str):
+        self.deadline = deadline
+        self.leeway = leeway
+        self.callback = callback
+        self.args = args
+        self.name = name
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __repr__(self):
+        return f"TimerHandle({self.name}, deadline={self.deadline:.3f})"
+
+class TimerService:
+    """
+    جدولة الاستدعاءات في خيط Tk بمؤقت واحد
+    يجب استدعاء call_later من خيط Tk فقط (الخيوط الأخرى تستخدم AsyncFetcher.dispatch)
+    """
+
+    # أقصى هامش سماح: يمكن تقديم المؤقت حتى هذه المدة ليُنفذ مع مؤقت آخر قريب منه (بالثواني)
+    MAX_LEEWAY = 1.0
+    # نسبة هامش السماح الافتراضي من مدة التأخير
+    LEEWAY_RATIO = 0.1
+
+    def __init__(self, root, clock: Clock):
+        self.root = root
+        self.clock = clock
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._after_id = None
+        self._armed_deadline: Optional[float] = None
+        self.wakeups = 0
+        self.callbacks_run = 0
+
+    def call_later(self, delay: float, callback: Callable, *args, leeway: Optional[float] = None,
+                   name: Optional[str] = None) -> TimerHandle:
+        """
+        تنفيذ callback بعد delay ثانية
+        إذا أعادت callback رقمًا يُعاد جدولتها تلقائيًا بعد هذا العدد من الثواني (None يوقف التكرار)
+        :param leeway: المدة المسموح بتقديم التنفيذ فيها لدمجه مع استيقاظ مؤقت آخر
+        """
+        delay = max(0.0, delay)
+        if leeway is None:
+            leeway = min(delay * self.LEEWAY_RATIO, self.MAX_LEEWAY)
+        handle = TimerHandle(self.clock.monotonic() + delay, leeway, callback, args,
+                             name or getattr(callback, '__name__', 'timer'))
+        self._push(handle)
+        return handle
+
+    def _push(self, handle: TimerHandle):
+        heapq.heappush(self._heap, (handle.deadline, next(self._counter), handle))
+        self._arm()
+
+    def reschedule(self, handle: TimerHandle, delay: float):
+        """تغيير موعد مؤقت قائم (مثلاً تنفيذه فورًا) مع الاحتفاظ بالمقبض نفسه"""
+        if handle.cancelled:
+            return
+        delay = max(0.0, delay)
+        handle.deadline = self.clock.monotonic() + delay
+        handle.leeway = min(delay * self.LEEWAY_RATIO, self.MAX_LEEWAY)
+        # المدخل القديم في الكومة يُتجاهل لأن موعده لم يعد يطابق موعد المقبض
+        self._push(handle)
+
+    @staticmethod
+    def _stale(entry: tuple) -> bool:
+        deadline, _, handle = entry
+        return handle.cancelled or deadline != handle.deadline
+
+    def _arm(self):
+        """ضبط مؤقت Tk على أقرب موعد إذا لم يكن مضبوطًا على موعد أقرب منه"""
+        while self._heap and self._stale(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return
+        # الاستيقاظ عند موعد أقرب مؤقت؛ وعندها تُنفذ معه المؤقتات التي بدأ هامش سماحها
+        deadline = self._heap[0][0]
+        if self._armed_deadline is not None and self._armed_deadline <= deadline:
+            return
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+        self._armed_deadline = max(deadline, self.clock.monotonic())
+        # التقريب للأعلى حتى لا يستيقظ المؤقت قبل الموعد بجزء من المللي ثانية فيُعاد ضبطه بلا فائدة
+        delay_ms = math.ceil((self._armed_deadline - self.clock.monotonic()) * 1000)
+        self._after_id = self.root.after(max(0, delay_ms), self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._after_id = None
+        self._armed_deadline = None
+        self.run_due()
+
+    def run_due(self) -> int:
+        """
+        تنفيذ جميع المؤقتات التي حل موعدها أو تقع ضمن هامش سماحها ثم ضبط المؤقت التالي
+        (يمكن استدعاؤها مباشرة مع VirtualClock للمحاكاة)
+        :return: عدد الاستدعاءات المنفذة
+        """
+        self.wakeups += 1
+        now = self.clock.monotonic()
+        due = []
+        while self._heap:
+            deadline, _, handle = self._heap[0]
+            if self._stale(self._heap[0]):
+                heapq.heappop(self._heap)
+                continue
+            if deadline - handle.leeway > now:
+                break
+            heapq.heappop(self._heap)
+            due.append(handle)
+
+        for handle in due:
+            if handle.cancelled:
+                continue
+            try:
+                result = handle.callback(*handle.args)
+            except Exception as e:
+                logger.error(f"خطأ في المؤقت {handle.name}: {e}", exc_info=True)
+                result = None
+            self.callbacks_run += 1
+            if result is not None and not handle.cancelled:
+                # مؤقت متكرر: نفس المقبض يُعاد جدولته فيبقى cancel() فعالاً
+                delay = max(0.0, float(result))
+                handle.deadline = self.clock.monotonic() + delay
+                handle.leeway = min(delay * self.LEEWAY_RATIO, self.MAX_LEEWAY)
+                heapq.heappush(self._heap, (handle.deadline, next(self._counter), handle))
+
+        self._arm()
+        return len(due)
+
+    def next_deadline(self) -> Optional[float]:
+        """أقرب موعد (بالساعة الرتيبة) لمؤقت غير ملغى"""
+        for entry in sorted(self._heap):
+            if not self._stale(entry):
+                return entry[0]
+        return None
+
+    def shutdown(self):
+        """إلغاء جميع المؤقتات"""
+        for _, _, handle in self._heap:
+            handle.cancel()
+        self._heap.clear()
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+            self._armed_deadline = None
@@ -392,6 +392,26 @@ class SettingsDialog:
                                  values=methods,
                                  state='readonly')
         calc_combo.pack(fill='x', padx=10, pady=10)
+
+        # مذهب حساب العصر
+        school_frame = ttk.LabelFrame(parent, text=self._("asr_calculation_school"))
+        school_frame.pack(fill='x', padx=10, pady=10)
+        self.asr_school_var = tk.IntVar(value=self.settings.asr_school)
+        ttk.Radiobutton(school_frame, text=self._("asr_school_standard"), variable=self.asr_school_var,
+                       value=0).pack(anchor='w', padx=10, pady=5)
+        ttk.Radiobutton(school_frame, text=self._("asr_school_hanafi"), variable=self.asr_school_var,
+                       value=1).pack(anchor='w', padx=10, pady=5)
+
+        # تعديلات يدوية بالدقائق لكل صلاة (من -30 إلى 30)
+        adjust_frame = ttk.LabelFrame(parent, text=self._("prayer_time_adjustments"))
+        adjust_frame.pack(fill='x', padx=10, pady=10)
+        self.adjustment_vars = {}
+        for column, prayer in enumerate(('fajr', 'sunrise', 'dhuhr', 'asr', 'maghrib', 'isha')):
+            adjust_frame.grid_columnconfigure(column, weight=1)
+            ttk.Label(adjust_frame, text=self._(prayer)).grid(row=0, column=column, padx=5, pady=(5, 0))
+            self.adjustment_vars[prayer] = tk.IntVar(value=int(self.settings.prayer_adjustments.get(prayer, 0)))
+            ttk.Spinbox(adjust_frame, from_=-30, to=30, width=5,
+                        textvariable=self.adjustment_vars[prayer]).grid(row=1, column=column, padx=5, pady=(0, 10))
         
         # فترة التحديث التلقائي
         update_frame = ttk.LabelFrame(parent, text=self._("auto_update_interval"))
@@ -538,8 +558,8 @@ class SettingsDialog:
         self.qibla_widget.pack(fill='both', expand=True)
 
         if self.parent.current_city and self.parent.prayer_data and self.parent.current_city in self.parent.prayer_data:
-            lat = self.parent.prayer_data[self.parent.current_city]['latitude']
-            lon = self.parent.prayer_data[self.parent.current_city]['longitude']
+            lat = self.parent.prayer_data[self.parent.current_city].latitude
+            lon = self.parent.prayer_data[self.parent.current_city].longitude
             self.qibla_widget.update_qibla(lat, lon, city_name, country_name)
 
         
@@ -1174,6 +1194,16 @@ class SettingsDialog:
             self.settings.calculation_method = CALCULATION_METHODS.get(method_key, self.settings.calculation_method)
         else:
             self.settings.calculation_method = CALCULATION_METHODS_EN.get(method_key, self.settings.calculation_method)
+        self.settings.asr_school = self.asr_school_var.get()
+        adjustments = {}
+        for prayer, var in self.adjustment_vars.items():
+            try:
+                minutes = int(var.get())
+            except (tk.TclError, ValueError):
+                minutes = 0
+            if minutes:
+                adjustments[prayer] = max(-30, min(30, minutes))
+        self.settings.prayer_adjustments = adjustments
 
         self.settings.language = self.lang_var.get()
         self.settings.notifications_enabled = self.notifications_var.get()